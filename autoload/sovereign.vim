@@ -78,22 +78,20 @@ function! s:create_scratch(split_cmd, bufname)
     endif
 endf
 
+function! sovereign#poll_jobs(timer) abort
+    call s:pyeval('sovereignapi.poll_jobs()')
+endf
+
 function! sovereign#branch_name() abort
-    " Only update branch every 5 seconds
-    if !exists('s:sovereign_branch_lastupdate')
-        let s:sovereign_branch_lastupdate = localtime()
-    elseif localtime() - s:sovereign_branch_lastupdate < 5
-        return s:sovereign_branch_cached
-    endif
-    
+    " Only reads from memory. Branch changes are picked up in the background.
     let path = s:to_python_safe_path('%')
     let cmd = printf('sovereignapi.get_branch("%s")', path)
     if !s:pyeval(cmd)
         return '--'
     endif
-    let s:sovereign_branch_cached = g:sovereign_returnvalue
+    let branch = g:sovereign_returnvalue
     unlet g:sovereign_returnvalue
-    return s:sovereign_branch_cached
+    return branch
 endfunction
 
 function! sovereign#status() abort
@@ -108,9 +106,17 @@ function! sovereign#status() abort
 endfunction
 
 function! sovereign#stage(...) abort
-    let path = s:get_safe_path_from_args(a:000)
+    if a:0 == 0
+        let paths = [s:get_safe_path_from_args(a:000)]
+    else
+        " Expand globs and stage everything with one call.
+        let paths = []
+        for arg in a:000
+            let paths += map(expand(arg, 0, 1), 's:to_python_safe_path(v:val)')
+        endfor
+    endif
 
-    let cmd = printf('sovereignapi.stage_file("%s")', path)
+    let cmd = printf('sovereignapi.stage_files(%s)', string(paths))
     if !s:pyeval(cmd)
         return
     endif
@@ -130,8 +136,23 @@ function! sovereign#commit(...) abort
     endif
 endfunction
 
+" Supdate [path] [revision]
+function! sovereign#update(...) abort
+    " Without a path, update the working copy for the current file.
+    let path = s:get_safe_path_from_args(a:000)
+    let target = a:0 > 0 ? path : ''
+    let revision = a:0 > 1 ? a:2 : ''
+
+    call s:create_scratch('split', 'sovereign-update')
+    let cmd = printf('sovereignapi.setup_buffer_update("%s", "%s", "%s")', path, target, revision)
+    if !s:pyeval(cmd)
+        bdelete
+        return
+    endif
+endfunction
+
 function! sovereign#diff(...) abort
-    let revision = 'HEAD'
+    let revision = 'BASE'
     let path = s:get_safe_path_from_args(a:000)
     if len(a:000) > 1
         let revision = a:000[1]
@@ -149,15 +170,78 @@ function! sovereign#diff(...) abort
     DiffBoth
 endfunction
 
-function! sovereign#log(limit, filepath, showdiff) abort
-    let path = s:get_safe_path_from_args(a:filepath)
+" Sblame [path] [revision]
+function! sovereign#blame(...) abort
+    let path = s:get_safe_path_from_args(a:000)
+    let revision = a:0 > 1 ? a:2 : 'BASE'
+
+    let line = line('.')
+    " Put the file's window back how it was when blame goes away.
+    let source_win = win_getid()
+    let restore = printf('call setwinvar(%d, "&scrollbind", %d) | call setwinvar(%d, "&wrap", %d)',
+                \ source_win, &l:scrollbind, source_win, &l:wrap)
+    setlocal scrollbind nowrap
+    call s:create_scratch('leftabove vsplit', '')
+    setlocal scrollbind nowrap nonumber norelativenumber nofoldenable nolist
+    augroup sovereign_blame
+        autocmd! * <buffer>
+        exec 'autocmd BufWinLeave,BufWipeout <buffer> ++once '. restore
+    augroup END
+    let cmd = printf('sovereignapi.setup_buffer_blame("%s", "%s")', path, revision)
+    if !s:pyeval(cmd)
+        bdelete
+        return
+    endif
+    exec line
+endfunction
+
+" Get the value of -name=value from args. Escape spaces with a backslash.
+function! s:pop_option(args, name)
+    let pat = '\v%(^|\s)-'. a:name .'\=\zs%(\\.|\S)+'
+    let value = matchstr(a:args, pat)
+    let args = substitute(a:args, '\v%(^|\s)-'. a:name .'\=%(\\.|\S)+', '', '')
+    return [substitute(value, '\\\(.\)', '\1', 'g'), args]
+endf
+
+function! sovereign#log(limit, args, showdiff) abort
+    let [grep, args] = s:pop_option(a:args, 'grep')
+    let [author, args] = s:pop_option(args, 'author')
+    let path = s:get_safe_path_from_args(trim(args))
+
+    if !empty(grep) || !empty(author)
+        let cmd = printf('sovereignapi.search_log("%s", %s, %s, %s)', path, json_encode(grep), json_encode(author), s:to_py_bool(a:showdiff))
+    else
+        let cmd = printf('sovereignapi.setup_buffer_log("%s", %i, %s)', path, a:limit, s:to_py_bool(a:showdiff))
+    endif
+    if !s:pyeval(cmd)
+        return
+    endif
+endfunction
 
-    let cmd = printf('sovereignapi.setup_buffer_log("%s", %i, %s)', path, a:limit, s:to_py_bool(a:showdiff))
+function! sovereign#log_more(count) abort
+    let cmd = printf('sovereignapi.log_more(%i)', a:count)
     if !s:pyeval(cmd)
         return
     endif
 endfunction
 
+function! sovereign#signs_attach(bufnr) abort
+    let path = fnamemodify(bufname(a:bufnr), ':p')
+    if empty(path) || !filereadable(path)
+        return
+    endif
+    let cmd = printf('sovereignapi.attach_signs("%s", %i)', s:to_python_safe_path(path), a:bufnr)
+    call s:pyeval(cmd)
+endfunction
+
+" Wait until typing pauses before updating signs.
+function! sovereign#signs_changed(bufnr) abort
+    call timer_stop(getbufvar(a:bufnr, 'sovereign_signs_timer', -1))
+    let timer = timer_start(get(g:, 'sovereign_signs_delay', 100),
+                \ {-> s:pyeval(printf('sovereignapi.update_signs(%i)', a:bufnr))})
+    call setbufvar(a:bufnr, 'sovereign_signs_timer', timer)
+endfunction
+
 function! sovereign#edit() abort
     if !s:pyeval('sovereignapi.jump_to_originator()')
         return
@@ -5,9 +5,21 @@ let loaded_sovereign = 1
 
 
 command! Sstatus call sovereign#status()
-command! -nargs=* Sadd call sovereign#stage(<f-args>)
+command! -nargs=* -complete=file Sadd call sovereign#stage(<f-args>)
 command! -nargs=* Scommit call sovereign#commit(<f-args>)
 command! -nargs=* Sdiff call sovereign#diff(<f-args>)
+command! -nargs=* -complete=file Supdate call sovereign#update(<f-args>)
+command! -nargs=* -complete=file Sblame call sovereign#blame(<f-args>)
 " Hide diff if bang is included.
 command! -nargs=* -count=10 -bang Slog call sovereign#log(<count>, <q-args>, <bang>1)
+" Add older history to the current Slog. Count is the number of pages.
+command! -count=1 Slogmore call sovereign#log_more(<count>)
 command! Sedit call sovereign#edit()
+
+if get(g:, 'sovereign_signs', 0)
+    augroup sovereign_signs
+        au!
+        " BufEnter catches BASE changing after a commit or update.
+        autocmd BufReadPost,BufEnter * call sovereign#signs_attach(str2nr(expand('<abuf>')))
+    augroup END
+endif
@@ -0,0 +1,199 @@
+#! /usr/bin/env python3
+
+"""Cache of file contents at numbered revisions.
+
+A file's contents at a revision never change, so once we've run svn cat we
+keep the result: decoded in memory (bounded LRU) and on disk. The disk tier
+stores each distinct content once, named by its sha1, so the same text at
+many revisions (or in many checkouts) only takes space once. An index per
+repository (keyed by UUID like the log cache) maps (path, revision) to
+content.
+"""
+
+import collections
+import hashlib
+import os
+import os.path as p
+import sqlite3
+import threading
+import time
+
+
+_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS contents (
+    path TEXT NOT NULL,
+    revision INTEGER NOT NULL,
+    sha1 TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    last_used REAL NOT NULL,
+    PRIMARY KEY (path, revision)
+);
+CREATE INDEX IF NOT EXISTS contents_last_used ON contents (last_used);
+'''
+
+# Most seconds we hold last_used updates in memory before writing them.
+_FLUSH_INTERVAL = 5.0
+
+
+class CatCache(object):
+    """svn cat output for one repository."""
+
+    def __init__(self, cache_dir, repository_uuid, max_memory=32 * 1024 * 1024, max_disk=256 * 1024 * 1024):
+        """
+        :cache_dir: Directory to store contents and the index in.
+        :repository_uuid: The repository we're caching.
+        :max_memory: Most characters of text to keep in memory.
+        :max_disk: Most bytes this repository may use on disk. Contents
+            shared with other repositories count for each.
+
+        """
+        self._content_dir = p.join(cache_dir, 'cat')
+        self.path = p.join(cache_dir, 'cat-{}.sqlite'.format(repository_uuid))
+        os.makedirs(self._content_dir, exist_ok=True)
+        self._max_memory = max_memory
+        self._max_disk = max_disk
+        self._lock = threading.Lock()
+        # sha1 -> text, least recently used first.
+        self._memory = collections.OrderedDict()
+        self._memory_size = 0
+        # (path, revision) -> sha1
+        self._keys = {}
+        # (path, revision) -> last_used we haven't written yet. Hits are
+        # common, so we don't write to disk for each one.
+        self._used = {}
+        self._last_flush = time.monotonic()
+        # sqlite connections can't be shared between threads, so each thread
+        # gets its own.
+        self._local = threading.local()
+        with self._connection() as c:
+            c.executescript(_SCHEMA)
+
+    def _connection(self):
+        try:
+            return self._local.connection
+        except AttributeError:
+            # Several vims may use the same cache.
+            c = sqlite3.connect(self.path, timeout=5)
+            c.execute('PRAGMA journal_mode=WAL')
+            self._local.connection = c
+            return c
+
+    def _content_path(self, sha1):
+        return p.join(self._content_dir, sha1[:2], sha1)
+
+    def _remember(self, sha1, text):
+        with self._lock:
+            if sha1 in self._memory:
+                self._memory.move_to_end(sha1)
+                return
+            if len(text) > self._max_memory:
+                return
+            self._memory[sha1] = text
+            self._memory_size += len(text)
+            while self._memory_size > self._max_memory:
+                _, old = self._memory.popitem(last=False)
+                self._memory_size -= len(old)
+
+    def get(self, path, revision):
+        """Get the text of a repository path at a numbered revision.
+
+        get(str, int) -> str or None
+        """
+        sha1 = self._keys.get((path, revision))
+        if sha1 is not None:
+            with self._lock:
+                text = self._memory.get(sha1)
+                if text is not None:
+                    self._memory.move_to_end(sha1)
+            if text is not None:
+                # Pruning the disk goes by last_used, so keep it current.
+                self._touch(path, revision)
+                return text
+
+        with self._connection() as c:
+            row = c.execute(
+                'SELECT sha1 FROM contents WHERE path = ? AND revision = ?',
+                (path, revision)).fetchone()
+            if row is None:
+                return None
+            sha1 = row[0]
+        self._touch(path, revision)
+        try:
+            with open(self._content_path(sha1), 'rb') as f:
+                text = f.read().decode('utf8')
+        except OSError:
+            # Pruned by another repository's cache.
+            return None
+        self._keys[(path, revision)] = sha1
+        self._remember(sha1, text)
+        return text
+
+    def _touch(self, path, revision):
+        with self._lock:
+            self._used[(path, revision)] = time.time()
+            due = time.monotonic() - self._last_flush >= _FLUSH_INTERVAL
+        if due:
+            self.flush()
+
+    def flush(self):
+        """Write pending last_used updates to disk.
+
+        flush() -> None
+        """
+        with self._lock:
+            used, self._used = self._used, {}
+            self._last_flush = time.monotonic()
+        if not used:
+            return
+        with self._connection() as c:
+            c.executemany(
+                'UPDATE contents SET last_used = ? WHERE path = ? AND revision = ?',
+                ((t, path, revision) for (path, revision), t in used.items()))
+
+    def put(self, path, revision, text):
+        """Save the text of a repository path at a numbered revision.
+
+        put(str, int, str) -> None
+        """
+        data = text.encode('utf8')
+        sha1 = hashlib.sha1(data).hexdigest()
+        filepath = self._content_path(sha1)
+        if not p.exists(filepath):
+            os.makedirs(p.dirname(filepath), exist_ok=True)
+            tmp = '{}.{}.{}.tmp'.format(filepath, os.getpid(), threading.get_ident())
+            with open(tmp, 'wb') as f:
+                f.write(data)
+            os.replace(tmp, filepath)
+        with self._connection() as c:
+            c.execute(
+                'INSERT OR REPLACE INTO contents VALUES (?, ?, ?, ?, ?)',
+                (path, revision, sha1, len(data), time.time()))
+        with self._lock:
+            self._used.pop((path, revision), None)
+        self._keys[(path, revision)] = sha1
+        self._remember(sha1, text)
+        self._prune()
+
+    def _prune(self):
+        """Forget the least recently used contents until we fit in
+        max_disk.
+        """
+        # Prune by what's really been used.
+        self.flush()
+        c = self._connection()
+        total = c.execute('SELECT total(size) FROM contents').fetchone()[0]
+        if total <= self._max_disk:
+            return
+        with c:
+            for path, revision, sha1, size in c.execute(
+                    'SELECT path, revision, sha1, size FROM contents ORDER BY last_used').fetchall():
+                if total <= self._max_disk:
+                    break
+                c.execute('DELETE FROM contents WHERE path = ? AND revision = ?', (path, revision))
+                self._keys.pop((path, revision), None)
+                total -= size
+                if c.execute('SELECT 1 FROM contents WHERE sha1 = ? LIMIT 1', (sha1,)).fetchone() is None:
+                    try:
+                        os.remove(self._content_path(sha1))
+                    except OSError:
+                        pass
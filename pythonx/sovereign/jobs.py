@@ -0,0 +1,133 @@
+#! /usr/bin/env python3
+
+"""Run slow work (mostly svn) off of vim's main thread.
+
+Vim's api isn't thread safe, so work running in the pool must never touch
+vim. Instead, jobs queue up callbacks and whoever owns the Engine calls
+poll() on the main thread (vimapi uses a timer) to run them.
+
+This module doesn't import vim so Repo code can use it too.
+"""
+
+import concurrent.futures
+import queue
+import threading
+
+
+class JobCancelled(Exception):
+
+    """Raised by Job.check_cancelled() to abandon cancelled work."""
+
+    def __init__(self, msg='Job cancelled'):
+        Exception.__init__(self, msg)
+
+
+class Job(object):
+    """Handle to work submitted to an Engine."""
+
+    def __init__(self, engine, name):
+        self._engine = engine
+        self.name = name
+        self._cancelled = threading.Event()
+        self._future = None
+
+    def cancel(self):
+        """Stop the job. None of its callbacks will run after this.
+
+        Work that's already running keeps going until it calls
+        check_cancelled() (svn processes can't be interrupted).
+        """
+        self._cancelled.set()
+        if self._future and self._future.cancel():
+            # Never started, so it won't report that it finished.
+            self._engine._finish(self)
+
+    def is_cancelled(self):
+        return self._cancelled.is_set()
+
+    def check_cancelled(self):
+        """Call periodically from long running work to bail out early.
+
+        check_cancelled() -> None
+        """
+        if self.is_cancelled():
+            raise JobCancelled()
+
+    def post(self, callback, *args):
+        """Run callback(*args) on the main thread. Use to deliver partial
+        results while work is still running.
+
+        post(callable, ...) -> None
+        """
+        self._engine._post(self, callback, args)
+
+    def is_done(self):
+        return self._future is not None and self._future.done()
+
+
+class Engine(object):
+    """A worker pool whose results are delivered by poll()."""
+
+    def __init__(self, error_handler, max_workers=4):
+        """
+        :error_handler: Called on the main thread with exceptions from work
+            that has no on_error and from callbacks.
+        :max_workers: Number of worker threads.
+
+        """
+        self._error_handler = error_handler
+        self._pool = concurrent.futures.ThreadPoolExecutor(max_workers, thread_name_prefix='sovereign')
+        self._callbacks = queue.Queue()
+        self._running = set()
+
+    def submit(self, work, on_done=None, on_error=None, name=''):
+        """Run work(job) in the pool.
+
+        on_done(result) or on_error(exception) are called on the main thread
+        unless the job is cancelled first.
+
+        submit(callable, callable, callable, str) -> Job
+        """
+        job = Job(self, name)
+        self._running.add(job)
+        job._future = self._pool.submit(self._run, job, work, on_done, on_error or self._error_handler)
+        return job
+
+    def _run(self, job, work, on_done, on_error):
+        try:
+            result = work(job)
+        except JobCancelled:
+            pass
+        except Exception as ex:
+            self._post(job, on_error, (ex,))
+        else:
+            if on_done:
+                self._post(job, on_done, (result,))
+        self._finish(job)
+
+    def _post(self, job, callback, args):
+        self._callbacks.put((job, callback, args))
+
+    def _finish(self, job):
+        self._callbacks.put((job, None, None))
+
+    def poll(self):
+        """Run callbacks queued by jobs. Only call from the main thread.
+
+        Returns whether there are still jobs that may queue callbacks.
+
+        poll() -> bool
+        """
+        while True:
+            try:
+                job, callback, args = self._callbacks.get_nowait()
+            except queue.Empty:
+                break
+            if callback is None:
+                self._running.discard(job)
+            elif not job.is_cancelled():
+                try:
+                    callback(*args)
+                except Exception as ex:
+                    self._error_handler(ex)
+        return bool(self._running)
@@ -0,0 +1,353 @@
+#! /usr/bin/env python3
+
+"""Working copy status without running svn status.
+
+wc.db records the size and modification time of every file when svn last
+touched it. Like svn itself, we only need to look at a file's contents when
+its stat data doesn't match. Unlike svn status, we walk the tree with a
+thread pool and never contact the server.
+
+Anything we can't decide locally (translated files, externals) is returned
+as uncertain so the caller can ask svn about only those paths.
+"""
+
+import collections
+import concurrent.futures
+import configparser
+import fnmatch
+import hashlib
+import os
+import os.path as p
+
+import svn.constants
+
+import sovereign.snapshot as snapshot
+import sovereign.wcdb as wcdb
+
+
+# Same fields as the entries from svn.local.LocalClient.status().
+StatusEntry = collections.namedtuple(
+    'StatusEntry', [
+        'name',
+        'type_raw_name',
+        'type',
+        'revision',
+    ])
+
+# svn's builtin default for global-ignores.
+_DEFAULT_GLOBAL_IGNORES = '*.o *.lo *.la *.al .libs *.so *.so.[0-9]* *.a *.pyc *.pyo __pycache__ *.rej *~ #*# .#* .*.swp .DS_Store [Tt]humbs.db'
+
+# svn compares a detranslated copy of these files, so hashing the working
+# file won't match the pristine checksum.
+_TRANSLATED_PROPS = ['svn:keywords', 'svn:eol-style', 'svn:special']
+
+_Node = collections.namedtuple(
+    '_Node', [
+        'relpath',
+        'parent_relpath',
+        'op_depth',
+        'presence',
+        'kind',
+        'checksum',
+        'translated_size',
+        'last_mod_time',
+        'properties',
+        'revision',
+    ])
+
+# Nodes with these presences don't exist as far as status is concerned.
+_ABSENT = ('not-present', 'excluded', 'server-excluded')
+
+
+def _make_entry(abs_path, status_type, revision=None):
+    return StatusEntry(
+        name=abs_path,
+        type_raw_name=snapshot.raw_name(status_type),
+        type=status_type,
+        revision=revision,
+    )
+
+def _user_global_ignores():
+    """Get global-ignores from the user's svn config.
+
+    _user_global_ignores() -> str
+    """
+    if os.name == 'nt':
+        cfg = p.join(os.environ.get('APPDATA', ''), 'Subversion', 'config')
+    else:
+        cfg = p.expanduser('~/.subversion/config')
+    parser = configparser.ConfigParser(interpolation=None, strict=False)
+    try:
+        parser.read(cfg)
+        return parser.get('miscellany', 'global-ignores')
+    except (configparser.Error, UnicodeDecodeError):
+        return _DEFAULT_GLOBAL_IGNORES
+
+def _matches_checksum(filepath, checksum):
+    """Hash the file and compare to a wc.db checksum like $sha1$da39a3ee...
+
+    _matches_checksum(str, str) -> bool
+    """
+    _, algorithm, digest = checksum.split('$', 2)
+    h = hashlib.new(algorithm)
+    with open(filepath, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            h.update(chunk)
+    return h.hexdigest() == digest
+
+
+class Scanner(object):
+    """Find changes in a working copy by comparing it against wc.db."""
+
+    def __init__(self, root_dir, db, max_workers=8):
+        """
+        :root_dir: The root directory for the svn working copy.
+        :db: The wcdb.WorkingCopyDb for root_dir.
+        :max_workers: Number of threads to walk and hash with.
+
+        """
+        self._root_dir = root_dir
+        self._db = db
+        self._max_workers = max_workers
+        self._global_ignores = _user_global_ignores().split()
+        self._ignore_cache = {}
+        self._inherited_cache = {}
+
+    def _load(self):
+        if self._db.has_pending_work():
+            raise wcdb.WcDbError("Working copy needs svn cleanup: {}".format(self._root_dir))
+
+        # relpath -> (BASE layer, topmost layer)
+        self._nodes = {}
+        self._children = collections.defaultdict(list)
+        for row in self._db.all_nodes():
+            node = _Node._make(row)
+            base, _ = self._nodes.get(node.relpath, (None, None))
+            if node.relpath and node.relpath not in self._nodes:
+                self._children[node.parent_relpath].append(node.relpath)
+            if node.op_depth == 0:
+                base = node
+            self._nodes[node.relpath] = (base, node)
+
+        self._actual_props = {}
+        self._conflicted = set()
+        for relpath, props, is_conflicted in self._db.actual_nodes():
+            if props is not None:
+                self._actual_props[relpath] = props
+            if is_conflicted:
+                self._conflicted.add(relpath)
+
+        self._externals = set(self._db.externals())
+
+    def _abspath(self, relpath):
+        return p.join(self._root_dir, *relpath.split('/'))
+
+    def _props(self, relpath, node):
+        return wcdb.parse_props(self._actual_props.get(relpath, node.properties))
+
+    def _inherited_ignores(self, relpath):
+        """Get the ignore patterns that apply to a directory and everything
+        below it: global-ignores and svn:global-ignores.
+
+        _inherited_ignores(str) -> list(str)
+        """
+        try:
+            return self._inherited_cache[relpath]
+        except KeyError:
+            pass
+        base, top = self._nodes.get(relpath, (None, None))
+        if relpath:
+            patterns = list(self._inherited_ignores(top.parent_relpath))
+        else:
+            patterns = list(self._global_ignores)
+        if top:
+            patterns.extend(self._props(relpath, top).get('svn:global-ignores', b'').decode('utf8').split())
+        self._inherited_cache[relpath] = patterns
+        return patterns
+
+    def _ignores_for(self, relpath):
+        """Get the ignore patterns for children of a directory.
+
+        _ignores_for(str) -> list(str)
+        """
+        try:
+            return self._ignore_cache[relpath]
+        except KeyError:
+            pass
+        patterns = list(self._inherited_ignores(relpath))
+        base, top = self._nodes.get(relpath, (None, None))
+        if top:
+            # svn:ignore only applies to immediate children.
+            lines = self._props(relpath, top).get('svn:ignore', b'').decode('utf8').splitlines()
+            patterns.extend(line.strip() for line in lines if line.strip())
+        self._ignore_cache[relpath] = patterns
+        return patterns
+
+    def _is_ignored(self, name, patterns):
+        return any(fnmatch.fnmatchcase(name, pat) for pat in patterns)
+
+    def _deleted_subtree(self, relpath):
+        """Get delete entries for a deleted directory and its children.
+
+        _deleted_subtree(str) -> list(StatusEntry)
+        """
+        entries = []
+        pending = [relpath]
+        while pending:
+            current = pending.pop()
+            base, top = self._nodes[current]
+            if top.presence in _ABSENT:
+                continue
+            entries.append(_make_entry(self._abspath(current), svn.constants.ST_DELETED, top.revision))
+            pending.extend(self._children.get(current, ()))
+        return entries
+
+    def _scan_dir(self, relpath):
+        """Check a directory's children.
+
+        Returns the status entries we're sure about, directories to scan next,
+        files to hash, and paths to ask svn about.
+
+        _scan_dir(str) -> list(StatusEntry), list(str), list(tuple), list(str)
+        """
+        entries = []
+        subdirs = []
+        suspects = []
+        uncertain = []
+        seen = set()
+        ignores = self._ignores_for(relpath)
+        try:
+            it = os.scandir(self._abspath(relpath))
+        except OSError:
+            return entries, subdirs, suspects, uncertain
+
+        with it:
+            for d in it:
+                if not relpath and d.name == '.svn':
+                    continue
+                child = relpath + '/' + d.name if relpath else d.name
+                seen.add(child)
+                base, top = self._nodes.get(child, (None, None))
+                if child in self._externals:
+                    if top is None:
+                        # Directory externals are their own working copy,
+                        # so we have no node for them. svn shows them as X
+                        # and then whatever changed inside.
+                        entries.append(_make_entry(d.path, svn.constants.ST_EXTERNAL))
+                    uncertain.append(d.path)
+                    continue
+                if top is None or top.presence == 'not-present':
+                    if not self._is_ignored(d.name, ignores):
+                        entries.append(_make_entry(d.path, svn.constants.ST_UNVERSIONED))
+                    continue
+                if top.presence in _ABSENT:
+                    continue
+                if top.kind == 'symlink':
+                    uncertain.append(d.path)
+                    continue
+
+                if top.presence == 'base-deleted':
+                    # Deleted with --keep-local. Its children are deleted too.
+                    entries.extend(self._deleted_subtree(child))
+                    continue
+
+                if child in self._conflicted:
+                    entries.append(_make_entry(d.path, svn.constants.ST_CONFLICTED, top.revision))
+                    if top.kind == 'dir':
+                        subdirs.append(child)
+                    continue
+
+                is_dir = d.is_dir(follow_symlinks=False)
+                if (top.kind == 'dir') != is_dir:
+                    entries.append(_make_entry(d.path, svn.constants.ST_OBSTRUCTED, top.revision))
+                    continue
+                if is_dir:
+                    subdirs.append(child)
+
+                if top.presence == 'incomplete':
+                    entries.append(_make_entry(d.path, svn.constants.ST_INCOMPLETE, top.revision))
+                    continue
+                if top.op_depth > 0:
+                    if base and base.presence not in _ABSENT:
+                        entries.append(_make_entry(d.path, svn.constants.ST_REPLACED, top.revision))
+                    else:
+                        entries.append(_make_entry(d.path, svn.constants.ST_ADDED, -1))
+                    continue
+
+                props_modified = child in self._actual_props and self._props(child, top) != wcdb.parse_props(top.properties)
+                if is_dir:
+                    if props_modified:
+                        entries.append(_make_entry(d.path, svn.constants.ST_NORMAL, top.revision))
+                    continue
+
+                st = d.stat(follow_symlinks=False)
+                if top.translated_size is not None and st.st_size == top.translated_size and st.st_mtime_ns // 1000 == top.last_mod_time:
+                    # Timestamp and size match, so svn won't look closer
+                    # either.
+                    status = None
+                elif top.translated_size is not None and st.st_size != top.translated_size:
+                    status = svn.constants.ST_MODIFIED
+                elif any(prop in self._props(child, top) for prop in _TRANSLATED_PROPS):
+                    uncertain.append(d.path)
+                    continue
+                else:
+                    suspects.append((d.path, top.checksum, top.revision, props_modified))
+                    continue
+
+                if status is None and props_modified:
+                    status = svn.constants.ST_NORMAL
+                if status is not None:
+                    entries.append(_make_entry(d.path, status, top.revision))
+
+        for child in self._children.get(relpath, ()):
+            if child in seen:
+                continue
+            base, top = self._nodes[child]
+            if top.presence in _ABSENT:
+                continue
+            if top.presence == 'base-deleted':
+                entries.extend(self._deleted_subtree(child))
+            else:
+                entries.append(_make_entry(self._abspath(child), svn.constants.ST_MISSING, top.revision))
+
+        return entries, subdirs, suspects, uncertain
+
+    def _check_suspect(self, suspect):
+        filepath, checksum, revision, props_modified = suspect
+        try:
+            if not _matches_checksum(filepath, checksum):
+                return _make_entry(filepath, svn.constants.ST_MODIFIED, revision)
+        except OSError:
+            return _make_entry(filepath, svn.constants.ST_MISSING, revision)
+        if props_modified:
+            return _make_entry(filepath, svn.constants.ST_NORMAL, revision)
+        return None
+
+    def scan(self):
+        """Find all changes in the working copy.
+
+        Raises wcdb.WcDbError if wc.db can't be read or the working copy
+        isn't in a state we can reason about.
+
+        scan() -> list(StatusEntry), list(str)
+        """
+        self._load()
+        entries = []
+        suspects = []
+        uncertain = []
+        with concurrent.futures.ThreadPoolExecutor(self._max_workers) as pool:
+            pending = {pool.submit(self._scan_dir, '')}
+            while pending:
+                done, pending = concurrent.futures.wait(pending, return_when=concurrent.futures.FIRST_COMPLETED)
+                for f in done:
+                    e, subdirs, s, u = f.result()
+                    entries.extend(e)
+                    suspects.extend(s)
+                    uncertain.extend(u)
+                    pending.update(pool.submit(self._scan_dir, d) for d in subdirs)
+
+            entries.extend(e for e in pool.map(self._check_suspect, suspects) if e)
+
+        entries.sort(key=lambda e: e.name)
+        uncertain.sort()
+        return entries, uncertain
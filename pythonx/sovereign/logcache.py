@@ -0,0 +1,424 @@
+#! /usr/bin/env python3
+
+"""Persistent cache of svn log history.
+
+Committed history never changes, so once we've fetched the log for a path
+we keep it in a SQLite database per repository (keyed by the repository
+UUID so every checkout of the same repository shares it).
+
+For each path we remember one contiguous range of revisions whose log we
+have completely. Requests inside that range are answered locally and we
+only ask svn about revisions outside of it.
+
+Messages, authors, and changed paths are also indexed with sqlite's FTS5
+trigram tokenizer (when it's available) so we can search history without the
+server.
+
+Diffs between numbered revisions never change either, so we keep the most
+recently used ones too. Same for blame.
+"""
+
+import collections
+import datetime
+import json
+import os
+import os.path as p
+import sqlite3
+import threading
+import time
+import xml.etree.ElementTree
+
+
+LogEntry = collections.namedtuple(
+    'LogEntry', [
+        'revision',
+        'author',
+        'date',
+        # list of (action, repository path)
+        'changelist',
+        'msg',
+    ])
+
+Coverage = collections.namedtuple(
+    'Coverage', [
+        'oldest',
+        'newest',
+    ])
+
+_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS revisions (
+    revision INTEGER PRIMARY KEY,
+    author TEXT,
+    date TEXT,
+    msg TEXT
+);
+CREATE TABLE IF NOT EXISTS changed_paths (
+    revision INTEGER NOT NULL,
+    action TEXT NOT NULL,
+    path TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS changed_paths_revision ON changed_paths (revision);
+-- Revisions svn log listed for a path.
+CREATE TABLE IF NOT EXISTS path_revisions (
+    path TEXT NOT NULL,
+    revision INTEGER NOT NULL,
+    PRIMARY KEY (path, revision)
+) WITHOUT ROWID;
+-- The range of revisions where path_revisions is complete for a path.
+CREATE TABLE IF NOT EXISTS coverage (
+    path TEXT PRIMARY KEY,
+    oldest INTEGER NOT NULL,
+    newest INTEGER NOT NULL
+);
+-- format is which svn command made the diff since their headers differ.
+CREATE TABLE IF NOT EXISTS diffs (
+    path TEXT NOT NULL,
+    format TEXT NOT NULL,
+    old INTEGER NOT NULL,
+    new INTEGER NOT NULL,
+    diff TEXT NOT NULL,
+    last_used REAL NOT NULL,
+    PRIMARY KEY (path, format, old, new)
+);
+CREATE INDEX IF NOT EXISTS diffs_last_used ON diffs (last_used);
+-- Blame for a path at a revision as a json list of [revision, author].
+CREATE TABLE IF NOT EXISTS blame (
+    path TEXT NOT NULL,
+    revision INTEGER NOT NULL,
+    annotations TEXT NOT NULL,
+    last_used REAL NOT NULL,
+    PRIMARY KEY (path, revision)
+);
+CREATE INDEX IF NOT EXISTS blame_last_used ON blame (last_used);
+'''
+
+# Index of each revision's text. rowid is the revision. Trigrams find any
+# substring (of at least 3 characters) like LIKE does.
+_FTS_SCHEMA = "CREATE VIRTUAL TABLE IF NOT EXISTS log_fts USING fts5(msg, author, paths, tokenize='trigram')"
+_FTS_MIN_LENGTH = 3
+# Index revisions we cached before we had log_fts (or that a vim without it
+# cached since).
+_FTS_BACKFILL = '''
+INSERT OR REPLACE INTO log_fts (rowid, msg, author, paths)
+SELECT r.revision, r.msg, r.author, group_concat(cp.path, ' ')
+FROM revisions r LEFT JOIN changed_paths cp ON r.revision = cp.revision
+WHERE r.revision NOT IN (SELECT rowid FROM log_fts)
+GROUP BY r.revision
+'''
+
+_DATE_FORMAT = '%Y-%m-%dT%H:%M:%S.%fZ'
+
+# Diff formats. Each svn command writes its own headers.
+DIFF_GIT = 'git' # svn diff --git
+DIFF_LOG = 'log' # svn log --diff
+
+
+def default_cache_dir():
+    """Get the directory where we keep caches.
+
+    default_cache_dir() -> str
+    """
+    if os.name == 'nt':
+        base = os.environ.get('LOCALAPPDATA') or p.expanduser('~')
+    else:
+        base = os.environ.get('XDG_CACHE_HOME') or p.expanduser('~/.cache')
+    return p.join(base, 'vim-sovereign')
+
+
+def parse_date(txt):
+    """Parse a date from svn's xml output.
+
+    parse_date(str) -> datetime.datetime
+    """
+    return datetime.datetime.strptime(txt, _DATE_FORMAT).replace(tzinfo=datetime.timezone.utc)
+
+
+def _fts_phrase(txt):
+    """Quote text as an FTS5 phrase.
+
+    _fts_phrase(str) -> str
+    """
+    return '"{}"'.format(txt.replace('"', '""'))
+
+def _like_contains(txt):
+    """Build a LIKE pattern (with ESCAPE '\\') that finds txt anywhere.
+
+    _like_contains(str) -> str
+    """
+    for c in '\\%_':
+        txt = txt.replace(c, '\\' + c)
+    return '%{}%'.format(txt)
+
+
+def parse_log_xml(xml_txt):
+    """Parse `svn log --xml --verbose` output.
+
+    parse_log_xml(str) -> list(LogEntry)
+    """
+    root = xml.etree.ElementTree.fromstring(xml_txt)
+    entries = []
+    # Merge history can nest entries. We only want the top level ones.
+    for e in root.findall('logentry'):
+        date = e.findtext('date')
+        entries.append(LogEntry(
+            revision=int(e.get('revision')),
+            author=e.findtext('author') or '',
+            date=parse_date(date) if date else None,
+            changelist=[(path.get('action'), path.text) for path in e.findall('paths/path')],
+            msg=e.findtext('msg') or '',
+        ))
+    return entries
+
+
+def _prune(c, table, column, max_size):
+    """Delete the least recently used rows until a table's column adds up
+    to at most max_size characters.
+
+    _prune(sqlite3.Connection, str, str, int) -> None
+    """
+    total = c.execute('SELECT total(length({})) FROM {}'.format(column, table)).fetchone()[0]
+    if total <= max_size:
+        return
+    for rowid, size in c.execute('SELECT rowid, length({}) FROM {} ORDER BY last_used'.format(column, table)).fetchall():
+        if total <= max_size:
+            break
+        c.execute('DELETE FROM {} WHERE rowid = ?'.format(table), (rowid,))
+        total -= size
+
+
+class LogCache(object):
+    """svn log history for one repository."""
+
+    def __init__(self, cache_dir, repository_uuid, max_diff_size=64 * 1024 * 1024, max_blame_size=64 * 1024 * 1024):
+        """
+        :cache_dir: Directory to store the database in.
+        :repository_uuid: The repository we're caching. Different checkouts
+            of the same repository share a cache.
+        :max_diff_size: Most characters of diffs to keep.
+        :max_blame_size: Most characters of blame to keep.
+
+        """
+        self.path = p.join(cache_dir, 'log-{}.sqlite'.format(repository_uuid))
+        self._max_diff_size = max_diff_size
+        self._max_blame_size = max_blame_size
+        os.makedirs(cache_dir, exist_ok=True)
+        # sqlite connections can't be shared between threads, so each thread
+        # gets its own.
+        self._local = threading.local()
+        with self._connection() as c:
+            columns = [row[1] for row in c.execute('PRAGMA table_info(diffs)')]
+            if columns and 'format' not in columns:
+                # Saved before we kept track of format. It's only a cache.
+                c.execute('DROP TABLE diffs')
+            c.executescript(_SCHEMA)
+        self.has_fts = self._create_fts()
+
+    def _connection(self):
+        try:
+            return self._local.connection
+        except AttributeError:
+            # Several vims may use the same cache.
+            c = sqlite3.connect(self.path, timeout=5)
+            c.execute('PRAGMA journal_mode=WAL')
+            self._local.connection = c
+            return c
+
+    def _create_fts(self):
+        """Create the search index if sqlite supports it.
+
+        _create_fts() -> bool
+        """
+        c = self._connection()
+        row = c.execute("SELECT sql FROM sqlite_master WHERE name = 'log_fts'").fetchone()
+        try:
+            with c:
+                if row is not None and 'trigram' not in row[0]:
+                    # Made before we used trigrams. It's only a cache.
+                    c.execute('DROP TABLE log_fts')
+                c.execute(_FTS_SCHEMA)
+                c.execute(_FTS_BACKFILL)
+        except sqlite3.OperationalError:
+            # Built without fts5 or too old for trigrams (3.34). Search
+            # falls back to LIKE.
+            return False
+        return True
+
+    def coverage(self, path):
+        """Get the range of revisions where we have the complete log for a
+        path.
+
+        coverage(str) -> Coverage or None
+        """
+        row = self._connection().execute(
+            'SELECT oldest, newest FROM coverage WHERE path = ?', (path,)).fetchone()
+        if row is None:
+            return None
+        return Coverage._make(row)
+
+    def store(self, path, entries, oldest, newest):
+        """Save the log for a path.
+
+        :entries: Everything svn log listed for path between oldest and
+            newest (inclusive).
+
+        store(str, list(LogEntry), int, int) -> None
+        """
+        with self._connection() as c:
+            for e in entries:
+                c.execute(
+                    'INSERT OR REPLACE INTO revisions VALUES (?, ?, ?, ?)',
+                    (e.revision, e.author, e.date.strftime(_DATE_FORMAT) if e.date else None, e.msg))
+                c.execute('DELETE FROM changed_paths WHERE revision = ?', (e.revision,))
+                c.executemany(
+                    'INSERT INTO changed_paths VALUES (?, ?, ?)',
+                    ((e.revision, action, changed) for action, changed in e.changelist))
+                c.execute('INSERT OR IGNORE INTO path_revisions VALUES (?, ?)', (path, e.revision))
+                if self.has_fts:
+                    c.execute(
+                        'INSERT OR REPLACE INTO log_fts (rowid, msg, author, paths) VALUES (?, ?, ?, ?)',
+                        (e.revision, e.msg, e.author, ' '.join(changed for action, changed in e.changelist)))
+
+            row = c.execute('SELECT oldest, newest FROM coverage WHERE path = ?', (path,)).fetchone()
+            if row is not None:
+                old = Coverage._make(row)
+                if oldest <= old.newest + 1 and old.oldest - 1 <= newest:
+                    # Overlapping or adjacent, so we can join them.
+                    oldest = min(oldest, old.oldest)
+                    newest = max(newest, old.newest)
+                elif newest < old.oldest:
+                    # Keep the newer range since that's what people look at.
+                    return
+            c.execute('INSERT OR REPLACE INTO coverage VALUES (?, ?, ?)', (path, oldest, newest))
+
+    def read(self, path, newest, oldest, limit=None):
+        """Get cached log entries for a path, newest first.
+
+        read(str, int, int, int) -> list(LogEntry)
+        """
+        rows = self._connection().execute(
+            '''SELECT r.revision, r.author, r.date, r.msg
+            FROM path_revisions pr JOIN revisions r ON pr.revision = r.revision
+            WHERE pr.path = ? AND pr.revision BETWEEN ? AND ?
+            ORDER BY pr.revision DESC LIMIT ?''',
+            (path, oldest, newest, -1 if limit is None else limit)).fetchall()
+        return self._make_entries(rows)
+
+    def search(self, path, grep=None, author=None, limit=None):
+        """Find cached log entries for a path whose message or changed paths
+        contain grep and whose author contains author. Newest first.
+
+        search(str, str, str, int) -> list(LogEntry)
+        """
+        # LIKE decides what matches so we find the same things with or
+        # without log_fts. The index only narrows down what LIKE has to look
+        # at, and trigrams can't find anything shorter than 3 characters.
+        where = ['pr.path = ?']
+        args = [path]
+        terms = []
+        if grep:
+            where.append('''(r.msg LIKE ? ESCAPE '\\' OR r.revision IN
+            (SELECT revision FROM changed_paths WHERE path LIKE ? ESCAPE '\\'))''')
+            args += [_like_contains(grep)] * 2
+            if len(grep) >= _FTS_MIN_LENGTH:
+                terms.append('{msg paths} : ' + _fts_phrase(grep))
+        if author:
+            where.append("r.author LIKE ? ESCAPE '\\'")
+            args.append(_like_contains(author))
+            if len(author) >= _FTS_MIN_LENGTH:
+                terms.append('author : ' + _fts_phrase(author))
+        if self.has_fts and terms:
+            where.append('r.revision IN (SELECT rowid FROM log_fts WHERE log_fts MATCH ?)')
+            args.append(' AND '.join(terms))
+        args.append(-1 if limit is None else limit)
+        rows = self._connection().execute(
+            '''SELECT r.revision, r.author, r.date, r.msg
+            FROM path_revisions pr JOIN revisions r ON pr.revision = r.revision
+            WHERE {}
+            ORDER BY pr.revision DESC LIMIT ?'''.format(' AND '.join(where)),
+            args).fetchall()
+        return self._make_entries(rows)
+
+    def get_diff(self, path, fmt, old, new):
+        """Get a saved diff between two numbered revisions of a path.
+
+        :fmt: DIFF_GIT or DIFF_LOG.
+
+        get_diff(str, str, int, int) -> str or None
+        """
+        with self._connection() as c:
+            row = c.execute(
+                'SELECT diff FROM diffs WHERE path = ? AND format = ? AND old = ? AND new = ?',
+                (path, fmt, old, new)).fetchone()
+            if row is None:
+                return None
+            c.execute(
+                'UPDATE diffs SET last_used = ? WHERE path = ? AND format = ? AND old = ? AND new = ?',
+                (time.time(), path, fmt, old, new))
+        return row[0]
+
+    def store_diffs(self, path, fmt, diffs):
+        """Save diffs between numbered revisions of a path. Forgets the
+        least recently used diffs if we're over our limit.
+
+        :fmt: DIFF_GIT or DIFF_LOG.
+        :diffs: list of (old revision, new revision, diff)
+
+        store_diffs(str, str, list((int, int, str))) -> None
+        """
+        now = time.time()
+        with self._connection() as c:
+            c.executemany(
+                'INSERT OR REPLACE INTO diffs VALUES (?, ?, ?, ?, ?, ?)',
+                ((path, fmt, old, new, diff, now) for old, new, diff in diffs))
+            _prune(c, 'diffs', 'diff', self._max_diff_size)
+
+    def get_blame(self, path, revision):
+        """Get the newest saved blame for a path at or before a numbered
+        revision.
+
+        get_blame(str, int) -> (int, list((int, str))) or None
+        """
+        with self._connection() as c:
+            row = c.execute(
+                '''SELECT revision, annotations FROM blame
+                WHERE path = ? AND revision <= ?
+                ORDER BY revision DESC LIMIT 1''',
+                (path, revision)).fetchone()
+            if row is None:
+                return None
+            c.execute(
+                'UPDATE blame SET last_used = ? WHERE path = ? AND revision = ?',
+                (time.time(), path, row[0]))
+        return row[0], [tuple(a) for a in json.loads(row[1])]
+
+    def store_blame(self, path, revision, annotations):
+        """Save the blame for a path at a numbered revision. Forgets the
+        least recently used blame if we're over our limit.
+
+        store_blame(str, int, list((int, str))) -> None
+        """
+        with self._connection() as c:
+            c.execute(
+                'INSERT OR REPLACE INTO blame VALUES (?, ?, ?, ?)',
+                (path, revision, json.dumps(annotations), time.time()))
+            _prune(c, 'blame', 'annotations', self._max_blame_size)
+
+    def _make_entries(self, rows):
+        """Build LogEntry from (revision, author, date, msg) rows.
+
+        _make_entries(list(tuple)) -> list(LogEntry)
+        """
+        c = self._connection()
+        entries = []
+        for revision, author, date, msg in rows:
+            changelist = c.execute(
+                'SELECT action, path FROM changed_paths WHERE revision = ? ORDER BY rowid',
+                (revision,)).fetchall()
+            entries.append(LogEntry(
+                revision=revision,
+                author=author,
+                date=parse_date(date) if date else None,
+                changelist=changelist,
+                msg=msg,
+            ))
+        return entries
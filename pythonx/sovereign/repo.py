@@ -1,18 +1,110 @@
 #! /usr/bin/env python3
 
 from email.utils import format_datetime
+import collections
+import concurrent.futures
+import difflib
+import mmap
 import os
 import os.path as p
 import pprint as pp
 import re
+import sqlite3
+import subprocess
+import tempfile
+import time
+import xml.etree.ElementTree
 
 try:
+    import svn.config
+    import svn.exception
     import svn.local
 except ImportError:
     print('pysvn not installed. Please run pip install -r ~/.vim/bundle/sovereign/requirements.txt')
     raise
 
+import sovereign.catcache as catcache
+import sovereign.localstatus as localstatus
+import sovereign.logcache as logcache
+import sovereign.snapshot as snapshot
+import sovereign.watcher as watcher
+import sovereign.wcdb as wcdb
+
 _SNIP_MARKER = "------------------------ >8 ------------------------"
+_EMPTY_COMMIT_MSG = 'Aborting commit due to empty commit message'
+_NOTHING_STAGED = 'Nothing staged to commit'
+
+# Last line of svn commit output.
+_COMMITTED_REVISION = re.compile(r'^Committed revision (\d+)\.$', re.MULTILINE)
+
+# svn update lists each path it changed after columns for its text,
+# properties, lock, and tree conflicts:
+#   U    foo.c
+#   C    bar.c
+#      C baz
+_UPDATE_LINE = re.compile(r'^([ADUCGER ])([UCG ])([B ])([C ]) +(.+)$')
+# The last line svn update prints for each target.
+_UPDATED_REVISION = re.compile(r'^(?:Updated to|At) revision (\d+)\.$')
+
+UpdateResult = collections.namedtuple(
+    'UpdateResult', [
+        # The revision we're at now (the last one for multiple targets).
+        'revision',
+        # Absolute paths that have conflicts.
+        'conflicts',
+    ])
+
+RemoteStatus = collections.namedtuple(
+    'RemoteStatus', [
+        # The HEAD revision we compared against.
+        'revision',
+        # (svnroot relative path, status code) for each path an update would
+        # change.
+        'entries',
+        # time.time() when we asked the server.
+        'checked',
+    ])
+
+# Files at least this big are mmapped instead of read.
+_MMAP_THRESHOLD = 1024 * 1024
+
+# Most paths to pass to a single svn command.
+_MAX_TARGETS = 500
+
+# Most svn diffs to run at once when we can't batch them.
+_MAX_DIFF_WORKERS = 4
+
+# Files bigger than this get a summary instead of a diff in commit messages.
+_MAX_COMMIT_DIFF_SIZE = 1024 * 1024
+# How much of a file to look at to decide if it's binary (same as git).
+_BINARY_CHECK_SIZE = 8000
+
+# Most working copy diffs to remember for Sstatus.
+_MAX_INLINE_DIFFS = 200
+
+# Most svn cats to run at once when prefetching.
+_MAX_PREFETCH_WORKERS = 2
+# Stop prefetching after this many characters.
+_MAX_PREFETCH_SIZE = 16 * 1024 * 1024
+# Status where we'll probably want to diff against older contents.
+_PREFETCH_STATUS = (
+    svn.constants.ST_MODIFIED,
+    svn.constants.ST_CONFLICTED,
+    svn.constants.ST_DELETED,
+    svn.constants.ST_MISSING,
+    svn.constants.ST_REPLACED,
+)
+
+# Blame for lines changed in the working copy.
+_NOT_COMMITTED = 'Not committed'
+
+# @@ -12,3 +12,4 @@
+_HUNK_HEADER = re.compile(r'^@@ -(\d+)(?:,(\d+))? \+(\d+)(?:,(\d+))? @@')
+
+# svn log puts this line before each entry and after the last one.
+_LOG_SEPARATOR = '-' * 72
+# r1234 | author | 2020-01-01 12:00:00 +0000 (Wed, 01 Jan 2020) | 2 lines
+_LOG_HEADER = re.compile(r'^r(\d+) \| .* \| .* \|(?: (\d+) lines?)?$')
 
 _root_to_repo = {}
 
@@ -25,6 +117,26 @@ def get_repo(working_copy_file):
         _root_to_repo[root] = r
         return r
 
+def read_commit_message(commit_msg_file):
+    """Get the message to commit from a commit buffer's file. Drops
+    comments and everything below the snip marker.
+
+    Returns None if the message is empty.
+
+    read_commit_message(File) -> str or None
+    """
+    commit_msg_lines = commit_msg_file.readlines()
+    for i,line in enumerate(commit_msg_lines):
+        if _SNIP_MARKER in line:
+            commit_msg_lines = commit_msg_lines[:i-1]
+            break
+
+    commit_msg_lines = [line for line in commit_msg_lines if line[0] != '#']
+
+    if all([line.isspace() for line in commit_msg_lines]):
+        return None
+    return "".join(commit_msg_lines)
+
 def trim_leading_lines(txt, num_newlines):
     assert num_newlines > 0
     index = 0
@@ -42,6 +154,197 @@ def _prefix_lines(txt, prefix):
     lines = [prefix + line for line in lines]
     return "\n".join(lines)
 
+def _read_text(filepath):
+    """Read a utf8 file. Large files are decoded straight from an mmap to
+    avoid an extra copy.
+
+    _read_text(str) -> str
+    """
+    with open(filepath, 'rb') as f:
+        size = os.fstat(f.fileno()).st_size
+        if size < _MMAP_THRESHOLD:
+            return f.read().decode('utf8')
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as m:
+            return str(m, 'utf8')
+
+def _split_keepends(txt):
+    # Unlike splitlines, only split on \n like diff does.
+    lines = txt.split('\n')
+    last = lines.pop()
+    lines = [line + '\n' for line in lines]
+    if last:
+        lines.append(last)
+    return lines
+
+def _git_style_diff(old_txt, new_txt, rel_path, old_label, new_label):
+    """Build a diff like `svn diff --git` (without its Index: header).
+
+    _git_style_diff(str, str, str, str, str) -> str
+    """
+    rel_path = rel_path.replace(os.sep, '/')
+    a = 'a/' + rel_path
+    b = 'b/' + rel_path
+    out = []
+    for line in difflib.unified_diff(_split_keepends(old_txt), _split_keepends(new_txt), a, b, old_label, new_label):
+        out.append(line)
+        if not line.endswith('\n'):
+            out.append('\n\\ No newline at end of file\n')
+    if not out:
+        return ''
+    return 'diff --git {} {}\n{}'.format(a, b, ''.join(out))
+
+def _is_log_entry_end(lines, i):
+    # Diffs can contain a line that looks like the separator (a removed line
+    # of 71 dashes), but it can't be followed by a log entry header.
+    if lines[i] != _LOG_SEPARATOR:
+        return False
+    if i + 1 == len(lines) or (i + 2 == len(lines) and not lines[i+1]):
+        return True
+    return bool(_LOG_HEADER.match(lines[i+1]))
+
+def _split_log_diff(txt):
+    """Split `svn log --diff` output into each revision's diff.
+
+    Messages and diffs can contain anything (Index: lines, separators), so
+    we skip messages using the line count in their header and only end a
+    diff at a separator followed by another entry.
+
+    _split_log_diff(str) -> dict(int, str)
+    """
+    lines = txt.split('\n')
+    diffs = {}
+    i = 0
+    while i < len(lines):
+        m = None
+        if i > 0 and lines[i-1] == _LOG_SEPARATOR:
+            m = _LOG_HEADER.match(lines[i])
+        if not m:
+            i += 1
+            continue
+        revision = int(m.group(1))
+        # Skip the header, blank line, and message.
+        i += 2 + int(m.group(2) or 0)
+        start = i
+        while i < len(lines) and not _is_log_entry_end(lines, i):
+            i += 1
+        diff = lines[start:i]
+        while diff and not diff[0]:
+            diff.pop(0)
+        while diff and not diff[-1]:
+            diff.pop()
+        # Like _unified_diff, skip 'Index:' line and '===' line.
+        if len(diff) >= 2 and diff[0].startswith('Index: ') and diff[1].startswith('==='):
+            diff = diff[2:]
+        diffs[revision] = '\n'.join(diff) + '\n' if diff else ''
+    return diffs
+
+def _apply_diff_to_blame(annotations, diff, annotation):
+    """Move blame for each line from before a diff to after it. Lines the
+    diff adds get annotation.
+
+    Returns None if the diff doesn't fit the lines we have.
+
+    _apply_diff_to_blame(list, str, object) -> list or None
+    """
+    out = []
+    pos = 0
+    lines = diff.split('\n')
+    i = 0
+    while i < len(lines):
+        m = _HUNK_HEADER.match(lines[i])
+        i += 1
+        if not m:
+            continue
+        old_start, old_count, _, new_count = m.groups()
+        old_count = int(old_count) if old_count is not None else 1
+        new_count = int(new_count) if new_count is not None else 1
+        # An empty range starts after the line it names.
+        start = int(old_start) - 1 if old_count else int(old_start)
+        if start < pos or start + old_count > len(annotations):
+            return None
+        out.extend(annotations[pos:start])
+        pos = start
+        while old_count or new_count:
+            if i >= len(lines):
+                return None
+            line = lines[i]
+            i += 1
+            kind = line[:1]
+            if kind == '\\':
+                # No newline at end of file
+                continue
+            elif kind in (' ', ''):
+                if not old_count or not new_count:
+                    return None
+                out.append(annotations[pos])
+                pos += 1
+                old_count -= 1
+                new_count -= 1
+            elif kind == '-' and old_count:
+                pos += 1
+                old_count -= 1
+            elif kind == '+' and new_count:
+                out.append(annotation)
+                new_count -= 1
+            else:
+                return None
+    out.extend(annotations[pos:])
+    return out
+
+def _parse_status_xml(xml_txt):
+    """Parse `svn status --xml` output. Supports multiple targets, unlike
+    svn.local.LocalClient.status().
+
+    _parse_status_xml(str) -> list(localstatus.StatusEntry)
+    """
+    root = xml.etree.ElementTree.fromstring(xml_txt)
+    return [_parse_status_entry(entry) for entry in root.iter('entry')]
+
+def _parse_remote_status_xml(xml_txt):
+    """Find the incoming changes in `svn status --show-updates --xml`
+    output. Entries without a repos-status only have local changes.
+
+    Changes to properties alone have no item, so we call them modified like
+    svn's "*" does.
+
+    _parse_remote_status_xml(str) -> int or None, list((str, int))
+    """
+    root = xml.etree.ElementTree.fromstring(xml_txt)
+    incoming = []
+    for entry in root.iter('entry'):
+        repos = entry.find('repos-status')
+        if repos is None:
+            continue
+        item = repos.attrib.get('item', 'none')
+        if item == 'none':
+            if repos.attrib.get('props', 'none') == 'none':
+                # Only lock information.
+                continue
+            item = 'modified'
+        incoming.append((entry.attrib['path'], svn.constants.STATUS_TYPE_LOOKUP[item]))
+    revision = None
+    against = root.find('.//against')
+    if against is not None:
+        revision = int(against.attrib['revision'])
+    return revision, incoming
+
+def _parse_status_entry(entry):
+    """Convert an <entry> from `svn status --xml`.
+
+    _parse_status_entry(xml.etree.ElementTree.Element) -> localstatus.StatusEntry
+    """
+    wcstatus = entry.find('wc-status').attrib
+    change_type_raw = wcstatus['item']
+    revision = wcstatus.get('revision')
+    if revision is not None:
+        revision = int(revision)
+    return localstatus.StatusEntry(
+        name=entry.attrib['path'],
+        type_raw_name=change_type_raw,
+        type=svn.constants.STATUS_TYPE_LOOKUP[change_type_raw],
+        revision=revision,
+    )
+
 
 
 class SvnError(Exception):
@@ -77,6 +380,16 @@ class Repo(object):
         "?", # ST_UNVERSIONED = 14
     ]
 
+    # Sections of Sstatus in display order.
+    STAGED, UNSTAGED, UNTRACKED = range(3)
+    status_headers = [
+        'Staged ({count})',
+        'Unstaged ({count})',
+        'Untracked ({count})',
+    ]
+    # Shown after the other sections once we know what's on the server.
+    remote_status_header = 'Incoming ({count})'
+
     def __init__(self, root_dir):
         """ Create a repo object that helps interface with the svn
         repository. A wrapper around svn.local.LocalClient.
@@ -86,7 +399,36 @@ class Repo(object):
         """
         self._root_dir = p.realpath(p.abspath(p.expanduser(root_dir)))
         self._client = svn.local.LocalClient(self._root_dir)
-        self._staged_files = []
+        # Absolute path -> svnroot relative path for each staged file.
+        self._staged_files = {}
+        # The most recent status we've seen.
+        self._last_snapshot = None
+        # change_token() when we started getting _last_snapshot.
+        self._status_token = None
+        # Files written since we started getting _last_snapshot.
+        self._touched = set()
+        # Whether to find changes ourselves instead of running svn status.
+        self.use_local_status = True
+        # (change_token, branch name)
+        self._branch_cache = (None, None)
+        # Tells us which files changed outside of vim. See start_watching.
+        self._watcher = None
+        # Where to keep caches that outlive vim. None means the default.
+        self.cache_dir = None
+        # None until we need it. False if we can't use it.
+        self._log_cache = None
+        self._cat_cache = None
+        # Absolute path -> ((stat signature, change_token), diff lines).
+        self._inline_diffs = collections.OrderedDict()
+        # The last RemoteStatus we got and when we last asked for one (even
+        # if it failed).
+        self.remote_status = None
+        self._remote_checked = None
+        try:
+            self._wcdb = wcdb.WorkingCopyDb(self._root_dir)
+        except wcdb.WcDbError:
+            # Older or newer working copy format. Ask svn instead.
+            self._wcdb = None
 
     def _to_svnroot_relative_path(self, filepath):
         """Convert to relative paths. For display purposes only. We should
@@ -105,9 +447,122 @@ class Repo(object):
     def relative_to_absolute(self, rel_filepath):
         return p.join(self._root_dir, rel_filepath)
 
+    def _info(self, rel_path=None):
+        """Get svn info for a path relative to the svn root.
+
+        Reads wc.db directly when we understand its format and only runs svn
+        info as a fallback.
+
+        _info(str) -> dict
+        """
+        if self._wcdb:
+            try:
+                return self._wcdb.info(rel_path)
+            except wcdb.WcDbError:
+                pass
+        return self._client.info(rel_path=rel_path)
+
+    def change_token(self):
+        """Get a cheap value that changes whenever svn modifies the working
+        copy (update, switch, commit, add, revert, etc).
+
+        change_token() -> object
+        """
+        try:
+            st = os.stat(p.join(self._root_dir, '.svn', 'wc.db'))
+            return st.st_mtime_ns, st.st_size
+        except OSError:
+            # Pre-1.7 working copies have no wc.db. Expire every few seconds.
+            return int(time.time() // 5)
+
+    def owns_path(self, filepath):
+        """Whether the absolute path is inside this working copy.
+
+        owns_path(str) -> bool
+        """
+        return p.realpath(filepath).startswith(self._root_dir + os.sep)
+
+    def note_touched(self, filepath):
+        """Record that a file was written, so status may have changed even
+        though svn didn't touch the working copy.
+
+        note_touched(str) -> None
+        """
+        self._touched.add(filepath)
+
+    def start_watching(self):
+        """Watch the working copy for changes made outside of vim so we
+        can refresh status for only the files that changed.
+
+        start_watching() -> None
+        """
+        if self._watcher is None:
+            self._watcher = watcher.create(self._root_dir)
+
+    def is_status_current(self):
+        """Whether the last status is still accurate as far as we can tell
+        without looking at the tree: svn hasn't changed wc.db and we haven't
+        been told about any writes since.
+
+        Doesn't notice files modified outside of vim unless we're watching.
+
+        is_status_current() -> bool
+        """
+        return (self._last_snapshot is not None
+                and not self._touched
+                and not (self._watcher and self._watcher.has_changes())
+                and self._status_token == self.change_token())
+
+    def forget_status(self):
+        """Drop the last status so the next one checks the whole tree.
+
+        forget_status() -> None
+        """
+        self._last_snapshot = None
+
+    def _begin_status(self):
+        """Start getting a new status.
+
+        Returns the paths that changed since the last status or None if we
+        don't know.
+
+        _begin_status() -> set(str) or None
+        """
+        # Anything touched after this point might not be in the status we're
+        # about to get.
+        touched, self._touched = self._touched, set()
+        self._status_token = self.change_token()
+        if self._watcher:
+            changes = self._watcher.take_changes()
+            if changes is None:
+                return None
+            touched |= changes
+        return touched
+
+    def peek_branch(self):
+        """Get the last branch we looked up without checking whether it's
+        still current. Never touches the disk.
+
+        peek_branch() -> str or None
+        """
+        return self._branch_cache[1]
+
     def get_branch(self):
-        i = self._client.info()
-        url = i['url']
+        """Get the branch name for the working copy. Only looks it up again
+        when the working copy has changed.
+
+        get_branch() -> str
+        """
+        token = self.change_token()
+        cached_token, branch = self._branch_cache
+        if token == cached_token:
+            return branch
+        branch = self._lookup_branch()
+        self._branch_cache = (token, branch)
+        return branch
+
+    def _lookup_branch(self):
+        url = self._info()['url']
         if 'branches' in url:
             url = re.sub('.*/branches/', '', url, 1)
             return p.dirname(url)
@@ -116,10 +571,13 @@ class Repo(object):
         else:
             return '?'
 
-    def _status_text(self, optional_path=None):
+    def _status_text(self, optional_path=None, refresh=True):
         """Get buffer text contents for Sstatus
 
-        _status_text(svn.local.LocalClient, str) -> str
+        :refresh: Get the status again instead of reusing the last one. Only
+            pass False if the only thing that changed is staging.
+
+        _status_text(str, bool) -> str
         """
         # TODO: Support status for a directory since svn can be slow retrieving results from server.
 
@@ -135,96 +593,374 @@ class Repo(object):
         # Staged (1)
         # A pythonx/sovereign.py
 
-        def fmt(status):
-            # Print in this style:
-            # M pythonx/sovereign.py
-            return '{} {}'.format(self.status_map[status.type], self._to_svnroot_relative_path(status.name))
-
-        headers = [
-            '\nStaged ({count})',
-            '\nUnstaged ({count})',
-            '\nUntracked ({count})',
-        ]
-        staged, unstaged, untracked = self._get_stage_status_text(fmt, headers)
-        return """Head: {} 
+        headers = ['\n'+ h for h in self.status_headers]
+        staged, unstaged, untracked = self._get_stage_status_text(self.format_status, headers, refresh)
+        return """{}
 {}{}{}
-""".format(self.get_branch(), staged, unstaged, untracked)
+""".format(self.format_head(), staged, unstaged, untracked)
+
+    def format_head(self):
+        return 'Head: {} '.format(self.get_branch())
+
+    def format_status(self, rel_path, code):
+        """Format a status entry for Sstatus.
+
+        format_status(str, int) -> str
+        """
+        # Print in this style:
+        # M pythonx/sovereign.py
+        return '{} {}'.format(self.status_map[code], rel_path)
+
+    def _get_section(self, rel_path, code, staged):
+        """Get which Sstatus section a status entry belongs in.
+
+        :staged: set of svnroot relative paths that are staged.
+
+        _get_section(str, int, set(str)) -> int
+        """
+        if rel_path in staged:
+            return self.STAGED
+        elif code == svn.constants.ST_UNVERSIONED:
+            return self.UNTRACKED
+        else:
+            return self.UNSTAGED
+
+    def _staged_relpaths(self):
+        return set(self._staged_files.values())
+
+    def _relative_entries(self, entries):
+        """Convert status entries to (svnroot relative path, status code).
+
+        svn gives us paths under our root, so we can usually slice off the
+        root instead of resolving each path.
+
+        _relative_entries(iter(localstatus.StatusEntry)) -> iter((str, int))
+        """
+        prefix = self._root_dir + os.sep
+        for status in entries:
+            name = status.name
+            if name.startswith(prefix):
+                yield name[len(prefix):], status.type
+            else:
+                yield self._to_svnroot_relative_path(name), status.type
+
+    def get_status_snapshot(self):
+        """Get the current status of the working copy.
+
+        Only checks the paths that changed when we know which ones did.
+
+        get_status_snapshot() -> snapshot.StatusSnapshot
+        """
+        snap = self._refresh_changed_paths()
+        if snap is None:
+            self._begin_status()
+            snap = snapshot.StatusSnapshot(self._relative_entries(self._status()))
+        self._last_snapshot = snap
+        return snap
+
+    def _refresh_changed_paths(self):
+        """Update the last status with only the paths that were written
+        since (by vim or seen by the watcher).
+
+        Returns None if we need to check the whole tree instead.
+
+        _refresh_changed_paths() -> snapshot.StatusSnapshot or None
+        """
+        if self._last_snapshot is None or self._status_token != self.change_token():
+            # svn changed things (add, revert, update) and it could have
+            # touched anything.
+            return None
+        changed = self._begin_status()
+        if changed is None:
+            return None
+        if not changed:
+            return self._last_snapshot
+        try:
+            return self._status_for_paths(changed)
+        except (svn.exception.SvnException, wcdb.WcDbError):
+            return None
+
+    def _status_for_paths(self, abs_paths):
+        """Get the last status updated with new status for some paths.
+
+        Returns None if we can't tell which paths svn cares about.
+
+        _status_for_paths(set(str)) -> snapshot.StatusSnapshot or None
+        """
+        if not self._wcdb:
+            return None
+        snap = self._last_snapshot
+        prefix = self._root_dir + os.sep
+        rel_paths = set()
+        targets = []
+        for path in abs_paths:
+            if path.startswith(prefix):
+                # Don't resolve symlinks: the link is what's versioned.
+                rel_path = path[len(prefix):]
+            else:
+                rel_path = self._to_svnroot_relative_path(path)
+            if rel_path == '.' or rel_path.split(os.sep, 1)[0] == '.svn':
+                continue
+            parent = p.dirname(rel_path)
+            if parent and not self._wcdb.is_versioned(parent):
+                # Inside an unversioned or ignored directory. svn status only
+                # lists the directory.
+                continue
+            rel_paths.add(rel_path)
+            if p.lexists(path) or self._wcdb.is_versioned(rel_path):
+                targets.append(path)
+            # Otherwise it was unversioned and is gone now.
+
+        entries = []
+        # Directories get their own events for changes to their children, so
+        # don't let svn recurse.
+        for status in self._svn_status(targets, ['--depth', 'empty']):
+            if status.type != svn.constants.ST_IGNORED:
+                entries.append(status)
+        return snap.replace(rel_paths, self._relative_entries(entries))
+
+    def iter_status_sections(self):
+        """Get Sstatus lines for each section as status arrives.
+
+        Yields a list of lines for each section, in the order of
+        status_headers.
+
+        iter_status_sections() -> iter(list(list(str)))
+        """
+        self._begin_status()
+        snap = snapshot.StatusSnapshot()
+        staged = self._staged_relpaths()
+        for chunk in self.iter_status_chunks():
+            entries = list(self._relative_entries(chunk))
+            snap.extend(entries)
+            sections = [[] for h in self.status_headers]
+            for rel_path, code in entries:
+                sections[self._get_section(rel_path, code, staged)].append(self.format_status(rel_path, code))
+            yield sections
+        self._last_snapshot = snap
 
     def request_stage_toggle(self, filepath):
         """Toggle whether input file is staged.
 
         Requires absolute filepaths.
         """
-        assert p.isabs(filepath)
-        if filepath in self._staged_files:
-            self.request_unstage(filepath)
-        else:
-            self.request_stage(filepath)
+        self.request_stage_toggle_files([filepath])
+
+    def request_stage_toggle_files(self, filepaths):
+        """Unstage the staged files and stage the rest.
+
+        request_stage_toggle_files(list(str)) -> None
+        """
+        assert all(p.isabs(f) for f in filepaths)
+        staged = [f for f in filepaths if f in self._staged_files]
+        unstaged = [f for f in filepaths if f not in self._staged_files]
+        if staged:
+            self.request_unstage_files(staged)
+        if unstaged:
+            self.request_stage_files(unstaged)
 
     def request_stage(self, filepath):
         """Stage the input file.
     
         request_stage(str) -> None
         """
-        assert p.isabs(filepath)
-        rel_path = self._to_svnroot_relative_path(filepath)
-        file_status = self._client.status(rel_path)
-        for s in file_status:
-            if s.type == svn.constants.ST_UNVERSIONED:
-                self._client.add(rel_path)
-                break
-        if filepath not in self._staged_files:
-            self._staged_files.append(filepath)
+        self.request_stage_files([filepath])
+
+    def request_stage_files(self, filepaths):
+        """Stage several files with one svn status and at most one svn add.
+
+        request_stage_files(list(str)) -> None
+        """
+        assert all(p.isabs(f) for f in filepaths)
+        to_add = [s.name for s in self._svn_status(filepaths, ['--depth', 'empty'])
+                  if s.type == svn.constants.ST_UNVERSIONED]
+        if to_add:
+            self._modify_working_copy('add', to_add)
+        for f in filepaths:
+            self._staged_files[f] = self._to_svnroot_relative_path(f)
 
     def request_unstage(self, filepath):
         """Remove the input file from staging.
 
-        Throws ValueError if value wasn't staged.
+        Throws KeyError if value wasn't staged.
     
         request_unstage(str) -> None
         """
-        assert p.isabs(filepath)
-        self._staged_files.remove(filepath)
-        rel_path = self._to_svnroot_relative_path(filepath)
-        file_status = self._client.status(rel_path)
-        for s in file_status:
-            if s.type == svn.constants.ST_ADDED:
-                # self._client.revert doesn't exist. Since we're calling svn
-                # directly, use the absolute path.
-                r = self._client.run_command('revert', [filepath])
-                print(r)
-
-    def _get_stage_status(self):
+        if filepath not in self._staged_files:
+            raise KeyError(filepath)
+        self.request_unstage_files([filepath])
+
+    def request_unstage_files(self, filepaths):
+        """Remove files from staging. Files we added when staging them are
+        reverted (with one svn revert for all of them). Ignores files that
+        weren't staged.
+
+        request_unstage_files(list(str)) -> None
+        """
+        assert all(p.isabs(f) for f in filepaths)
+        filepaths = [f for f in filepaths if self._staged_files.pop(f, None) is not None]
+        if not filepaths:
+            return
+        to_revert = [s.name for s in self._svn_status(filepaths, ['--depth', 'empty'])
+                     if s.type == svn.constants.ST_ADDED]
+        if to_revert:
+            self._modify_working_copy('revert', to_revert)
+
+    def _modify_working_copy(self, subcommand, abs_paths):
+        """Run an svn command that changes only the input paths (add,
+        revert).
+
+        Since we know exactly what changed, the next status only needs to
+        check those paths instead of the whole tree.
+
+        _modify_working_copy(str, list(str)) -> None
+        """
+        was_current = self._status_token == self.change_token()
+        for i in range(0, len(abs_paths), _MAX_TARGETS):
+            self._client.run_command(subcommand, abs_paths[i:i+_MAX_TARGETS])
+        # Adding a directory adds everything inside, so we'd need the whole
+        # tree anyway.
+        if was_current and not any(p.isdir(f) for f in abs_paths):
+            self._status_token = self.change_token()
+            self._touched.update(abs_paths)
+
+    def _status(self):
+        """Get the status of all changed paths in the working copy.
+
+        _status() -> list(localstatus.StatusEntry)
+        """
+        entries = self._local_status()
+        if entries is None:
+            entries = list(self._client.status())
+        return entries
+
+    def _local_status(self):
+        """Get the status of all changed paths without running svn status on
+        the whole tree.
+
+        Scans the working copy against wc.db and only asks svn about the
+        paths the scanner isn't sure about. Returns None if wc.db isn't
+        usable.
+
+        _local_status() -> list(localstatus.StatusEntry) or None
+        """
+        if not self._wcdb or not self.use_local_status:
+            return None
+        try:
+            entries, uncertain = localstatus.Scanner(self._root_dir, self._wcdb).scan()
+        except wcdb.WcDbError:
+            return None
+        if uncertain:
+            entries.extend(self._svn_status(uncertain))
+            entries.sort(key=lambda s: s.name)
+        return entries
+
+    def iter_status_chunks(self):
+        """Get the status of all changed paths in the working copy as soon as
+        we have them.
+
+        svn status can take a long time on big trees, so we parse its output
+        as it's written and yield whatever entries we've parsed so far. The
+        local scanner is fast, so it yields everything at once.
+
+        iter_status_chunks() -> iter(list(localstatus.StatusEntry))
+        """
+        entries = self._local_status()
+        if entries is not None:
+            yield entries
+        else:
+            yield from self._iter_svn_status()
+
+    def _popen_svn(self, subcommand, args, stderr):
+        """Start svn without waiting for it so we can read its output as it's
+        produced. Use run_command when you just want the result.
+
+        :stderr: Where errors go. Not a pipe: we only read stdout while svn
+            runs, so svn would block once the pipe filled up.
+
+        _popen_svn(str, list(str), int|file) -> subprocess.Popen
+        """
+        env = os.environ.copy()
+        env['LANG'] = svn.config.CONSOLE_ENCODING
+        return subprocess.Popen(
+            ['svn', '--non-interactive', subcommand] + args,
+            cwd=self._root_dir,
+            env=env,
+            stdout=subprocess.PIPE,
+            stderr=stderr)
+
+    def _iter_svn_status(self):
+        """Run svn status and yield entries as it outputs them.
+
+        _iter_svn_status() -> iter(list(localstatus.StatusEntry))
+        """
+        # svn can warn about lots of things on big trees.
+        errors = tempfile.TemporaryFile()
+        proc = self._popen_svn('status', ['--xml', self._root_dir], stderr=errors)
+        try:
+            parser = xml.etree.ElementTree.XMLPullParser(events=('end',))
+            for data in iter(lambda: proc.stdout.read1(64 * 1024), b''):
+                parser.feed(data)
+                chunk = []
+                for event, elem in parser.read_events():
+                    if elem.tag == 'entry':
+                        chunk.append(_parse_status_entry(elem))
+                        # Don't keep the whole tree in memory.
+                        elem.clear()
+                if chunk:
+                    yield chunk
+            parser.close()
+            if proc.wait() != 0:
+                errors.seek(0)
+                raise svn.exception.SvnException(
+                    "Command failed with ({}): {}\n{}".format(
+                        proc.returncode, proc.args, errors.read().decode('utf8', 'replace')))
+        finally:
+            if proc.poll() is None:
+                proc.kill()
+            proc.stdout.close()
+            errors.close()
+
+    def _svn_status(self, abs_paths, options=()):
+        """Run svn status on several paths with as few svn calls as
+        possible.
+
+        _svn_status(list(str), list(str)) -> list(localstatus.StatusEntry)
+        """
+        entries = []
+        for i in range(0, len(abs_paths), _MAX_TARGETS):
+            xml_txt = self._client.run_command(
+                'status',
+                ['--xml'] + list(options) + abs_paths[i:i+_MAX_TARGETS],
+                do_combine=True)
+            entries.extend(_parse_status_xml(xml_txt))
+        return entries
+
+    def _get_stage_status(self, refresh=True):
         """Get the status repo's staged files.
     
-        _get_stage_status() -> list(str), list(str), list(str)
-        """
-        staged    = []
-        unstaged  = []
-        untracked = []
-        root_len = len(self._root_dir) + 1
-        for status in self._client.status():
-            # status contains absolute paths
-            if status.name in self._staged_files:
-                staged.append(status)
-            elif status.type == svn.constants.ST_UNVERSIONED:
-                untracked.append(status)
-            else:
-                unstaged.append(status)
-
-        return staged, unstaged, untracked
+        _get_stage_status(bool) -> list((str, int)), list((str, int)), list((str, int))
+        """
+        snap = self._last_snapshot
+        if refresh or snap is None:
+            snap = self.get_status_snapshot()
+        sections = ([], [], [])
+        staged = self._staged_relpaths()
+        for rel_path, code in snap:
+            sections[self._get_section(rel_path, code, staged)].append((rel_path, code))
+        return sections
 
 
-    def _get_stage_status_text(self, fmt, headers):
+    def _get_stage_status_text(self, fmt, headers, refresh=True):
         """Get the status repo's staged files.
     
-        _get_stage_status_text() -> str, str, str
+        _get_stage_status_text(callable, list(str), bool) -> str, str, str
         """
-        staged, unstaged, untracked = self._get_stage_status()
+        staged, unstaged, untracked = self._get_stage_status(refresh)
         staged, unstaged, untracked = [
             [headers[i].format(count=len(c))]
-            + [fmt(status)
-               for status in c]
+            + [fmt(rel_path, code)
+               for rel_path, code in c]
             for i,c in enumerate([staged, unstaged, untracked])]
 
         def _join_if_has_files(files):
@@ -235,20 +971,103 @@ class Repo(object):
         return staged, unstaged, untracked
 
 
+    def _commit_diff(self, filepath):
+        """Get the diff to show in the commit message for a staged file.
+        Binary and large files get a one line summary instead.
+
+        _commit_diff(str) -> str
+        """
+        try:
+            size = p.getsize(filepath)
+            with open(filepath, 'rb') as f:
+                is_binary = b'\0' in f.read(_BINARY_CHECK_SIZE)
+        except OSError:
+            # Deleted or a directory. svn knows what to do.
+            return self._unified_diff(filepath, 'BASE', '')
+        if is_binary:
+            summary = 'binary file'
+        elif size > _MAX_COMMIT_DIFF_SIZE:
+            summary = 'large file ({} bytes)'.format(size)
+        else:
+            return self._unified_diff(filepath, 'BASE', '')
+        rel_path = self._to_svnroot_relative_path(filepath)
+        return 'diff --git a/{0} b/{0}\n# {1}, diff not shown\n'.format(rel_path, summary)
+
+    def get_inline_diff(self, filepath):
+        """Get a file's working copy changes as lines to show under its
+        Sstatus entry. Remembers diffs until the file or the working copy
+        changes.
+
+        get_inline_diff(str) -> list(str)
+        """
+        try:
+            st = os.stat(filepath)
+            signature = (st.st_mtime_ns, st.st_size, st.st_ino)
+        except OSError:
+            # Deleted. Only changes when BASE does.
+            signature = None
+        signature = (signature, self.change_token())
+        cached = self._inline_diffs.get(filepath)
+        if cached and cached[0] == signature:
+            self._inline_diffs.move_to_end(filepath)
+            return cached[1]
+
+        try:
+            diff = self._commit_diff(filepath)
+        except svn.exception.SvnException:
+            if not p.isfile(filepath):
+                raise
+            # Unversioned, so everything is new.
+            try:
+                new_txt = _read_text(filepath)
+            except ValueError:
+                new_txt = ''
+            diff = _git_style_diff('', new_txt, self._to_svnroot_relative_path(filepath), '(nonexistent)', '(working copy)')
+        lines = diff.split('\n')
+        if lines and not lines[-1]:
+            lines.pop()
+        # The entry already says which file it is, so start at the first
+        # hunk like fugitive.
+        for i,line in enumerate(lines):
+            if line.startswith('@@'):
+                lines = lines[i:]
+                break
+        self._inline_diffs[filepath] = (signature, lines)
+        if len(self._inline_diffs) > _MAX_INLINE_DIFFS:
+            self._inline_diffs.popitem(last=False)
+        return lines
+
     def _commit_text(self):
-        def fmt(status):
+        return ''.join(self.iter_commit_text())
+
+    def iter_commit_text(self):
+        """Build the initial commit message in pieces: everything above the
+        diffs first and then each staged file's diff.
+
+        Status, branch, and diffs all run at once and pieces come out as
+        soon as they (and everything before them) are ready.
+
+        iter_commit_text() -> iter(str)
+        """
+        def fmt(rel_path, code):
             # Print in this style:
             #	new file:   pythonx/sovereign.py
-            return '#\t{}:\t{}'.format(status.type_raw_name, self._to_svnroot_relative_path(status.name))
+            return '#\t{}:\t{}'.format(snapshot.raw_name(code), rel_path)
 
         headers = [
             '#\n# Changes to be committed:',
             '#\n# Changes not staged for commit:',
             '#\n# Untracked files:',
         ]
-        staged, unstaged, untracked = self._get_stage_status_text(fmt, headers)
-        diff = "\n".join([self._unified_diff(staged_file, 'HEAD', '') for staged_file in self._staged_files])
-        txt = '''
+        staged_files = sorted(self._staged_files)
+        pool = concurrent.futures.ThreadPoolExecutor(_MAX_DIFF_WORKERS)
+        diffs = []
+        try:
+            status = pool.submit(self._get_stage_status_text, fmt, headers)
+            branch = pool.submit(self.get_branch)
+            diffs = [pool.submit(self._commit_diff, f) for f in staged_files]
+            staged, unstaged, untracked = status.result()
+            yield '''
 # Please enter the commit message for your changes. Lines starting
 # with '#' will be ignored, and an empty message aborts the commit.
 #
@@ -257,17 +1076,42 @@ class Repo(object):
 # {snip}
 # Do not modify or remove the line above.
 # Everything below it will be ignored.
-{diff}'''.format(
-    branch=self.get_branch(),
+'''.format(
+    branch=branch.result(),
     staged=staged,
     unstaged=unstaged,
     untracked=untracked,
-    diff=diff,
     snip=_SNIP_MARKER,
 )
-        return txt
+            for i,diff in enumerate(diffs):
+                if i > 0:
+                    yield '\n'
+                yield diff.result()
+        finally:
+            # Don't wait for diffs nobody wants anymore. (shutdown's
+            # cancel_futures needs python 3.9.)
+            for f in diffs:
+                f.cancel()
+            pool.shutdown(wait=False)
 
     def _unified_diff(self, full_url_or_path, old, new):
+        if new == '' and p.isabs(full_url_or_path):
+            # Working copy changes, so never cached.
+            d = self._diff_against_pristine(full_url_or_path, old)
+            if d is not None:
+                return d
+        elif str(old).isdigit() and str(new).isdigit() and p.isabs(full_url_or_path):
+            # Diffs between numbered revisions never change.
+            cache, key = self._diff_cache_key(full_url_or_path)
+            if cache:
+                d = cache.get_diff(key, logcache.DIFF_GIT, int(old), int(new))
+                if d is None:
+                    d = self._svn_diff(full_url_or_path, old, new)
+                    cache.store_diffs(key, logcache.DIFF_GIT, [(int(old), int(new), d)])
+                return d
+        return self._svn_diff(full_url_or_path, old, new)
+
+    def _svn_diff(self, full_url_or_path, old, new):
         # self._client.diff() doesn't work since it tries to give us the diff
         # in a list and I don't want to put it back together again.
         d = self._client.run_command(
@@ -280,62 +1124,397 @@ class Repo(object):
         # skip 'Index:' line and '===' line.
         return trim_leading_lines(d, 2)
 
+    def _diff_against_pristine(self, filepath, old):
+        """Diff a working file against BASE without running svn. Uses the
+        pristine store or prefetched BASE contents.
+
+        Returns None if we can't do it locally.
+
+        _diff_against_pristine(str, str) -> str or None
+        """
+        if not p.isfile(filepath):
+            return None
+        rel_path = self._to_svnroot_relative_path(filepath)
+        pristine = self._get_pristine(rel_path, old)
+        # svn translates some files (keywords, eol-style) so their pristine
+        # isn't what svn cat gives us, but we may have prefetched that.
+        cached = None if pristine else self._get_cached_base(rel_path, old)
+        if not (pristine or cached):
+            return None
+        try:
+            if self._wcdb.has_working_layer(rel_path):
+                return None
+        except wcdb.WcDbError:
+            # Probably locked by svn. Let svn deal with it.
+            return None
+        try:
+            if pristine:
+                pristine_file, revision = pristine
+                old_txt = _read_text(pristine_file)
+            else:
+                old_txt, revision = cached
+            new_txt = _read_text(filepath)
+        except (OSError, ValueError):
+            # Missing pristine or not utf8. Let svn deal with it.
+            return None
+        if '\0' in old_txt or '\0' in new_txt:
+            # Binary
+            return None
+        return _git_style_diff(old_txt, new_txt, rel_path, '(revision {})'.format(revision), '(working copy)')
+
+    def _get_cached_base(self, rel_path, revision):
+        """Get BASE contents from the cat cache without running svn.
+
+        _get_cached_base(str, str) -> (str, int) or None
+        """
+        if revision != 'BASE' or not self._wcdb:
+            return None
+        try:
+            cached = self._cat_cache_key(rel_path, revision)
+        except (svn.exception.SvnException, sqlite3.Error):
+            return None
+        if not cached:
+            return None
+        cache, key, number = cached
+        txt = cache.get(key, number)
+        if txt is None:
+            return None
+        return txt, number
+
+    def _get_pristine(self, rel_path, revision):
+        """Get the pristine file path if revision refers to BASE.
+
+        _get_pristine(str, str|int) -> (str, int) or None
+        """
+        if not self._wcdb:
+            return None
+        try:
+            pristine = self._wcdb.pristine(rel_path)
+        except wcdb.WcDbError:
+            return None
+        if pristine is None:
+            return None
+        if revision != 'BASE' and str(revision) != str(pristine[1]):
+            return None
+        return pristine
+
     def commit(self, commit_msg_file):
         """Commit current changes using message from input file-object
 
-        commit(File) -> None
+        commit(File) -> bool, str
+        """
+        message = read_commit_message(commit_msg_file)
+        if message is None:
+            return False, _EMPTY_COMMIT_MSG
+        staged = self.take_staged_files()
+        if not staged:
+            return False, _NOTHING_STAGED
+        try:
+            revision = self.commit_files(message, list(staged))
+        except Exception:
+            self.restore_staged_files(staged)
+            raise
+        return True, 'Committed revision {}.'.format(revision)
+
+    def take_staged_files(self):
+        """Clear staging and get what was staged so it can be committed.
+
+        take_staged_files() -> dict(str, str)
+        """
+        staged = self._staged_files
+        self._staged_files = {}
+        return staged
+
+    def restore_staged_files(self, staged):
+        """Stage files again after a commit failed.
+
+        restore_staged_files(dict(str, str)) -> None
         """
-        commit_msg_lines = commit_msg_file.readlines()
+        self._staged_files.update(staged)
 
-        error_empty_msg = 'Aborting commit due to empty commit message'
+    def commit_files(self, message, filepaths):
+        """Commit files and get the new revision.
 
-        if not commit_msg_lines:
-            return False, error_empty_msg
+        Doesn't touch staging, so it's safe to run in the background.
 
-        for i,line in enumerate(commit_msg_lines):
-            if _SNIP_MARKER in line:
-                commit_msg_lines = commit_msg_lines[:i-1]
-                break
+        commit_files(str, list(str)) -> int or None
+        """
+        if not filepaths:
+            return None
+        filepaths = sorted(filepaths)
+        was_current = self._status_token == self.change_token()
+        out = self._client.run_command('commit', ['-m', message] + filepaths, do_combine=True)
+        # Committing doesn't change anything else unless we committed a
+        # directory.
+        if was_current and not any(p.isdir(f) for f in filepaths):
+            self._status_token = self.change_token()
+            self._touched.update(filepaths)
+        m = _COMMITTED_REVISION.search(out)
+        if m:
+            return int(m.group(1))
+        # svn printed something else (translated?). Committed files are at
+        # the new revision now.
+        try:
+            return self._info(self._to_svnroot_relative_path(filepaths[0]))['entry_revision']
+        except (svn.exception.SvnException, KeyError):
+            return None
+
+    def update(self, filepaths=None, revision=None, on_output=None):
+        """Get latest revision from server
 
-        commit_msg_lines = [line for line in commit_msg_lines if line[0] != '#']
+        Only the paths svn says it changed need new status afterwards. Our
+        log and cat caches only hold numbered revisions, so they're still
+        good.
 
-        if all([line.isspace() for line in commit_msg_lines]):
-            return False, error_empty_msg
+        :filepaths: Paths to update. None updates the whole working copy.
+        :revision: Revision to update to. None means HEAD.
+        :on_output: Called with lists of svn's output lines as they come in.
 
-        message = "".join(commit_msg_lines)
-        self._client.commit(message, self._staged_files)
+        update(list(str), str, callable) -> UpdateResult
+        """
+        args = []
+        if revision:
+            args += ['-r', str(revision)]
+        args += filepaths or []
+        was_current = self._status_token == self.change_token()
+        touched = set()
+        conflicts = []
+        has_deletes = False
+        current_revision = None
+        output = []
+        proc = self._popen_svn('update', args, stderr=subprocess.STDOUT)
+        try:
+            partial = b''
+            for data in iter(lambda: proc.stdout.read1(64 * 1024), b''):
+                lines = (partial + data).split(b'\n')
+                partial = lines.pop()
+                lines = [line.decode('utf8', 'replace').rstrip('\r') for line in lines]
+                for line in lines:
+                    m = _UPDATE_LINE.match(line)
+                    if m:
+                        text, props, lock, tree, path = m.groups()
+                        path = p.join(self._root_dir, path)
+                        touched.add(path)
+                        has_deletes = has_deletes or text == 'D'
+                        if 'C' in (text, props, tree):
+                            conflicts.append(path)
+                        continue
+                    m = _UPDATED_REVISION.match(line)
+                    if m:
+                        current_revision = int(m.group(1))
+                # Keep the end in case it's an error.
+                output = (output + lines)[-20:]
+                if on_output:
+                    on_output(lines)
+            if partial and on_output:
+                on_output([partial.decode('utf8', 'replace')])
+            if proc.wait() != 0:
+                raise svn.exception.SvnException(
+                    "Command failed with ({}): {}\n{}".format(
+                        proc.returncode, proc.args, '\n'.join(output)))
+        finally:
+            if proc.poll() is None:
+                proc.kill()
+            proc.stdout.close()
+            # Incoming changes may be here now, so ask again next time.
+            self.remote_status = None
+            self._remote_checked = None
+            # Deleting a directory removes status we had for things inside,
+            # so we'd need the whole tree anyway.
+            if was_current and not has_deletes:
+                self._status_token = self.change_token()
+                self._touched.update(touched)
+        return UpdateResult(current_revision, conflicts)
+
+    def is_remote_status_due(self, interval):
+        """Whether it's been long enough since we last asked the server
+        what's changed.
+
+        :interval: Seconds between asking.
+
+        is_remote_status_due(float) -> bool
+        """
+        return self._remote_checked is None or time.time() - self._remote_checked >= interval
 
-        # Unfortunately, commit doesn't return anything so we need to lookup
-        # the revision ourselves.
-        first_rel_path = self._to_svnroot_relative_path(self._staged_files[0])
-        log = self._client.log_default(rel_filepath=first_rel_path, limit=1)
-        # Clear staging now that they're submitted.
-        self._staged_files.clear()
-        for line in log:
-            # Return the first (should be only) result.
-            return True, 'Committed revision {}.'.format(line.revision)
+    def get_remote_status(self):
+        """Ask the server what an update would change. This is slow (it
+        goes over the network), so run it in the background.
 
-    def update(self, single_file=None, revision=None):
-        """Get latest revision from server
-    
-        update() -> None
+        We forget the answer once we update to avoid showing changes we
+        already have.
+
+        get_remote_status() -> RemoteStatus
+        """
+        self._remote_checked = time.time()
+        xml_txt = self._client.run_command(
+            'status',
+            ['--xml', '--show-updates', self._root_dir],
+            do_combine=True)
+        revision, incoming = _parse_remote_status_xml(xml_txt)
+        prefix = self._root_dir + os.sep
+        entries = []
+        for name, code in incoming:
+            if name.startswith(prefix):
+                entries.append((name[len(prefix):], code))
+            else:
+                entries.append((self._to_svnroot_relative_path(name), code))
+        self.remote_status = RemoteStatus(revision, entries, self._remote_checked)
+        return self.remote_status
+
+    def format_remote_status(self):
+        """Get the Sstatus lines for incoming changes from our last
+        get_remote_status.
+
+        format_remote_status() -> list(str)
+        """
+        remote = self.remote_status
+        if not remote or not remote.entries:
+            return []
+        lines = ['', self.remote_status_header.format(count=len(remote.entries))]
+        lines += [self.format_status(rel_path, code) for rel_path, code in remote.entries]
+        return lines
+
+    def _get_cat_cache(self, repository_uuid):
+        if self._cat_cache is None:
+            try:
+                self._cat_cache = catcache.CatCache(self.cache_dir or logcache.default_cache_dir(), repository_uuid)
+            except (OSError, sqlite3.Error):
+                self._cat_cache = False
+        return self._cat_cache
+
+    def _cat_cache_key(self, rel_path, revision):
+        """Get where svn cat output for a revision goes in the cat cache.
+
+        svn cat -r N follows the file back from BASE through renames and
+        copies, so what we get is decided by where BASE is (its url and
+        revision) and N. That's all in wc.db, so numbered revisions never
+        need the server until we miss.
+
+        Symbolic revisions are resolved to the revision where the file last
+        changed, so HEAD shares an entry with that numbered revision. That
+        costs an svn info, but it's much cheaper than svn cat.
+
+        _cat_cache_key(str, str|int) -> (catcache.CatCache, str, int) or None
         """
-        if not single_file:
-            single_file = [single_file]
+        info = self._info(rel_path)
+        cache = self._get_cat_cache(info['repository_uuid'])
+        if not cache:
+            return None
+        if self._has_working_layer(rel_path, info):
+            # Copied or replaced, so BASE isn't just what's at our url.
+            return None
+        revision = str(revision)
+        if revision.isdigit():
+            number = int(revision)
+        elif revision == 'BASE':
+            number = info['entry_revision']
+        elif revision in ('HEAD', 'PREV', 'COMMITTED'):
+            number = self._client.info(rel_path=rel_path, revision=revision)['commit_revision']
         else:
-            single_file = []
-        self._client.update(single_file, revision)
+            # Dates could be cached too, but they're rare.
+            return None
+        if number < 1:
+            return None
+        # Old svn doesn't give us relative_url.
+        url = info['relative_url'] or '^' + info['url'][len(info['repository_root']):]
+        key = '{}@{}'.format(url, info['entry_revision'])
+        return cache, key, number
+
+    def _has_working_layer(self, rel_path, info):
+        """Whether a path was added, copied, or replaced in the working copy.
+
+        _has_working_layer(str, dict) -> bool
+        """
+        if self._wcdb:
+            try:
+                return self._wcdb.has_working_layer(rel_path)
+            except wcdb.WcDbError:
+                pass
+        schedule = info.get('wc-info/schedule')
+        return info['entry_revision'] < 1 or schedule not in (None, 'normal')
 
     def _cat_file_unprocessed(self, filepath, revision):
         rel_path = self._to_svnroot_relative_path(filepath)
+        pristine = self._get_pristine(rel_path, revision)
+        if pristine:
+            try:
+                # Same as svn cat output.
+                return _read_text(pristine[0])
+            except (OSError, ValueError):
+                pass
+
+        try:
+            cached = self._cat_cache_key(rel_path, revision)
+        except (svn.exception.SvnException, sqlite3.Error):
+            cached = None
+        if cached:
+            cache, key, number = cached
+            f = cache.get(key, number)
+            if f is not None:
+                return f
+            revision = number
+
         f = self._client.cat(rel_filepath=rel_path, revision=revision)
         # svn.client.cat returns binary output, so it doesn't convert to
         # unicode, but we assume all files we cat will be text files that can
         # be unicode.
         f = f.decode('utf8')
+        if cached:
+            try:
+                cache.put(key, number, f)
+            except (OSError, sqlite3.Error):
+                pass
         # Will have an incorrect trailing space!
         return f
 
+    def get_prefetch_paths(self):
+        """Get files from the last status whose older contents we'll
+        probably want soon (to diff them).
+
+        get_prefetch_paths() -> list(str)
+        """
+        snap = self._last_snapshot
+        if snap is None:
+            return []
+        return [self.relative_to_absolute(rel_path) for rel_path, code in snap if code in _PREFETCH_STATUS]
+
+    def prefetch_contents(self, job, filepaths, revisions=('BASE',), max_size=_MAX_PREFETCH_SIZE):
+        """Load file contents into the cat cache before anyone asks for
+        them so diffs don't wait on svn.
+
+        Fetches in order, so put the files you want most first. BASE
+        contents we can read from the pristine store are skipped since
+        they're already fast.
+
+        prefetch_contents(jobs.Job, list(str), list(str), int) -> None
+        """
+        fetched = [0]
+
+        def fetch(filepath, revision):
+            if job.is_cancelled() or fetched[0] >= max_size:
+                return
+            rel_path = self._to_svnroot_relative_path(filepath)
+            if revision == 'BASE' and self._get_pristine(rel_path, revision):
+                return
+            try:
+                if p.getsize(filepath) > max_size - fetched[0]:
+                    # Probably too big for what's left.
+                    return
+            except OSError:
+                # Deleted. Can't guess.
+                pass
+            try:
+                fetched[0] += len(self._cat_file_unprocessed(filepath, revision))
+            except (svn.exception.SvnException, ValueError):
+                # Not in the repository at that revision or not text. We
+                # only guessed someone would want it.
+                pass
+
+        with concurrent.futures.ThreadPoolExecutor(_MAX_PREFETCH_WORKERS) as pool:
+            for f in [pool.submit(fetch, f, rev) for f in filepaths for rev in revisions]:
+                f.result()
+        job.check_cancelled()
+
     def cat_file(self, filepath, revision):
         f = self._cat_file_unprocessed(filepath, revision)
         # Remove incorrect trailing space character
@@ -363,6 +1542,329 @@ class Repo(object):
             f = f[:-1]
         return f
 
+    def _get_log_cache(self, repository_uuid):
+        if self._log_cache is None:
+            try:
+                self._log_cache = logcache.LogCache(self.cache_dir or logcache.default_cache_dir(), repository_uuid)
+            except (OSError, sqlite3.Error):
+                self._log_cache = False
+        return self._log_cache
+
+    def _svn_log(self, filepath, revision_from, revision_to, limit):
+        """Run svn log with changed paths.
+
+        _svn_log(str, int|str, int|str, int) -> list(logcache.LogEntry)
+        """
+        args = ['--xml', '--verbose', '-r', '{}:{}'.format(revision_from, revision_to)]
+        if limit:
+            args += ['-l', str(limit)]
+        xml_txt = self._client.run_command('log', args + [filepath], do_combine=True)
+        return logcache.parse_log_xml(xml_txt)
+
+    def _log_cache_key(self, info):
+        """Get the log cache and the key for a path in it.
+
+        _log_cache_key(dict) -> (logcache.LogCache, str) or (None, None)
+        """
+        cache = self._get_log_cache(info['repository_uuid'])
+        if not cache:
+            return None, None
+        # Old svn doesn't give us relative_url.
+        key = info['relative_url'] or '^' + info['url'][len(info['repository_root']):]
+        return cache, key
+
+    def _fetch_log(self, cache, key, filepath, newest, oldest, limit):
+        """Run svn log and save the result in the log cache.
+
+        _fetch_log(logcache.LogCache, str, str, int, int, int) -> list(logcache.LogEntry)
+        """
+        entries = self._svn_log(filepath, newest, oldest, limit)
+        if limit and len(entries) >= limit:
+            # Hit the limit, so we only know down to the last one.
+            oldest = entries[-1].revision
+        cache.store(key, entries, oldest, newest)
+        return entries
+
+    def search_log(self, filepath, grep=None, author=None, limit=None):
+        """Find log entries for a file or directory whose message or changed
+        paths contain grep and whose author contains author.
+
+        Searches the log cache. The first search of a path fetches its whole
+        history, after that we only fetch new revisions.
+
+        search_log(str, str, str, int) -> list(logcache.LogEntry)
+        """
+        assert p.isabs(filepath)
+        info = self._info(self._to_svnroot_relative_path(filepath))
+        cache, key = self._log_cache_key(info)
+        if not cache:
+            raise SvnError("Can't search without a log cache. Check g:sovereign_cache_dir.")
+        newest = info['entry_revision']
+        cov = cache.coverage(key)
+        if cov is None or cov.oldest > 1 or newest < cov.oldest:
+            self._fetch_log(cache, key, filepath, newest, 1, None)
+        elif newest > cov.newest:
+            self._fetch_log(cache, key, filepath, newest, cov.newest + 1, None)
+        return cache.search(key, grep, author, limit)
+
+    def get_log(self, filepath, limit=10, revision_from=None, revision_to=None):
+        """Get log entries for a file, newest first.
+
+        Without a range, we get history from the file's BASE revision back
+        like svn log does. Numbered ranges come from the log cache and we
+        only ask svn for revisions we haven't seen yet.
+
+        get_log(str, int, int|str, int|str) -> list(logcache.LogEntry)
+        """
+        assert p.isabs(filepath)
+        if revision_from is None and revision_to is None:
+            revision_from, revision_to = 'BASE', 1
+        elif revision_from is None or revision_to is None:
+            # Same as log_default.
+            revision_from = revision_from or 1
+            revision_to = revision_to or 'HEAD'
+
+        info = self._info(self._to_svnroot_relative_path(filepath))
+        if revision_from == 'BASE':
+            revision_from = info['entry_revision']
+        try:
+            newest = int(revision_from)
+            oldest = int(revision_to)
+        except ValueError:
+            # Symbolic revisions like HEAD need the server to resolve.
+            newest, oldest = 0, 0
+        cache, key = self._log_cache_key(info)
+        if not cache or newest < oldest or oldest < 1:
+            return self._svn_log(filepath, revision_from, revision_to, limit)
+
+        def fetch(hi, lo, count):
+            return self._fetch_log(cache, key, filepath, hi, lo, count)
+
+        cov = cache.coverage(key)
+        if cov is None or newest < cov.oldest:
+            return fetch(newest, oldest, limit)
+        if newest > cov.newest:
+            # Get all of the new ones so the range joins what we have.
+            # Otherwise we'd lose everything older.
+            fetch(newest, cov.newest + 1, None)
+            cov = cache.coverage(key)
+
+        entries = cache.read(key, newest, max(oldest, cov.oldest), limit)
+        if (not limit or len(entries) < limit) and cov.oldest > oldest:
+            # Start from a revision where the file exists or svn can't find
+            # it.
+            start = entries[-1].revision if entries else cov.oldest
+            more = fetch(start, oldest, limit - len(entries) + 1 if limit else None)
+            entries.extend(e for e in more if e.revision < start)
+        return entries
+
+    def _get_log_diffs(self, filepath, entries):
+        """Get the diff for each log entry with one svn log --diff instead of
+        an svn diff for each.
+
+        Returns an empty dict if svn can't (like svn before 1.7, which has no
+        log --diff).
+
+        _get_log_diffs(str, list(logcache.LogEntry)) -> dict(int, str)
+        """
+        if not entries:
+            return {}
+        revisions = [e.revision for e in entries]
+        try:
+            txt = self._client.run_command(
+                'log',
+                ['--diff', '-r', '{}:{}'.format(max(revisions), min(revisions)), filepath],
+                do_combine=True)
+        except svn.exception.SvnException:
+            return {}
+        diffs = _split_log_diff(txt)
+        return {r: diffs[r] for r in revisions if r in diffs}
+
+    def _diff_cache_key(self, filepath):
+        """Get the cache for diffs of a working copy file and its key in it.
+
+        _diff_cache_key(str) -> (logcache.LogCache, str) or (None, None)
+        """
+        try:
+            info = self._info(self._to_svnroot_relative_path(filepath))
+        except svn.exception.SvnException:
+            return None, None
+        return self._log_cache_key(info)
+
+    def get_log_diffs(self, filepath, entries):
+        """Get the diff for each log entry. Diffs we've fetched before come
+        from the log cache.
+
+        We show svn log --diff's output when we can and only use svn diff
+        when svn log can't give us a diff, so a revision always looks the
+        same no matter which command cached it first.
+
+        get_log_diffs(str, list(logcache.LogEntry)) -> dict(int, str)
+        """
+        cache, key = self._diff_cache_key(filepath)
+        diffs = {}
+        if cache:
+            for e in entries:
+                diff = cache.get_diff(key, logcache.DIFF_LOG, e.revision-1, e.revision)
+                if diff is not None:
+                    diffs[e.revision] = diff
+        missing = [e for e in entries if e.revision not in diffs]
+        if missing:
+            fetched = self._get_log_diffs(filepath, missing)
+            if cache:
+                cache.store_diffs(key, logcache.DIFF_LOG, [(revision-1, revision, diff) for revision, diff in fetched.items()])
+            diffs.update(fetched)
+        missing = [e.revision for e in entries if e.revision not in diffs]
+        if missing:
+            # _unified_diff caches these itself.
+            def get_diff(revision):
+                return self._unified_diff(filepath, revision-1, revision)
+            with concurrent.futures.ThreadPoolExecutor(_MAX_DIFF_WORKERS) as pool:
+                diffs.update(zip(missing, pool.map(get_diff, missing)))
+        return {e.revision: diffs[e.revision] for e in entries}
+
+    def format_log_entry(self, entry, diff):
+        """Get the text to show for a log entry.
+
+        format_log_entry(logcache.LogEntry, str) -> str
+        """
+        return '''r{revision}
+Author: {author}
+Date:   {date}
+
+{msg}
+
+{diff}
+            '''.format(
+                revision = entry.revision,
+                author = entry.author,
+                date = format_datetime(entry.date),
+                msg = _prefix_lines(entry.msg, ' '), # prefix to prevent syntax highlight
+                diff = diff,
+            )
+
+    def format_log_summary(self, entry):
+        """Get the one line description of a log entry.
+
+        format_log_summary(logcache.LogEntry) -> str
+        """
+        return _take_first_x_lines(entry.msg, 1)
+
+    def _svn_blame(self, filepath, revision):
+        """Run svn blame for a file at a numbered revision.
+
+        _svn_blame(str, int) -> list((int, str))
+        """
+        xml_txt = self._client.run_command(
+            'blame',
+            ['--xml', '-r', '1:{}'.format(revision), '{}@{}'.format(filepath, revision)],
+            do_combine=True)
+        annotations = []
+        for entry in xml.etree.ElementTree.fromstring(xml_txt).iter('entry'):
+            commit = entry.find('commit')
+            if commit is None:
+                annotations.append((None, ''))
+            else:
+                annotations.append((int(commit.get('revision')), commit.findtext('author') or ''))
+        return annotations
+
+    def _blame_forward(self, filepath, key, old_revision, annotations, revision):
+        """Update blame from an older revision by applying each change to
+        the file since then.
+
+        Returns None if the history doesn't go straight back (like when
+        the file was copied) and we need svn blame.
+
+        _blame_forward(str, str, int, list((int, str)), int) -> list((int, str)) or None
+        """
+        entries = self.get_log(filepath, None, revision, old_revision + 1)
+        # Keys look like ^/trunk/file and changed paths like /trunk/file.
+        repos_path = key[1:]
+        for e in entries:
+            if any(action in ('A', 'R') and changed == repos_path for action, changed in e.changelist):
+                return None
+        diffs = self.get_log_diffs(filepath, entries)
+        for e in reversed(entries):
+            annotations = _apply_diff_to_blame(annotations, diffs[e.revision], (e.revision, e.author))
+            if annotations is None:
+                return None
+        return annotations
+
+    def get_blame(self, filepath, revision='BASE'):
+        """Get the revision and author that last changed each line of a
+        file.
+
+        Blame is saved in the log cache. If we have it for an older
+        revision, we only apply the changes since then instead of running
+        svn blame, which reads the whole history.
+
+        get_blame(str, str|int) -> list((int, str))
+        """
+        rel_path = self._to_svnroot_relative_path(filepath)
+        info = self._info(rel_path)
+        if revision == 'BASE':
+            number = info['entry_revision']
+        elif str(revision).isdigit():
+            number = int(revision)
+        else:
+            number = self._client.info(rel_path=rel_path, revision=revision)['commit_revision']
+        if number < 1:
+            raise SvnError("{} isn't committed yet".format(rel_path))
+
+        cache, key = self._log_cache_key(info)
+        if not cache:
+            return self._svn_blame(filepath, number)
+        annotations = None
+        cached = cache.get_blame(key, number)
+        if cached:
+            cached_revision, annotations = cached
+            if cached_revision == number:
+                return annotations
+            annotations = self._blame_forward(filepath, key, cached_revision, annotations, number)
+        if annotations is None:
+            annotations = self._svn_blame(filepath, number)
+        cache.store_blame(key, number, annotations)
+        return annotations
+
+    def get_working_blame(self, filepath):
+        """Get blame lined up with the working copy file. Lines that aren't
+        committed get (None, '').
+
+        get_working_blame(str) -> list((int, str))
+        """
+        annotations = self.get_blame(filepath, 'BASE')
+        try:
+            working = _split_keepends(_read_text(filepath))
+        except (OSError, ValueError):
+            return annotations
+        base = _split_keepends(self._cat_file_unprocessed(filepath, 'BASE'))
+        if base == working or len(base) != len(annotations):
+            return annotations
+        aligned = [(None, '')] * len(working)
+        matcher = difflib.SequenceMatcher(None, base, working, autojunk=False)
+        for a, b, size in matcher.get_matching_blocks():
+            aligned[b:b+size] = annotations[a:a+size]
+        return aligned
+
+    def format_blame(self, annotations):
+        """Get a line of text for each line's blame.
+
+        format_blame(list((int, str))) -> list(str)
+        """
+        rev_width = max([len(str(rev)) for rev, _ in annotations if rev] or [1])
+        author_width = min(max([len(author) for _, author in annotations] or [0]), 20)
+        width = 1 + rev_width + 1 + author_width
+        if any(rev is None for rev, _ in annotations):
+            width = max(width, len(_NOT_COMMITTED))
+        lines = []
+        for rev, author in annotations:
+            if rev is None:
+                line = _NOT_COMMITTED
+            else:
+                line = 'r{:<{}} {:.{}}'.format(rev, rev_width, author, author_width)
+            lines.append('{:<{}.{}}'.format(line, width, width))
+        return lines
+
     def get_log_text(self, filepath, limit=10, include_diff=True, revision_from=None, revision_to=None):
         """Get log buffer text for log
     
@@ -370,8 +1872,8 @@ class Repo(object):
         """
         assert p.isabs(filepath)
 
-        log = self._client.log_default(
-            rel_filepath = self._to_svnroot_relative_path(filepath),
+        log = self.get_log(
+            filepath,
             limit = limit,
             revision_from = revision_from,
             revision_to = revision_to,
@@ -380,34 +1882,22 @@ class Repo(object):
         full_url_or_path = filepath
 
         if include_diff:
+            diffs = self.get_log_diffs(full_url_or_path, log)
             def get_diff(entry):
-                return self._unified_diff(full_url_or_path, entry.revision-1, entry.revision)
+                return diffs[entry.revision]
         else:
             def get_diff(entry):
                 return ''
         
 
         qf_items = [{
-            'filecontents': '''r{revision}
-Author: {author}
-Date:   {date}
-
-{msg}
-
-{diff}
-            '''.format(
-                revision = entry.revision,
-                author = entry.author,
-                date = format_datetime(entry.date),
-                msg = _prefix_lines(entry.msg, ' '), # prefix to prevent syntax highlight
-                diff = get_diff(entry),
-            ),
+            'filecontents': self.format_log_entry(entry, get_diff(entry)),
             'col': 0,
             'lnum': 0,
             'module': f'r{entry.revision}',
             'nr': 0,
             'pattern': '',
-            'text': _take_first_x_lines(entry.msg, 1),
+            'text': self.format_log_summary(entry),
             'type': '',
             'valid': 1,
             'vcol': 0,
@@ -418,8 +1908,9 @@ Date:   {date}
     def get_buffer_name_for_file(self, filepath, revision):
         assert p.isabs(filepath)
         rel_path = self._to_svnroot_relative_path(filepath)
-        i = self._client.info(rel_path=rel_path, revision=revision)
-        name = i['url']
+        # Only need the url, which doesn't depend on revision (unless the file
+        # moved), so don't ask the server about revision.
+        name = self._info(rel_path)['url']
         colon = name.find(':')
         assert colon > 0, "Expected url always includes a protocol"
         return 'sovereign' + name[colon:]
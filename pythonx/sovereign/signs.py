@@ -0,0 +1,173 @@
+#! /usr/bin/env python3
+
+"""Work out change markers for the sign column.
+
+We compare the BASE text against the buffer's lines ourselves instead of
+running svn diff, so updating as you type is cheap. Once we've matched the
+buffer against BASE, each edit only needs the lines around it matched
+again: everything before it still lines up and everything after it just
+moved.
+
+This module doesn't import vim so it's easy to try out.
+"""
+
+import difflib
+
+
+# Kinds of change. REMOVED goes on the line before the removed lines unless
+# they were at the top of the file (REMOVED_FIRST on line 1).
+ADDED = 'added'
+CHANGED = 'changed'
+REMOVED = 'removed'
+REMOVED_FIRST = 'removed_first'
+
+
+def _changed_range(old_lines, new_lines):
+    """Find the part of two lists that differs.
+
+    Returns where the change starts and where it ends in each list.
+
+    _changed_range(list(str), list(str)) -> int, int, int
+    """
+    start = 0
+    limit = min(len(old_lines), len(new_lines))
+    while start < limit and old_lines[start] == new_lines[start]:
+        start += 1
+    old_end = len(old_lines)
+    new_end = len(new_lines)
+    while old_end > start and new_end > start and old_lines[old_end-1] == new_lines[new_end-1]:
+        old_end -= 1
+        new_end -= 1
+    return start, old_end, new_end
+
+def _match(a, alo, ahi, b, blo, bhi):
+    """Find runs of matching lines between a[alo:ahi] and b[blo:bhi].
+
+    _match(list(str), int, int, list(str), int, int) -> list((int, int, int))
+    """
+    a = a[alo:ahi]
+    b = b[blo:bhi]
+    start, a_end, b_end = _changed_range(a, b)
+    blocks = []
+    if start:
+        blocks.append((alo, blo, start))
+    if start < a_end and start < b_end:
+        matcher = difflib.SequenceMatcher(None, a[start:a_end], b[start:b_end], autojunk=False)
+        for i, j, size in matcher.get_matching_blocks():
+            if size:
+                blocks.append((alo + start + i, blo + start + j, size))
+    if a_end < len(a):
+        blocks.append((alo + a_end, blo + b_end, len(a) - a_end))
+    return blocks
+
+def _matched(blocks):
+    return sum(size for _, _, size in blocks)
+
+def _blocks_to_signs(blocks, a_len, b_len):
+    """Mark the lines between matching runs.
+
+    _blocks_to_signs(list((int, int, int)), int, int) -> dict(int, str)
+    """
+    signs = {}
+    a = b = 0
+    for next_a, next_b, size in blocks + [(a_len, b_len, 0)]:
+        if next_b > b:
+            kind = CHANGED if next_a > a else ADDED
+            for j in range(b, next_b):
+                signs[j+1] = kind
+        elif next_a > a:
+            if b == 0:
+                signs[1] = REMOVED_FIRST
+            else:
+                signs[b] = REMOVED
+        a = next_a + size
+        b = next_b + size
+    return signs
+
+
+class SignTracker(object):
+    """Change markers for one buffer against its BASE text."""
+
+    def __init__(self, base_lines):
+        self._base = base_lines
+        self._lines = None
+        # (BASE index, buffer index, size) for each run of lines that are
+        # the same in both, in order.
+        self._blocks = []
+        # 1-indexed line number -> kind
+        self.signs = {}
+
+    def update(self, lines):
+        """Get the signs for the buffer's current lines.
+
+        update(list(str)) -> dict(int, str)
+        """
+        if self._lines is None:
+            self._blocks = _match(self._base, 0, len(self._base), lines, 0, len(lines))
+        else:
+            start, old_end, new_end = _changed_range(self._lines, lines)
+            if start == old_end and start == new_end:
+                return self.signs
+            if lines == self._base:
+                # Undoing back to BASE is common and old alignments may not
+                # find it, so don't even try.
+                self._blocks = [(0, 0, len(lines))] if lines else []
+            else:
+                self._blocks = self._rematch(lines, start, old_end, new_end)
+        self._lines = lines
+        self.signs = _blocks_to_signs(self._blocks, len(self._base), len(lines))
+        return self.signs
+
+    def _rematch(self, lines, start, old_end, new_end):
+        """Fix up the matching runs after the buffer lines from start to
+        old_end were replaced with the ones from start to new_end.
+
+        _rematch(list(str), int, int, int) -> list((int, int, int))
+        """
+        delta = new_end - old_end
+        before = []
+        after = []
+        for a, b, size in self._blocks:
+            if b + size <= start:
+                before.append((a, b, size))
+            elif b >= old_end:
+                after.append((a, b + delta, size))
+            else:
+                # Keep whatever part of the run the edit didn't touch.
+                if b < start:
+                    before.append((a, b, start - b))
+                if b + size > old_end:
+                    cut = old_end - b
+                    after.append((a + cut, old_end + delta, size - cut))
+        middle = self._match_between(before, after, lines)
+        # The runs next to the edit were lined up for the old lines, and
+        # the edit may have made a better alignment possible (like undoing
+        # an insert that got matched against the wrong copy of a repeated
+        # line). Give them up and match across them while that finds more
+        # matching lines.
+        while before or after:
+            wider_before = before[:-1]
+            wider_after = after[1:]
+            wider = self._match_between(wider_before, wider_after, lines)
+            dropped = before[-1:] + after[:1]
+            if _matched(wider) <= _matched(middle) + _matched(dropped):
+                break
+            before, after, middle = wider_before, wider_after, wider
+        return before + middle + after
+
+    def _match_between(self, before, after, lines):
+        """Match the lines between the last run in before and the first run
+        in after.
+
+        _match_between(list((int, int, int)), list((int, int, int)), list(str)) -> list((int, int, int))
+        """
+        if before:
+            a, b, size = before[-1]
+            alo, blo = a + size, b + size
+        else:
+            alo, blo = 0, 0
+        if after:
+            ahi, bhi = after[0][0], after[0][1]
+        else:
+            ahi, bhi = len(self._base), len(lines)
+        return _match(self._base, alo, ahi, lines, blo, bhi)
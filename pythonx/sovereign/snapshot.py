@@ -0,0 +1,91 @@
+#! /usr/bin/env python3
+
+"""Compact record of a working copy's status.
+
+A status with 100k entries as svn status objects holds 100k absolute paths,
+raw names, and tuples. A StatusSnapshot holds each svnroot-relative path
+once (interned) and the status codes in a byte array.
+"""
+
+import array
+import sys
+
+import svn.constants
+
+
+_RAW_NAMES = {v: k for k, v in svn.constants.STATUS_TYPE_LOOKUP.items()}
+
+def raw_name(code):
+    """Get svn's name for a status code (like 'modified').
+
+    raw_name(int) -> str
+    """
+    return _RAW_NAMES[code]
+
+
+class StatusSnapshot(object):
+    """The changed paths in a working copy and their status codes."""
+
+    __slots__ = ('_paths', '_codes', '_index')
+
+    def __init__(self, entries=()):
+        """
+        :entries: iterable of (svnroot-relative path, status code).
+
+        """
+        self._paths = []
+        self._codes = array.array('B')
+        self._index = {}
+        self.extend(entries)
+
+    def extend(self, entries):
+        """Add (svnroot-relative path, status code) pairs. Paths we already
+        have take the new code.
+
+        extend(iter((str, int))) -> None
+        """
+        for path, code in entries:
+            i = self._index.get(path)
+            if i is None:
+                path = sys.intern(path)
+                self._index[path] = len(self._paths)
+                self._paths.append(path)
+                self._codes.append(code)
+            else:
+                self._codes[i] = code
+
+    def __len__(self):
+        return len(self._paths)
+
+    def __iter__(self):
+        return zip(self._paths, self._codes)
+
+    def __contains__(self, path):
+        return path in self._index
+
+    def __eq__(self, other):
+        return isinstance(other, StatusSnapshot) and self._paths == other._paths and self._codes == other._codes
+
+    def get(self, path, default=None):
+        """Get the status code for a path.
+
+        get(str, int) -> int
+        """
+        i = self._index.get(path)
+        if i is None:
+            return default
+        return self._codes[i]
+
+    def replace(self, paths, entries):
+        """Get a copy with new status for some paths.
+
+        :paths: set of the paths we got new status for. Any that aren't in
+            entries have no changes anymore.
+        :entries: iterable of (svnroot-relative path, status code).
+
+        replace(set(str), iter((str, int))) -> StatusSnapshot
+        """
+        merged = [(path, code) for path, code in self if path not in paths]
+        merged.extend(entries)
+        merged.sort(key=lambda e: e[0])
+        return StatusSnapshot(merged)
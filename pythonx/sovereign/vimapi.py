@@ -1,12 +1,22 @@
 #! /usr/bin/env python3
 
+import bisect
 import collections
+import difflib
 import functools
+import json
 import os
 import os.path as p
+import time
 
 import vim
+import sovereign.jobs as jobs
 import sovereign.repo as repo
+import sovereign.signs as signs
+
+
+# Placeholder text for buffers waiting on a background job.
+_LOADING = 'Loading…'
 
 
 def capture_exception(ex):
@@ -32,6 +42,123 @@ def vim_error_on_fail(func):
     return wrapper
 
 
+def _report_job_error(ex):
+    """Show errors from background jobs.
+
+    We're in a timer callback, so there's no vimscript to catch an echoerr.
+    """
+    capture_exception(ex)
+    vim.command('echohl WarningMsg | echomsg g:sovereign_exception | echohl None')
+    vim.command('unlet g:sovereign_exception')
+
+
+_engine = jobs.Engine(_report_job_error)
+_poll_timer = None
+
+def _start_job(work, on_done=None, on_error=None):
+    """Run work(job) in the background and call on_done(result) on the
+    main thread when it's finished.
+
+    _start_job(callable, callable, callable) -> jobs.Job
+    """
+    global _poll_timer
+    job = _engine.submit(work, on_done, on_error)
+    if _poll_timer is None:
+        _poll_timer = int(vim.eval('timer_start(20, "sovereign#poll_jobs", {"repeat": -1})'))
+    return job
+
+def poll_jobs():
+    """Deliver results from background jobs. Called from a timer."""
+    global _poll_timer
+    if not _engine.poll() and _poll_timer is not None:
+        vim.eval('timer_stop({})'.format(_poll_timer))
+        _poll_timer = None
+
+def _get_valid_buffer(bufnr):
+    """Get a buffer by number if it still exists.
+
+    _get_valid_buffer(int) -> vim.Buffer or None
+    """
+    try:
+        b = vim.buffers[bufnr]
+    except KeyError:
+        return None
+    if b.valid:
+        return b
+    return None
+
+def _in_buffer(bufnr, func):
+    """Wrap func(buffer, ...) as a callback that does nothing if the buffer
+    is gone. Use with job.post().
+
+    _in_buffer(int, callable) -> callable
+    """
+    def wrapper(*args):
+        b = _get_valid_buffer(bufnr)
+        if b:
+            func(b, *args)
+    return wrapper
+
+_buffer_jobs = {}
+def _start_buffer_job(buf, work, on_done):
+    """Fill a buffer in the background.
+
+    Cancels any job that was already filling the buffer so stale results
+    don't overwrite new ones. on_done(buffer, result) isn't called if the
+    buffer is gone.
+
+    _start_buffer_job(vim.Buffer, callable, callable) -> jobs.Job
+    """
+    bufnr = buf.number
+    prev = _buffer_jobs.pop(bufnr, None)
+    if prev:
+        prev.cancel()
+
+    def deliver(result):
+        if _buffer_jobs.get(bufnr) is job:
+            del _buffer_jobs[bufnr]
+        b = _get_valid_buffer(bufnr)
+        if b:
+            on_done(b, result)
+
+    job = _start_job(work, deliver)
+    _buffer_jobs[bufnr] = job
+    return job
+
+def _patch_buffer(buf, lines):
+    """Make the buffer contain lines by only replacing the lines that
+    differ. Avoids resetting the whole buffer, which moves the cursor and
+    makes vim redo syntax for everything.
+
+    _patch_buffer(vim.Buffer, list(str)) -> None
+    """
+    old = buf[:]
+    # Skip the common start and end so the matcher only looks at what
+    # changed.
+    start = 0
+    limit = min(len(old), len(lines))
+    while start < limit and old[start] == lines[start]:
+        start += 1
+    old_end = len(old)
+    new_end = len(lines)
+    while old_end > start and new_end > start and old[old_end-1] == lines[new_end-1]:
+        old_end -= 1
+        new_end -= 1
+    if start == old_end and start == new_end:
+        return
+
+    matcher = difflib.SequenceMatcher(None, old[start:old_end], lines[start:new_end], autojunk=False)
+    # Apply from the bottom up so earlier indexes stay valid.
+    for tag, i1, i2, j1, j2 in reversed(matcher.get_opcodes()):
+        if tag != 'equal':
+            buf[start+i1:start+i2] = lines[start+j1:start+j2]
+
+def _set_loading(buf):
+    buf.options['modifiable'] = True
+    buf[:] = [_LOADING]
+    buf.options['modifiable'] = False
+
+
 @vim_error_on_fail
 def dbg_repo():
     '''Get the current buffer -- for interactive debugging from vim.
@@ -43,15 +170,50 @@ def dbg_repo():
 def clamp(minimum, x, maximum):
     return max(minimum, min(x, maximum))
 
+def _get_option(name, default):
+    """Get a g:sovereign_ option.
+
+    _get_option(str, object) -> object
+    """
+    return vim.vars.get('sovereign_'+ name, default)
+
 repos = {}
 def _get_repo(filepath, buffer):
     try:
         return repos[buffer]
     except KeyError:
         r = repo.get_repo(filepath)
+        r.use_local_status = bool(_get_option('local_status', 1))
+        if _get_option('watch', 0):
+            r.start_watching()
+        cache_dir = _get_option('cache_dir', b'')
+        if cache_dir:
+            r.cache_dir = p.expanduser(cache_dir.decode('utf8'))
         repos[buffer] = r
+        # Writes can change status without touching wc.db.
+        _autocmd('sovereign_write', 'BufWritePost', '*', 'note_write')
         return r
 
+def note_write(filepath):
+    for r in set(repos.values()):
+        if r.owns_path(filepath):
+            r.note_touched(filepath)
+
+_not_in_svn = set()
+def _get_repo_if_svn(filepath, buffer):
+    """Like _get_repo, but returns None for files outside svn and remembers
+    that so we don't search for .svn again.
+
+    _get_repo_if_svn(str, vim.Buffer) -> repo.Repo or None
+    """
+    if filepath in _not_in_svn:
+        return None
+    try:
+        return _get_repo(filepath, buffer)
+    except repo.SvnError:
+        _not_in_svn.add(filepath)
+        return None
+
 tempfile_to_repo = {}
 def _get_repo_for_tempfile(temp_filepath):
     # Use realpath to ensure this key will match the input one.
@@ -89,6 +251,12 @@ def _map(mode, key, funcname, *args, **kwargs):
     # 1-indexing.)
     vim.command('''{}noremap <buffer> {} :<C-u>call pyxeval(printf("sovereignapi.{}(%i, '%s'{})", line(".")-1, getline(".")))<CR>'''.format(mode, key, funcname, args))
 
+def _map_visual(key, funcname, *args, **kwargs):
+    args = _func_args(args, kwargs)
+    # passes (first, last, ...) to funcname. They're the 0-index line numbers
+    # of the first and last selected lines.
+    vim.command('''xnoremap <buffer> {} :<C-u>call pyxeval(printf("sovereignapi.{}(%i, %i{})", line("'<")-1, line("'>")-1))<CR>'''.format(key, funcname, args))
+
 def _autocmd(group, event, pattern, funcname, args=None):
     args = _func_args(args, None)
     vim.command(r'augroup '+ group)
@@ -99,27 +267,37 @@ def _autocmd(group, event, pattern, funcname, args=None):
     vim.command(r'    autocmd {event} {pattern} call pyxeval("sovereignapi.{funcname}(\'". expand("<amatch>:p") {args} ."\')")'.format(**locals()))
     vim.command(r'augroup END')
 
-def _create_scratch_buffer(contents, filetype, originating_filepath, should_stay_open):
-    vim.command('new')
-    vim.command('setlocal buftype=nofile bufhidden=hide noswapfile buflisted')
-    if filetype:
-        vim.command('setfiletype '+ filetype)
-    vim.current.buffer[:] = contents
-    vim.current.buffer.vars['sovereign_originator'] = originating_filepath
-    bufnr = vim.eval('bufnr()')
-    if not should_stay_open:
-        vim.command('close')
-    return bufnr
-
 
 # statusline {{{1
 
+# How often (seconds) to check whether a repo's branch changed.
+_BRANCH_CHECK_INTERVAL = 1
+_branch_checked = {}
+_branch_jobs = {}
+
 @vim_error_on_fail
 def get_branch(filepath):
-    r = _get_repo(filepath, vim.current.buffer)
+    """Store the branch for filepath's repo in g:sovereign_returnvalue.
+
+    Called from the statusline, so it only reads the branch from memory. If
+    it's been a while, the repo checks whether its branch changed in the
+    background and we redraw if it did.
+    """
     branch = '--'
+    r = _get_repo_if_svn(filepath, vim.current.buffer)
     if r:
-        branch = r.get_branch()
+        branch = r.peek_branch() or branch
+        now = time.monotonic()
+        if r not in _branch_jobs and now - _branch_checked.get(r, 0) > _BRANCH_CHECK_INTERVAL:
+            _branch_checked[r] = now
+            def on_done(result):
+                del _branch_jobs[r]
+                if result != branch:
+                    vim.command('redrawstatus!')
+            def on_error(ex):
+                del _branch_jobs[r]
+                _report_job_error(ex)
+            _branch_jobs[r] = _start_job(lambda job: r.get_branch(), on_done, on_error)
     vim.vars['sovereign_returnvalue'] = branch
 
 
@@ -133,9 +311,10 @@ def setup_buffer_status(filepath):
         return None
     
     b = vim.current.buffer
-    _set_buffer_text_status(b, r)
+    _set_loading(b)
+    _set_buffer_text_status(b, r, after=lambda b: _start_prefetch(b, r))
 
-    _autocmd('sovereign', 'BufEnter', '<buffer>', 'status_refresh')
+    _autocmd('sovereign', 'BufEnter', '<buffer>', 'status_refresh_if_changed')
 
     # Copying the interface from fugitive so it's familiar to fugitive users
     # (like me).
@@ -154,6 +333,9 @@ def setup_buffer_status(filepath):
     _map('n', 's',     'status_stage_unstage') # my remap. more useful than separate stage/unstage.
     _map('n', '-',     'status_stage_unstage')
     _map('n', 'a',     'status_stage_unstage')
+    _map_visual('s',   'status_stage_unstage_range')
+    _map_visual('-',   'status_stage_unstage_range')
+    _map_visual('a',   'status_stage_unstage_range')
     # _map('n', 'u',           'unstage')
 
     _map('n', 'R',           'status_refresh')
@@ -161,12 +343,12 @@ def setup_buffer_status(filepath):
     # _map('n', '.',           'edit_from_cmdline')
 
     # _map('n', 'p',           'GF_pedit')
-    # _map('n', '<',           'InlineDiff_hide')
-    # _map('n', '>',           'InlineDiff_show')
-    # _map('n', '=',           'InlineDiff_toggle')
+    _map('n', '<',           'inline_diff_hide')
+    _map('n', '>',           'inline_diff_show')
+    _map('n', '=',           'inline_diff_toggle')
 
-    # _map('n', 'J',           'jump_to_next_hunk')
-    # _map('n', 'K',           'jump_to_prev_hunk')
+    _map('n', 'J',           'jump_to_next_hunk')
+    _map('n', 'K',           'jump_to_prev_hunk')
     # _map('n', 'i',           'next_item_no_expand')
     # _map('n', ']/',          'next_item')
     # _map('n', '[/',          'PreviousFile')
@@ -183,13 +365,89 @@ def setup_buffer_status(filepath):
     return None
 
 
-def _set_buffer_text_status(buf, repo):
-    buf.options['modifiable'] = True
-    buf[:] = repo._status_text().split('\n')
-    buf.options['modifiable'] = False
+def _set_buffer_text_status(buf, repo, refresh=True, after=None):
+    """Fill a Sstatus buffer in the background.
+
+    :after: Called with the buffer once it's filled.
+
+    _set_buffer_text_status(vim.Buffer, repo.Repo, bool, callable) -> None
+    """
     buf.options['bufhidden'] = 'delete'
     buf.vars['sovereign_type'] = 'index'
 
+    if buf[:] == [_LOADING]:
+        # Nothing to look at yet, so show results as they come in.
+        _stream_buffer_text_status(buf, repo, after)
+        return
+
+    diffs = _status_diffs.setdefault(buf.number, _StatusDiffs())
+    expanded = set(diffs.expanded)
+
+    def on_done(b, result):
+        lines, diffs.ranges, diffs.hunks = result
+        b.options['modifiable'] = True
+        _patch_buffer(b, lines)
+        b.options['modifiable'] = False
+        _set_status_folds(b, diffs.ranges)
+        _update_remote_status(b, repo)
+        if after:
+            after(b)
+
+    _start_buffer_job(buf, lambda job: _status_lines_with_diffs(repo, refresh, expanded), on_done)
+
+def _stream_buffer_text_status(buf, repo, after=None):
+    """Fill a Sstatus buffer as status entries arrive.
+
+    Shows every section while we're loading and appends entries to their
+    section. Once we have everything, empty sections are removed so the
+    result matches _status_text().
+    """
+    headers = repo.status_headers
+    counts = [0] * len(headers)
+
+    def header_index(section):
+        # Head line, then each section is a blank line, header, and entries.
+        return 2 + sum(counts[i] + 2 for i in range(section))
+
+    def on_head(b, head):
+        lines = [head]
+        for h in headers:
+            lines += ['', h.format(count=0)]
+        b.options['modifiable'] = True
+        b[:] = lines + ['', '']
+        b.options['modifiable'] = False
+
+    def on_chunk(b, sections):
+        b.options['modifiable'] = True
+        for i,lines in enumerate(sections):
+            if lines:
+                h = header_index(i)
+                end = h + 1 + counts[i]
+                b[end:end] = lines
+                counts[i] += len(lines)
+                b[h] = headers[i].format(count=counts[i])
+        b.options['modifiable'] = False
+
+    def on_done(b, _):
+        b.options['modifiable'] = True
+        for i in reversed(range(len(headers))):
+            if counts[i] == 0:
+                h = header_index(i)
+                del b[h-1:h+1]
+        b.options['modifiable'] = False
+        _update_remote_status(b, repo)
+        if after:
+            after(b)
+
+    bufnr = buf.number
+    def work(job):
+        job.post(_in_buffer(bufnr, on_head), repo.format_head())
+        for sections in repo.iter_status_sections():
+            job.check_cancelled()
+            job.post(_in_buffer(bufnr, on_chunk), sections)
+
+    _start_buffer_job(buf, work, on_done)
+
 def change_item_no_expand(linenum, line, direction):
     num_buf_lines = len(vim.current.buffer)
     i = linenum + direction
@@ -212,13 +470,25 @@ def _get_abs_filepath_from_line(line, r):
     rel_path = line[file_start+1:]
     return r.relative_to_absolute(rel_path)
 
+def _get_abs_filepath_at(linenum, line, r):
+    """Get the file for a Sstatus line. Lines in an inline diff belong to
+    the entry above them.
+
+    _get_abs_filepath_at(int, str, Repo) -> str
+    """
+    diffs = _status_diffs.get(vim.current.buffer.number)
+    found = diffs and diffs.find_entry(linenum)
+    if found:
+        return found[1]
+    return _get_abs_filepath_from_line(line, r)
+
 def edit(linenum, line, how):
     """Edit the file in the previous window.
 
     edit(int, str, str) -> None
     """
     r = repos[vim.current.buffer]
-    filepath = _get_abs_filepath_from_line(line, r)
+    filepath = _get_abs_filepath_at(linenum, line, r)
     vim.command('wincmd p')
     vim.command(how +' '+ filepath)
 
@@ -246,40 +516,360 @@ def diff_item(linenum, line, manage_win):
     # vim.command('resize') # full height
     vim.command('Sdiff')
 
+def _get_abs_filepaths_from_lines(first, last, r):
+    """Get the files listed on a range of Sstatus lines. A header means
+    every file in its block.
+
+    _get_abs_filepaths_from_lines(int, int, Repo) -> list(str)
+    """
+    b = vim.current.buffer
+    diffs = _status_diffs.get(b.number) or _StatusDiffs()
+    filepaths = []
+    i = first
+    while i <= last and i < len(b):
+        line = b[i]
+        found = diffs.find_entry(i)
+        i += 1
+        if found:
+            # In an inline diff.
+            filepaths.append(found[1])
+            continue
+        if not line or line.isspace():
+            continue
+        if _is_incoming_header(line, r):
+            # Nothing to stage in there.
+            break
+        is_header = line[1] != ' '
+        if is_header:
+            # Get everything in block
+            while i < len(b):
+                found = diffs.find_entry(i)
+                if found:
+                    # Entries with their diff showing. Diffs can have blank
+                    # lines, so only stop at blank lines outside them.
+                    if found[0] == i:
+                        filepaths.append(found[1])
+                elif not b[i]:
+                    break
+                else:
+                    filepaths.append(_get_abs_filepath_from_line(b[i], r))
+                i += 1
+        else:
+            filepaths.append(_get_abs_filepath_from_line(line, r))
+    # Remove duplicates but keep order.
+    return list(dict.fromkeys(filepaths))
+
+class _StatusDiffs(object):
+    """Diffs shown under entries in a Sstatus buffer."""
+
+    def __init__(self):
+        # Absolute paths of entries showing their diff.
+        self.expanded = set()
+        # (entry line, last diff line, absolute path) for each diff in the
+        # buffer, in order.
+        self.ranges = []
+        # Line of each hunk header in the buffer, in order.
+        self.hunks = []
+
+    def find_entry(self, linenum):
+        """Get the entry whose diff includes a line.
+
+        find_entry(int) -> (int, str) or None
+        """
+        i = bisect.bisect_right(self.ranges, (linenum, float('inf'))) - 1
+        if i >= 0:
+            entry, last, filepath = self.ranges[i]
+            if linenum <= last:
+                return entry, filepath
+        return None
+
+# bufnr -> _StatusDiffs
+_status_diffs = {}
+
+def _is_status_entry(line):
+    return bool(line) and not line.isspace() and line[1:2] == ' '
+
+def _status_lines_with_diffs(r, refresh, expanded):
+    """Get Sstatus lines with diffs under the expanded entries. Doesn't
+    touch vim so it can run in a job.
+
+    Also finds where each diff and hunk ended up so we don't have to
+    search the buffer for them later.
+
+    _status_lines_with_diffs(repo.Repo, bool, set(str)) -> list(str), list((int, int, str)), list(int)
+    """
+    lines = r._status_text(refresh=refresh).split('\n')
+    ranges = []
+    hunks = []
+    if not expanded:
+        return _with_remote_status(lines, r), ranges, hunks
+    out = []
+    for line in lines:
+        out.append(line)
+        if not _is_status_entry(line):
+            continue
+        filepath = _get_abs_filepath_from_line(line, r)
+        if filepath not in expanded or p.isdir(filepath):
+            continue
+        entry = len(out) - 1
+        for d in r.get_inline_diff(filepath):
+            if d.startswith('@@'):
+                hunks.append(len(out))
+            out.append(d)
+        if len(out) - 1 > entry:
+            ranges.append((entry, len(out) - 1, filepath))
+    return _with_remote_status(out, r), ranges, hunks
+
+def _set_status_folds(b, ranges):
+    """Fold each inline diff (open) so zc hides it.
+
+    _set_status_folds(vim.Buffer, list((int, int, str))) -> None
+    """
+    cmds = ['setlocal foldmethod=manual', 'normal! zE']
+    cmds += ['{},{}fold'.format(entry + 2, last + 1) for entry, last, _ in ranges]
+    cmds.append('normal! zR')
+    for w in vim.windows:
+        if w.buffer == b:
+            winid = vim.eval('win_getid({})'.format(w.number))
+            vim.eval('win_execute({}, {})'.format(winid, json.dumps(cmds)))
+
+def _set_inline_diff(linenum, line, show):
+    """Show or hide the diff for the entry on a line or whose diff includes
+    the line. show=None toggles.
+
+    _set_inline_diff(int, str, bool) -> None
+    """
+    b = vim.current.buffer
+    r = repos[b]
+    diffs = _status_diffs.setdefault(b.number, _StatusDiffs())
+    found = diffs.find_entry(linenum)
+    if found:
+        entry, filepath = found
+    elif _is_status_entry(line):
+        entry, filepath = linenum, _get_abs_filepath_from_line(line, r)
+    else:
+        return
+    if show is None:
+        show = filepath not in diffs.expanded
+    if show:
+        diffs.expanded.add(filepath)
+    else:
+        diffs.expanded.discard(filepath)
+        # Stay on the entry instead of wherever its diff used to be.
+        vim.current.window.cursor = (entry + 1, 0)
+    # Staging is the only thing that could have changed, so reuse the last
+    # status.
+    _set_buffer_text_status(b, r, refresh=False)
+
+def inline_diff_show(linenum, line):
+    _set_inline_diff(linenum, line, True)
+
+def inline_diff_hide(linenum, line):
+    _set_inline_diff(linenum, line, False)
+
+def inline_diff_toggle(linenum, line):
+    _set_inline_diff(linenum, line, None)
+
+def _jump_to_hunk(linenum, direction):
+    hunks = _status_diffs.get(vim.current.buffer.number, _StatusDiffs()).hunks
+    if direction > 0:
+        i = bisect.bisect_right(hunks, linenum)
+    else:
+        i = bisect.bisect_left(hunks, linenum) - 1
+    if 0 <= i < len(hunks):
+        vim.current.window.cursor = (hunks[i] + 1, 0)
+
+def jump_to_next_hunk(linenum, line):
+    _jump_to_hunk(linenum, 1)
+
+def jump_to_prev_hunk(linenum, line):
+    _jump_to_hunk(linenum, -1)
+
 def status_stage_unstage(linenum, line):
+    status_stage_unstage_range(linenum, linenum)
+
+def status_stage_unstage_range(first, last):
     r = repos[vim.current.buffer]
-    is_valid = line and not line.isspace()
-    if not is_valid:
+    filepaths = _get_abs_filepaths_from_lines(first, last, r)
+    if not filepaths:
         return
-    
-    is_header = line[1] != ' '
-    if is_header:
-        # Get everything in block
-        try:
-            i = linenum + 1
-            while not line.isspace():
-                line = vim.current.buffer[i]
-                print('|' + line)
-                r.request_stage_toggle(_get_abs_filepath_from_line(line, r))
-                i += 1
-        except IndexError:
-            pass
-    else:
-        r.request_stage_toggle(_get_abs_filepath_from_line(line, r))
+    r.request_stage_toggle_files(filepaths)
     _set_buffer_text_status(vim.current.buffer, r)
 
 
 def status_refresh(*_):
     r = repos[vim.current.buffer]
+    # Check everything in case something changed that we didn't notice.
+    r.forget_status()
     _set_buffer_text_status(vim.current.buffer, r)
 
+def status_refresh_if_changed(*_):
+    """Only get status again if something changed. Use R to force a
+    refresh after changing files outside of vim (unless g:sovereign_watch
+    is on).
+    """
+    b = vim.current.buffer
+    r = repos[b]
+    if b.number in _buffer_jobs:
+        return
+    # Staging may have changed from another buffer, so re-render even if
+    # status didn't change. That's cheap since we reuse the last status.
+    _set_buffer_text_status(b, r, refresh=not r.is_status_current())
+
+_prefetch_jobs = {}
+
+def _start_prefetch(b, r):
+    """Load the older contents of modified files in Sstatus in the
+    background so diffing (dd) or committing (c) doesn't wait on svn.
+    Starts with the file under the cursor.
+
+    _start_prefetch(vim.Buffer, repo.Repo) -> None
+    """
+    if not _get_option('prefetch', 0):
+        return
+    revisions = ['BASE']
+    if _get_option('prefetch_head', 0):
+        revisions.append('HEAD')
+    filepaths = r.get_prefetch_paths()
+    if not filepaths:
+        return
+    for w in vim.windows:
+        if w.buffer == b:
+            line = b[w.cursor[0] - 1]
+            if line and not line.isspace() and line[1:2] == ' ':
+                cursor_file = _get_abs_filepath_from_line(line, r)
+                if cursor_file in filepaths:
+                    filepaths.remove(cursor_file)
+                    filepaths.insert(0, cursor_file)
+            break
+
+    cancel_prefetch(b.number)
+    _prefetch_jobs[b.number] = _start_job(lambda job: r.prefetch_contents(job, filepaths, revisions))
+    vim.command('augroup sovereign_prefetch')
+    vim.command('    au! * <buffer={}>'.format(b.number))
+    vim.command('    autocmd BufDelete <buffer={0}> call pyxeval("sovereignapi.cancel_prefetch({0})")'.format(b.number))
+    vim.command('augroup END')
+
+def cancel_prefetch(bufnr):
+    job = _prefetch_jobs.pop(bufnr, None)
+    if job:
+        job.cancel()
+
+def _get_status_buffers(r):
+    """Get every Sstatus buffer showing a repo.
+
+    _get_status_buffers(repo.Repo) -> list(vim.Buffer)
+    """
+    return [b for b, buf_repo in list(repos.items())
+            if buf_repo is r and b.valid and b.vars.get('sovereign_type') == b'index']
+
+def _refresh_status_buffers(r):
+    """Update every Sstatus buffer showing a repo.
+
+    _refresh_status_buffers(repo.Repo) -> None
+    """
+    for b in _get_status_buffers(r):
+        _set_buffer_text_status(b, r)
+
+_REMOTE_SIGN_GROUP = 'sovereign_remote'
+# repo.Repo -> jobs.Job asking the server for incoming changes.
+_remote_status_jobs = {}
+_remote_sign_defined = False
+
+def _is_incoming_header(line, r):
+    return line.startswith(r.remote_status_header.split('{')[0])
+
+def _with_remote_status(lines, r):
+    """Replace the incoming changes at the end of Sstatus lines with the
+    last ones we got from the server. Lines without incoming changes come
+    back untouched when there's nothing to add.
+
+    _with_remote_status(list(str), repo.Repo) -> list(str)
+    """
+    remote = r.format_remote_status()
+    end = len(lines)
+    for i,line in enumerate(lines):
+        if _is_incoming_header(line, r):
+            end = i
+            break
+    if end == len(lines) and not remote:
+        return lines
+    lines = lines[:end]
+    while lines and not lines[-1]:
+        lines.pop()
+    return lines + remote + ['']
+
+def _update_remote_status(b, r):
+    """Show what an update would pull in (if g:sovereign_remote_status
+    is on). Shows what we already know right away and asks the server again
+    in the background when it's been long enough.
+
+    _update_remote_status(vim.Buffer, repo.Repo) -> None
+    """
+    minutes = _get_option('remote_status', 0)
+    if not minutes:
+        return
+    _show_remote_status(b, r)
+    if r in _remote_status_jobs or not r.is_remote_status_due(minutes * 60):
+        return
+
+    def on_done(_):
+        _remote_status_jobs.pop(r, None)
+        for b in _get_status_buffers(r):
+            if b.number not in _buffer_jobs:
+                # Otherwise the job filling it will show it.
+                _show_remote_status(b, r)
+
+    def on_error(ex):
+        # We'll try again next interval.
+        _remote_status_jobs.pop(r, None)
+        _report_job_error(ex)
+
+    _remote_status_jobs[r] = _start_job(lambda job: r.get_remote_status(), on_done, on_error)
+
+def _show_remote_status(b, r):
+    """Merge incoming changes into a Sstatus buffer and mark local
+    entries that are out of date with *. Only touches the Incoming section
+    so everything else (and inline diffs) stays where it is.
+
+    _show_remote_status(vim.Buffer, repo.Repo) -> None
+    """
+    b.options['modifiable'] = True
+    _patch_buffer(b, _with_remote_status(b[:], r))
+    b.options['modifiable'] = False
+
+    global _remote_sign_defined
+    if not _remote_sign_defined:
+        _remote_sign_defined = True
+        vim.eval('sign_define("SovereignOutOfDate", {"text": "*", "texthl": "WarningMsg"})')
+    vim.eval('sign_unplace("{}", {{"buffer": {}}})'.format(_REMOTE_SIGN_GROUP, b.number))
+    remote = r.remote_status
+    if not remote:
+        return
+    incoming = set(r.relative_to_absolute(rel_path) for rel_path, _ in remote.entries)
+    diffs = _status_diffs.get(b.number) or _StatusDiffs()
+    place = []
+    for i,line in enumerate(b):
+        if _is_incoming_header(line, r):
+            break
+        found = diffs.find_entry(i)
+        if found and found[0] != i:
+            # Inside an inline diff.
+            continue
+        if _is_status_entry(line) and _get_abs_filepath_from_line(line, r) in incoming:
+            place.append({'buffer': b.number, 'group': _REMOTE_SIGN_GROUP, 'lnum': i + 1, 'name': 'SovereignOutOfDate'})
+    if place:
+        vim.eval('sign_placelist({})'.format(json.dumps(place)))
+
 
 # Sadd {{{1
 
 @vim_error_on_fail
-def stage_file(filepath):
-    r = _get_repo(filepath, vim.current.buffer)
-    r.request_stage(filepath)
+def stage_files(filepaths):
+    if not filepaths:
+        return
+    r = _get_repo(filepaths[0], vim.current.buffer)
+    r.request_stage_files(filepaths)
 
 
 # Scommit {{{1
@@ -289,7 +879,45 @@ def setup_buffer_commit(filepath, commit_msg_filepath):
     r = _get_repo(filepath, vim.current.buffer)
     _set_repo_for_tempfile(commit_msg_filepath, r)
     b = vim.current.buffer
-    b[:] = r._commit_text().split('\n')
+    # First line is for the commit message. Fill the rest as svn finishes.
+    # Text goes in above the placeholder so the user can start typing.
+    b[:] = ['', '# '+ _LOADING]
+    # The first line of text is the empty one we already added. After that,
+    # the partial line at the end of the text so far.
+    pending = [None]
+
+    def insert_lines(b, lines):
+        try:
+            i = b[:].index('# '+ _LOADING)
+            b[i:i] = lines
+        except ValueError:
+            # User removed the placeholder.
+            b.append(lines)
+
+    def on_text(b, text):
+        lines = text.split('\n')
+        if pending[0] is None:
+            lines.pop(0)
+        else:
+            lines[0] = pending[0] + lines[0]
+        pending[0] = lines.pop()
+        insert_lines(b, lines)
+
+    def on_done(b, _):
+        try:
+            i = b[:].index('# '+ _LOADING)
+            b[i] = pending[0] or ''
+        except ValueError:
+            pass
+
+    # Jobs can't touch vim, so get this out here.
+    on_text_in_buffer = _in_buffer(b.number, on_text)
+    def work(job):
+        for text in r.iter_commit_text():
+            job.check_cancelled()
+            job.post(on_text_in_buffer, text)
+
+    _start_buffer_job(b, work, on_done)
     # When buffer is closed, it's deleted because we set bufhidden=delete,
     # BufDelete is fired and BufHidden is not.
     b.options['bufhidden'] = 'delete'
@@ -299,15 +927,97 @@ def setup_buffer_commit(filepath, commit_msg_filepath):
 def on_close_commit_buffer(commit_msg_filepath):
     """Actually trigger the commit.
 
+    Commits go over the network, so they run in the background. Staged
+    files are unstaged while it runs and staged again if it fails.
+
     on_close_commit_buffer(str) -> None
     """
     r = _get_repo_for_tempfile(commit_msg_filepath)
     try:
         with open(commit_msg_filepath, 'r') as f:
-            success, msg = r.commit(f)
-            print(msg)
+            message = repo.read_commit_message(f)
     except FileNotFoundError:
+        message = None
+    if message is None:
         print('Aborting commit due to empty commit message.')
+        return
+    staged = r.take_staged_files()
+    if not staged:
+        print('Nothing staged to commit.')
+        return
+    print('Committing {} files…'.format(len(staged)))
+
+    def on_done(revision):
+        print('Committed revision {}.'.format(revision))
+        # Check the branch right away instead of waiting for the interval.
+        _branch_checked.pop(r, None)
+        vim.command('redrawstatus!')
+        _refresh_status_buffers(r)
+
+    def on_error(ex):
+        r.restore_staged_files(staged)
+        _report_job_error(ex)
+        _refresh_status_buffers(r)
+
+    _start_job(lambda job: r.commit_files(message, list(staged)), on_done, on_error)
+
+
+# Supdate {{{1
+
+@vim_error_on_fail
+def setup_buffer_update(filepath, target, revision):
+    """Run svn update in the background and show its output in the current
+    buffer as it comes in. Conflicts go in the quickfix when it's done.
+
+    Closing the buffer doesn't stop the update: killing svn update leaves
+    the working copy locked.
+
+    setup_buffer_update(str, str, str) -> None
+    """
+    r = _get_repo(filepath, vim.current.buffer)
+    b = vim.current.buffer
+    b.options['bufhidden'] = 'delete'
+    _set_loading(b)
+    bufnr = b.number
+
+    def on_output(b, lines):
+        b.options['modifiable'] = True
+        if b[:] == [_LOADING]:
+            b[:] = lines
+        else:
+            b.append(lines)
+        b.options['modifiable'] = False
+        # Follow the output like tail -f.
+        for w in vim.windows:
+            if w.buffer == b:
+                w.cursor = (len(b), 0)
+
+    def on_done(result):
+        if result.conflicts:
+            vim.vars['sovereign_qf_scratch'] = vim.Dictionary({
+                'title': ':Supdate conflicts',
+                'items': [{'filename': f, 'text': 'conflict'} for f in result.conflicts],
+            })
+            vim.eval('setqflist([], " ", g:sovereign_qf_scratch)')
+            vim.command('unlet g:sovereign_qf_scratch')
+            vim.command('copen')
+            print('Updated to revision {} with {} conflicts.'.format(result.revision, len(result.conflicts)))
+        else:
+            print('Updated to revision {}.'.format(result.revision))
+        _branch_checked.pop(r, None)
+        vim.command('redrawstatus!')
+        _refresh_status_buffers(r)
+
+    def on_error(ex):
+        _report_job_error(ex)
+        _refresh_status_buffers(r)
+
+    def work(job):
+        on_output_in_buffer = _in_buffer(bufnr, on_output)
+        return r.update([target] if target else None, revision or None,
+                        lambda lines: job.post(on_output_in_buffer, lines))
+
+    _start_job(work, on_done, on_error)
 
 
 # Sdiff {{{1
@@ -316,10 +1026,21 @@ def on_close_commit_buffer(commit_msg_filepath):
 def setup_buffer_cat(filepath, revision):
     r = _get_repo(filepath, vim.current.buffer)
     b = vim.current.buffer
-    b[:] = r.cat_file_as_list(filepath, revision)
-    b.options['modifiable'] = False
     b.options['bufhidden'] = 'delete'
-    b.name = r.get_buffer_name_for_file(filepath, revision)
+    _set_loading(b)
+
+    def work(job):
+        return r.cat_file_as_list(filepath, revision), r.get_buffer_name_for_file(filepath, revision)
+
+    def on_done(b, result):
+        lines, name = result
+        b.options['modifiable'] = True
+        b[:] = lines
+        b.options['modifiable'] = False
+        b.name = name
+        vim.command('diffupdate')
+
+    _start_buffer_job(b, work, on_done)
     return None
 
 
@@ -331,42 +1052,339 @@ def setup_buffer_log(filepath, limit, showdiff):
     setup_buffer_log(string, int, int) -> None
     """
     r = _get_repo(filepath, vim.current.buffer)
-    qf_items = r.get_log_text(filepath, limit=limit, include_diff=showdiff)
-    items = []
-
-    old_lazyredraw = vim.options['lazyredraw']
-    for commit in qf_items:
-        # TODO:
-        # * Add svndiff format that's based on diff, but lets you navigate
-        #   revisions? fugitive has 'git' filetype.
-        # * Make navigating the quickfix use the same window like fugitive. Not
-        #   sure how? It uses bufhidden=delete instead of hide.
-        # * Load diff on buffer load instead of buffer creation (to speed up processing).
-        commit['bufnr'] = _create_scratch_buffer(commit['filecontents'].split('\n'), 'diff', filepath, should_stay_open=False)
-
-    vim.options['lazyredraw'] = old_lazyredraw
-
-    qf_what = { 'items': qf_items }
-    qf_what['title'] = ':Slog '+ filepath
-
-    # log == [{
-    # 'filecontents': '\nr9\nauthor dbriscoe Sun, 09 Feb 2020 06:32:54 +0000\n\nfrom vim\n\n\ndiff --git a/hello b/hello\n--- a/hello\t(revision 8)\n+++ b/hello\t(revision 9)\n@@ -1,3 +1,4 @@\n hello\n hi there\n hi again\n+and more content\n\n',
-    # 'col': 0,
-    # 'lnum': 0,
-    # 'module': 9,
-    # 'nr': 0,
-    # 'pattern': '',
-    # 'text': 'from vim\n',
-    # 'type': '',
-    # 'valid': 1,
-    # 'vcol': 0
-    # },
+    title = ':Slog '+ filepath
+    vim.vars['sovereign_qf_scratch'] = vim.Dictionary({
+        'title': title,
+        'items': [{'text': _LOADING, 'valid': 0}],
+    })
+    vim.eval('setqflist([], " ", g:sovereign_qf_scratch)')
+    vim.command('unlet g:sovereign_qf_scratch')
+    qf_id = int(vim.eval('getqflist({"id": 0}).id'))
+    vim.command('copen')
 
-    vim.vars['sovereign_qf_scratch'] = vim.Dictionary(qf_what)
+    global _last_log_pager
+    pager = _LogPager(qf_id, title, r, filepath, limit, showdiff)
+    _log_pagers[qf_id] = pager
+    _last_log_pager = pager
+    pager.request_pages(1)
+
+# Most results to show for a log search.
+_LOG_SEARCH_LIMIT = 1000
+
+@vim_error_on_fail
+def search_log(filepath, grep, author, showdiff):
+    """Show log entries matching grep and author in the quickfix.
+
+    search_log(str, str, str, bool) -> None
+    """
+    r = _get_repo(filepath, vim.current.buffer)
+    terms = []
+    if grep:
+        terms.append('-grep='+ grep)
+    if author:
+        terms.append('-author='+ author)
+    title = ':Slog {} {}'.format(' '.join(terms), filepath)
+    vim.vars['sovereign_qf_scratch'] = vim.Dictionary({
+        'title': title,
+        'items': [{'text': _LOADING, 'valid': 0}],
+    })
     vim.eval('setqflist([], " ", g:sovereign_qf_scratch)')
     vim.command('unlet g:sovereign_qf_scratch')
+    qf_id = int(vim.eval('getqflist({"id": 0}).id'))
     vim.command('copen')
 
+    def on_done(entries):
+        if not entries:
+            print('No matching log entries')
+        # Results aren't consecutive history, so get each diff on its own.
+        _set_log_qf_items(qf_id, title, 'r', r, filepath, entries, 0, showdiff, 1)
+
+    _start_job(lambda job: r.search_log(filepath, grep, author, _LOG_SEARCH_LIMIT), on_done)
+
+@vim_error_on_fail
+def log_more(count):
+    """Add older history to the current Slog quickfix list.
+
+    log_more(int) -> None
+    """
+    qf_id = int(vim.eval('getqflist({"id": 0}).id'))
+    pager = _log_pagers.get(qf_id, _last_log_pager)
+    if pager is None:
+        print('No Slog to continue. Run :Slog first.')
+    elif pager.is_complete:
+        print('Already showing all history.')
+    else:
+        pager.request_pages(count)
+
+# Log entry buffers are named like this and filled when vim loads them.
+_LOG_BUFFER_PREFIX = 'sovereign-log://'
+# Most log entry buffers to keep loaded. Older ones are unloaded and filled
+# again if you go back to them.
+_LOG_BUFFER_POOL_SIZE = 10
+# Fetch diffs for this many entries at once so stepping through the log
+# doesn't need svn for each one.
+_LOG_DIFF_BATCH = 10
+# buffer name -> (repo, filepath, entries, index into entries, showdiff, diff batch size)
+_log_buffers = {}
+# bufnr of loaded log entry buffers, least recently loaded first.
+_log_buffer_pool = collections.OrderedDict()
+
+# qf id -> _LogPager
+_log_pagers = {}
+_last_log_pager = None
+
+class _LogPager(object):
+    """Pages through a file's history for a Slog quickfix list.
+
+    We keep the next page fetched in the background so Slogmore shows it
+    right away.
+    """
+
+    def __init__(self, qf_id, title, r, filepath, page_size, showdiff):
+        self.qf_id = qf_id
+        self.title = title
+        self.r = r
+        self.filepath = filepath
+        self.page_size = page_size
+        self.showdiff = showdiff
+        # Every entry we've shown. Shared with _log_buffers.
+        self.entries = []
+        self.is_complete = False
+        self._wanted = 0
+        self._prefetched = None
+        self._job = None
+
+    def request_pages(self, count):
+        self._wanted += count
+        self._pump()
+
+    def _fetch_page(self, last_revision):
+        """Get the page of history before last_revision (or the first
+        page). Runs in a job.
+
+        _fetch_page(int) -> list(logcache.LogEntry)
+        """
+        if last_revision is None:
+            return self.r.get_log(self.filepath, limit=self.page_size)
+        # Start from the last one we have since the file might not exist
+        # before it.
+        page = self.r.get_log(self.filepath, limit=self.page_size + 1, revision_from=last_revision, revision_to=1)
+        return [e for e in page if e.revision < last_revision]
+
+    def _pump(self):
+        if self._prefetched is not None and self._wanted > 0:
+            page, self._prefetched = self._prefetched, None
+            self._wanted -= 1
+            if len(page) < self.page_size:
+                self.is_complete = True
+                self._wanted = 0
+            self._show(page)
+
+        if self._prefetched is None and self._job is None and not self.is_complete:
+            last_revision = self.entries[-1].revision if self.entries else None
+            def on_done(page):
+                self._job = None
+                self._prefetched = page
+                self._pump()
+            def on_error(ex):
+                self._job = None
+                self._wanted = 0
+                _report_job_error(ex)
+            self._job = _start_job(lambda job: self._fetch_page(last_revision), on_done, on_error)
+
+    def _show(self, page):
+        first = len(self.entries)
+        self.entries.extend(page)
+        title = self.title
+        if not self.is_complete:
+            title += ' (:Slogmore for older)'
+        # Replace the loading item with the first page and append the rest.
+        action = 'r' if first == 0 else 'a'
+        _set_log_qf_items(self.qf_id, title, action, self.r, self.filepath, self.entries, first, self.showdiff, _LOG_DIFF_BATCH)
+
+def _set_log_qf_items(qf_id, title, action, r, filepath, entries, first, showdiff, diff_batch):
+    """Put log entries from first onward in a quickfix list. Their buffers
+    are filled when they're loaded.
+
+    :action: setqflist action.
+    :diff_batch: Number of entries to get diffs for at once when one is
+        loaded. Use 1 when entries aren't consecutive history.
+
+    """
+    # TODO:
+    # * Add svndiff format that's based on diff, but lets you navigate
+    #   revisions? fugitive has 'git' filetype.
+    # * Make navigating the quickfix use the same window like fugitive. Not
+    #   sure how? It uses bufhidden=delete instead of hide.
+    qf_items = []
+    for i in range(first, len(entries)):
+        entry = entries[i]
+        # Name by file and revision so running Slog again reuses buffers.
+        name = '{}{}@{}'.format(_LOG_BUFFER_PREFIX, filepath, entry.revision)
+        _log_buffers[name] = (r, filepath, entries, i, showdiff, diff_batch)
+        qf_items.append({
+            'filename': name,
+            'module': f'r{entry.revision}',
+            'text': r.format_log_summary(entry),
+            'valid': 1,
+        })
+    _autocmd('sovereign_log', 'BufReadCmd', _LOG_BUFFER_PREFIX +'*', 'load_log_buffer')
+
+    qf_what = { 'id': qf_id, 'items': qf_items }
+    qf_what['title'] = title
+
+    vim.vars['sovereign_qf_scratch'] = vim.Dictionary(qf_what)
+    vim.eval(f'setqflist([], "{action}", g:sovereign_qf_scratch)')
+    vim.command('unlet g:sovereign_qf_scratch')
+
+@vim_error_on_fail
+def load_log_buffer(bufname):
+    """Fill a log entry buffer when vim loads it (BufReadCmd).
+
+    load_log_buffer(str) -> None
+    """
+    b = vim.buffers[int(vim.eval('expand("<abuf>")'))]
+    vim.command('setlocal buftype=nofile bufhidden=hide noswapfile nobuflisted')
+    vim.command('setfiletype diff')
+    try:
+        r, filepath, entries, i, showdiff, diff_batch = _log_buffers[bufname]
+    except KeyError:
+        b[:] = ['Unknown log entry. Run :Slog again.']
+        return
+    b.vars['sovereign_originator'] = filepath
+    entry = entries[i]
+    _pool_log_buffer(b.number)
+    if not showdiff:
+        b[:] = r.format_log_entry(entry, '').split('\n')
+        return
+
+    b[:] = r.format_log_entry(entry, _LOADING).split('\n')
+    batch = entries[i:i+diff_batch]
+    def work(job):
+        diff = r.get_log_diffs(filepath, batch)[entry.revision]
+        return r.format_log_entry(entry, diff)
+    def on_done(b, text):
+        _patch_buffer(b, text.split('\n'))
+    _start_buffer_job(b, work, on_done)
+
+def _pool_log_buffer(bufnr):
+    """Track a loaded log entry buffer and unload the oldest ones when
+    there are too many. Visible buffers stay in the pool so we can unload
+    them once they're hidden.
+
+    _pool_log_buffer(int) -> None
+    """
+    _log_buffer_pool.pop(bufnr, None)
+    _log_buffer_pool[bufnr] = None
+    excess = len(_log_buffer_pool) - _LOG_BUFFER_POOL_SIZE
+    for old in list(_log_buffer_pool):
+        if excess <= 0:
+            break
+        if old == bufnr or int(vim.eval(f'len(win_findbuf({old}))')):
+            continue
+        del _log_buffer_pool[old]
+        excess -= 1
+        vim.command(f'silent! bunload {old}')
+
+# Sblame {{{1
+
+# bufnr -> (repo, filepath, annotations)
+_blame_buffers = {}
+
+@vim_error_on_fail
+def setup_buffer_blame(filepath, revision):
+    """Fill the current buffer with blame for filepath. BASE lines up with
+    the working copy so it can scroll with the file.
+
+    setup_buffer_blame(str, str) -> None
+    """
+    r = _get_repo(filepath, vim.current.buffer)
+    b = vim.current.buffer
+    b.options['bufhidden'] = 'delete'
+    b.vars['sovereign_originator'] = filepath
+    _set_loading(b)
+
+    def work(job):
+        if revision == 'BASE':
+            annotations = r.get_working_blame(filepath)
+        else:
+            annotations = r.get_blame(filepath, revision)
+        return annotations, r.format_blame(annotations)
+
+    def on_done(b, result):
+        annotations, lines = result
+        _blame_buffers[b.number] = (r, filepath, annotations)
+        b.options['modifiable'] = True
+        b[:] = lines
+        b.options['modifiable'] = False
+        width = max(len(line) for line in lines) if lines else 1
+        for w in vim.windows:
+            if w.buffer == b:
+                winid = vim.eval('win_getid({})'.format(w.number))
+                vim.eval('win_execute({}, {})'.format(winid, json.dumps(['vertical resize {}'.format(width), 'syncbind'])))
+
+    _start_buffer_job(b, work, on_done)
+
+    _map('n', '<CR>', 'blame_show_revision')
+    _map('n', 'o',    'blame_show_revision')
+    _map('n', 'd',    'blame_diff_revision')
+    return None
+
+def _get_blame_revision(linenum):
+    """Get the repo, file, and revision for a line of a Sblame buffer.
+
+    _get_blame_revision(int) -> (repo.Repo, str, int) or None
+    """
+    try:
+        r, filepath, annotations = _blame_buffers[vim.current.buffer.number]
+        revision = annotations[linenum][0]
+    except (KeyError, IndexError):
+        return None
+    if revision is None:
+        print('Not committed yet')
+        return None
+    return r, filepath, revision
+
+@vim_error_on_fail
+def blame_show_revision(linenum, line):
+    """Show the log entry (with diff) for the revision that last changed a
+    line in the previous window.
+
+    blame_show_revision(int, str) -> None
+    """
+    found = _get_blame_revision(linenum)
+    if not found:
+        return
+    r, filepath, revision = found
+
+    def on_done(entries):
+        entries = [e for e in entries if e.revision == revision]
+        if not entries:
+            print('No log entry for r{}'.format(revision))
+            return
+        # Same buffer Slog uses, so it shares its diffs.
+        name = '{}{}@{}'.format(_LOG_BUFFER_PREFIX, filepath, revision)
+        _log_buffers[name] = (r, filepath, entries, 0, True, 1)
+        _autocmd('sovereign_log', 'BufReadCmd', _LOG_BUFFER_PREFIX +'*', 'load_log_buffer')
+        vim.command('wincmd p')
+        vim.command('edit '+ name)
+
+    _start_job(lambda job: r.get_log(filepath, 1, revision, revision), on_done)
+
+@vim_error_on_fail
+def blame_diff_revision(linenum, line):
+    """Diff the file against the revision that last changed a line.
+
+    blame_diff_revision(int, str) -> None
+    """
+    found = _get_blame_revision(linenum)
+    if not found:
+        return
+    r, filepath, revision = found
+    vim.command('wincmd p')
+    vim.command('Sdiff {} {}'.format(filepath, revision))
+
+
 # Sedit {{{1
 
 @vim_error_on_fail
@@ -377,4 +1395,99 @@ def jump_to_originator():
     except KeyError as e:
         pass
 
+
+# Signs {{{1
+
+_SIGN_GROUP = 'sovereign'
+_SIGN_NAMES = {
+    signs.ADDED: 'SovereignAdded',
+    signs.CHANGED: 'SovereignChanged',
+    signs.REMOVED: 'SovereignRemoved',
+    signs.REMOVED_FIRST: 'SovereignRemovedFirst',
+}
+# bufnr -> (repo, change_token, signs.SignTracker or None without BASE)
+_sign_trackers = {}
+_signs_defined = False
+
+def _define_signs():
+    global _signs_defined
+    if _signs_defined:
+        return
+    _signs_defined = True
+    for name, text, hl in [
+            ('SovereignAdded', '+', 'DiffAdd'),
+            ('SovereignChanged', '!', 'DiffChange'),
+            ('SovereignRemoved', '_', 'DiffDelete'),
+            ('SovereignRemovedFirst', '‾', 'DiffDelete'),
+    ]:
+        vim.eval('sign_define("{}", {{"text": "{}", "texthl": "{}"}})'.format(name, text, hl))
+
+def attach_signs(filepath, bufnr):
+    """Start showing change signs for a buffer. Loads BASE once (again
+    only after svn changes the working copy) and then everything happens
+    in vim.
+
+    attach_signs(str, int) -> None
+    """
+    b = _get_valid_buffer(bufnr)
+    if not b or b.options['buftype']:
+        return
+    r = _get_repo_if_svn(filepath, b)
+    if not r:
+        return
+    token = r.change_token()
+    known = _sign_trackers.get(bufnr)
+    if known and known[0] is r and known[1] == token:
+        # Reloading doesn't fire TextChanged.
+        update_signs(bufnr)
+        return
+    _define_signs()
+    _sign_trackers[bufnr] = (r, token, None)
+    vim.command('augroup sovereign_signs_buffer')
+    vim.command('    au! * <buffer={}>'.format(bufnr))
+    vim.command('    autocmd TextChanged,TextChangedI <buffer={0}> call sovereign#signs_changed({0})'.format(bufnr))
+    vim.command('    autocmd BufUnload <buffer={0}> call pyxeval("sovereignapi.detach_signs({0})")'.format(bufnr))
+    vim.command('augroup END')
+
+    def on_done(base):
+        if _sign_trackers.get(bufnr, (None, None))[1] == token:
+            _sign_trackers[bufnr] = (r, token, signs.SignTracker(base))
+            update_signs(bufnr)
+
+    def on_error(ex):
+        # Not versioned (yet), so nothing to compare against.
+        if _sign_trackers.get(bufnr, (None, None))[1] == token:
+            _sign_trackers[bufnr] = (r, token, None)
+
+    _start_job(lambda job: r.cat_file_as_list(filepath, 'BASE'), on_done, on_error)
+
+def detach_signs(bufnr):
+    _sign_trackers.pop(bufnr, None)
+
+def update_signs(bufnr):
+    """Diff the buffer against BASE and move only the signs that changed.
+
+    update_signs(int) -> None
+    """
+    tracker = _sign_trackers.get(bufnr, (None, None, None))[2]
+    b = _get_valid_buffer(bufnr)
+    if not tracker or not b:
+        return
+    wanted = dict(tracker.update(b[:]))
+    placed = json.loads(vim.eval('json_encode(sign_getplaced({}, {{"group": "{}"}})[0].signs)'.format(bufnr, _SIGN_GROUP)))
+    unplace = []
+    for sign in placed:
+        name = _SIGN_NAMES.get(wanted.get(sign['lnum']))
+        if name == sign['name']:
+            # Already right.
+            del wanted[sign['lnum']]
+        else:
+            unplace.append({'buffer': bufnr, 'group': _SIGN_GROUP, 'id': sign['id']})
+    place = [{'buffer': bufnr, 'group': _SIGN_GROUP, 'lnum': lnum, 'name': _SIGN_NAMES[kind]}
+             for lnum, kind in wanted.items()]
+    if unplace:
+        vim.eval('sign_unplacelist({})'.format(json.dumps(unplace)))
+    if place:
+        vim.eval('sign_placelist({})'.format(json.dumps(place)))
+
 # }}}
@@ -0,0 +1,264 @@
+#! /usr/bin/env python3
+
+"""Track which paths in a working copy changed so status only needs to look
+at those.
+
+On Linux we use inotify (through ctypes so there's nothing to install).
+Elsewhere, or if inotify isn't available, we poll the tree in a background
+thread.
+
+Changes are coalesced per path. Paths that are still changing are held back
+until they settle so we don't ask svn about a file in the middle of a
+build. If too much changes at once (a rename storm, a checkout of another
+branch), we give up tracking paths and tell the caller to do a full status.
+"""
+
+import ctypes
+import ctypes.util
+import errno
+import os
+import os.path as p
+import select
+import struct
+import sys
+import threading
+import time
+
+
+_IN_MODIFY      = 0x00000002
+_IN_CLOSE_WRITE = 0x00000008
+_IN_MOVED_FROM  = 0x00000040
+_IN_MOVED_TO    = 0x00000080
+_IN_CREATE      = 0x00000100
+_IN_DELETE      = 0x00000200
+_IN_DELETE_SELF = 0x00000400
+_IN_MOVE_SELF   = 0x00000800
+_IN_Q_OVERFLOW  = 0x00004000
+_IN_IGNORED     = 0x00008000
+_IN_ONLYDIR     = 0x01000000
+_IN_DONT_FOLLOW = 0x02000000
+_IN_EXCL_UNLINK = 0x04000000
+_IN_ISDIR       = 0x40000000
+
+_WATCH_MASK = (_IN_MODIFY | _IN_CLOSE_WRITE | _IN_MOVED_FROM | _IN_MOVED_TO
+               | _IN_CREATE | _IN_DELETE | _IN_DELETE_SELF | _IN_MOVE_SELF
+               | _IN_ONLYDIR | _IN_DONT_FOLLOW | _IN_EXCL_UNLINK)
+
+# struct inotify_event without the trailing name.
+_EVENT_HEADER = struct.Struct('iIII')
+
+
+def create(root_dir, debounce=0.2, max_changes=2000, poll_interval=5.0):
+    """Watch a working copy with the best method available.
+
+    create(str, float, int, float) -> Watcher
+    """
+    if sys.platform.startswith('linux'):
+        try:
+            return InotifyWatcher(root_dir, debounce, max_changes)
+        except (OSError, AttributeError):
+            pass
+    return PollingWatcher(root_dir, debounce, max_changes, poll_interval)
+
+
+def _walk_dirs(top):
+    for dirpath, dirnames, filenames in os.walk(top):
+        dirnames[:] = [d for d in dirnames if d != '.svn']
+        yield dirpath, filenames
+
+
+class Watcher(object):
+    """Base for watchers. Collects changed paths from a background thread."""
+
+    def __init__(self, root_dir, debounce, max_changes):
+        """
+        :root_dir: The root directory for the svn working copy.
+        :debounce: Seconds a path must be quiet before we report it.
+        :max_changes: More changed paths than this and we stop tracking
+            individual paths.
+
+        """
+        self._root_dir = root_dir
+        self._debounce = debounce
+        self._max_changes = max_changes
+        self._lock = threading.Lock()
+        # path -> time of last change
+        self._changes = {}
+        self._overflowed = False
+        # We can't watch anymore, so every call reports an overflow.
+        self._failed = False
+        self._stop = threading.Event()
+
+    def _record(self, path):
+        with self._lock:
+            if self._overflowed:
+                return
+            self._changes[path] = time.monotonic()
+            if len(self._changes) > self._max_changes:
+                self._record_overflow_locked()
+
+    def _record_overflow(self):
+        with self._lock:
+            self._record_overflow_locked()
+
+    def _record_overflow_locked(self):
+        self._overflowed = True
+        self._changes.clear()
+
+    def has_changes(self):
+        """Whether anything changed since the last take_changes().
+
+        has_changes() -> bool
+        """
+        return self._failed or self._overflowed or bool(self._changes)
+
+    def take_changes(self):
+        """Get the paths that changed and have settled since the last call.
+
+        Returns None if we lost track and the caller needs to check
+        everything.
+
+        take_changes() -> set(str) or None
+        """
+        with self._lock:
+            if self._failed:
+                return None
+            if self._overflowed:
+                self._overflowed = False
+                self._changes.clear()
+                return None
+            cutoff = time.monotonic() - self._debounce
+            ready = {path for path, t in self._changes.items() if t <= cutoff}
+            for path in ready:
+                del self._changes[path]
+            return ready
+
+    def stop(self):
+        self._stop.set()
+
+
+class InotifyWatcher(Watcher):
+    """Watch with Linux's inotify."""
+
+    def __init__(self, root_dir, debounce, max_changes):
+        Watcher.__init__(self, root_dir, debounce, max_changes)
+        self._libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+        self._fd = self._libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self._fd < 0:
+            err = ctypes.get_errno()
+            raise OSError(err, os.strerror(err))
+        self._wd_to_path = {}
+        # Adding watches means walking the whole tree, so do it in the
+        # background too.
+        self._thread = threading.Thread(target=self._run, name='sovereign-inotify', daemon=True)
+        self._thread.start()
+
+    def _add_tree(self, top, record=False):
+        """Watch a directory and everything below it.
+
+        :record: Record everything we find as changed. Use for new directories
+            since files may be created in them before we start watching.
+
+        """
+        for dirpath, filenames in _walk_dirs(top):
+            if record:
+                self._record(dirpath)
+                for name in filenames:
+                    self._record(p.join(dirpath, name))
+            wd = self._libc.inotify_add_watch(self._fd, os.fsencode(dirpath), _WATCH_MASK)
+            if wd < 0:
+                err = ctypes.get_errno()
+                if err == errno.ENOSPC:
+                    # Out of watches (fs.inotify.max_user_watches). We can't
+                    # see everything, so never claim to know what changed.
+                    raise OSError(err, 'Too many directories to watch with inotify')
+                # Probably deleted while we were walking.
+                continue
+            self._wd_to_path[wd] = dirpath
+
+    def _run(self):
+        try:
+            self._add_tree(self._root_dir)
+            while not self._stop.is_set():
+                ready, _, _ = select.select([self._fd], [], [], 0.5)
+                if not ready:
+                    continue
+                try:
+                    data = os.read(self._fd, 64 * 1024)
+                except BlockingIOError:
+                    continue
+                self._handle_events(data)
+        except OSError:
+            self._broken()
+        finally:
+            os.close(self._fd)
+
+    def _broken(self):
+        # Report an overflow forever so callers always do a full status.
+        with self._lock:
+            self._failed = True
+            self._changes.clear()
+
+    def _handle_events(self, data):
+        i = 0
+        while i + _EVENT_HEADER.size <= len(data):
+            wd, mask, cookie, length = _EVENT_HEADER.unpack_from(data, i)
+            i += _EVENT_HEADER.size
+            name = data[i:i+length].rstrip(b'\0')
+            i += length
+
+            if mask & _IN_Q_OVERFLOW:
+                self._record_overflow()
+                continue
+            if mask & _IN_IGNORED:
+                self._wd_to_path.pop(wd, None)
+                continue
+            directory = self._wd_to_path.get(wd)
+            if directory is None:
+                continue
+            if name == b'.svn':
+                # svn's own bookkeeping. Callers check wc.db themselves.
+                continue
+            path = p.join(directory, os.fsdecode(name)) if name else directory
+            if mask & _IN_ISDIR and mask & (_IN_CREATE | _IN_MOVED_TO):
+                self._add_tree(path, record=True)
+            else:
+                self._record(path)
+
+
+class PollingWatcher(Watcher):
+    """Watch by periodically comparing stat data for the whole tree."""
+
+    def __init__(self, root_dir, debounce, max_changes, interval):
+        Watcher.__init__(self, root_dir, debounce, max_changes)
+        self._interval = interval
+        self._thread = threading.Thread(target=self._run, name='sovereign-poll', daemon=True)
+        self._thread.start()
+
+    def _scan(self):
+        """Get stat data for everything in the tree.
+
+        _scan() -> dict(str, (int, int))
+        """
+        state = {}
+        for dirpath, filenames in _walk_dirs(self._root_dir):
+            state[dirpath] = None
+            for name in filenames:
+                path = p.join(dirpath, name)
+                try:
+                    st = os.lstat(path)
+                except OSError:
+                    continue
+                state[path] = (st.st_mtime_ns, st.st_size)
+        return state
+
+    def _run(self):
+        state = self._scan()
+        while not self._stop.wait(self._interval):
+            new_state = self._scan()
+            for path, sig in new_state.items():
+                if state.get(path, 0) != sig:
+                    self._record(path)
+            for path in state.keys() - new_state.keys():
+                self._record(path)
+            state = new_state
@@ -0,0 +1,279 @@
+#! /usr/bin/env python3
+
+"""Read-only access to a working copy's .svn/wc.db.
+
+Subversion 1.7+ keeps all of the working copy metadata in a SQLite database
+at the root of the checkout. Reading it directly lets us answer simple
+questions (what's the url? what revision?) without forking svn and parsing
+its xml.
+
+We never write to wc.db. If the format isn't one we understand, we raise
+WcDbError and callers should fall back to asking svn.
+"""
+
+import os
+import os.path as p
+import pathlib
+import sqlite3
+import threading
+
+
+# PRAGMA user_version for the formats we know how to read:
+#   29: svn 1.7
+#   31: svn 1.8 - 1.14
+# 30 only existed in svn 1.8 prereleases and svn upgrades it on the first
+# write, so we let svn deal with it.
+_SUPPORTED_FORMATS = (29, 31)
+
+# Properties that make svn transform the pristine text before showing it to
+# us. properties is a serialized skel, but it's enough to know whether a name
+# appears in it.
+_UNTRANSLATABLE_PROPS = [
+    b'svn:keywords',
+    b'svn:eol-style',
+    b'svn:special',
+    b'svn:mime-type',
+]
+
+
+class WcDbError(Exception):
+
+    """wc.db is missing or in a format we can't read."""
+
+    def __init__(self, msg):
+        Exception.__init__(self, msg)
+
+
+def to_wc_relpath(rel_path):
+    """Convert an os-style relative path to wc.db's local_relpath.
+
+    wc.db always uses forward slashes and uses '' for the wc root.
+
+    to_wc_relpath(str) -> str
+    """
+    if not rel_path or rel_path == '.':
+        return ''
+    return rel_path.replace(os.sep, '/')
+
+
+class WorkingCopyDb(object):
+    """Read-only view of a working copy's wc.db."""
+
+    def __init__(self, root_dir):
+        """Open the wc.db for the working copy at root_dir.
+
+        Raises WcDbError if there's no wc.db or we don't know its format.
+
+        :root_dir: The root directory for the svn working copy.
+
+        """
+        self._root_dir = root_dir
+        self.path = p.join(root_dir, '.svn', 'wc.db')
+        if not p.isfile(self.path):
+            raise WcDbError("No wc.db in {}".format(root_dir))
+        # sqlite connections can't be shared between threads, so each thread
+        # gets its own.
+        self._local = threading.local()
+
+        try:
+            fmt = self._query_one('PRAGMA user_version')[0]
+        except sqlite3.Error as ex:
+            raise WcDbError("Failed to read {}: {}".format(self.path, ex))
+        if fmt not in _SUPPORTED_FORMATS:
+            raise WcDbError("Unsupported wc.db format {} in {}".format(fmt, self.path))
+        self.format = fmt
+
+    def _connection(self):
+        try:
+            return self._local.connection
+        except AttributeError:
+            uri = pathlib.Path(self.path).as_uri() + '?mode=ro'
+            # svn may be writing while we read. Don't wait long for its lock:
+            # callers fall back to svn if we fail.
+            c = sqlite3.connect(uri, uri=True, timeout=0.5)
+            self._local.connection = c
+            return c
+
+    def _query(self, sql, args=()):
+        try:
+            return self._connection().execute(sql, args).fetchall()
+        except sqlite3.Error as ex:
+            raise WcDbError("Failed to query {}: {}".format(self.path, ex))
+
+    def _query_one(self, sql, args=()):
+        rows = self._query(sql, args)
+        if rows:
+            return rows[0]
+        return None
+
+    def _base_node(self, relpath):
+        """Get the BASE layer (op_depth 0) of a node.
+
+        _base_node(str) -> (str, str, str, int) or None
+        """
+        return self._query_one(
+            '''SELECT r.root, r.uuid, n.repos_path, n.revision
+            FROM nodes n JOIN repository r ON n.repos_id = r.id
+            WHERE n.local_relpath = ? AND n.op_depth = 0''',
+            (relpath,))
+
+    def info(self, rel_path=None):
+        """Get the subset of svn info we can read locally.
+
+        Uses the same keys as svn.local.LocalClient.info() so results are
+        interchangeable. Locally added nodes have no BASE, so we use their
+        nearest versioned ancestor to build the url like svn does.
+
+        Raises WcDbError for unversioned paths so callers get svn's error.
+
+        info(str) -> dict
+        """
+        if not self.is_versioned(rel_path):
+            raise WcDbError("{} is not under version control in {}".format(rel_path, self.path))
+        relpath = to_wc_relpath(rel_path)
+        suffix = []
+        row = self._base_node(relpath)
+        while row is None:
+            if not relpath:
+                raise WcDbError("No BASE node for {} in {}".format(rel_path, self.path))
+            relpath, _, name = relpath.rpartition('/')
+            suffix.insert(0, name)
+            row = self._base_node(relpath)
+
+        root, uuid, repos_path, revision = row
+        parts = [root]
+        if repos_path:
+            parts.append(repos_path)
+        url = '/'.join(parts + suffix)
+        return {
+            'url': url,
+            'relative_url': '^/' + '/'.join(([repos_path] if repos_path else []) + suffix),
+            'repository_root': root,
+            'repository_uuid': uuid,
+            # Added nodes don't have a revision yet.
+            'entry_revision': -1 if suffix else revision,
+        }
+
+    def pristine(self, rel_path):
+        """Find the BASE text of a file in the pristine store.
+
+        Returns None if the file has no BASE or if svn would translate the
+        pristine text (keywords, eol-style, symlinks) or consider it binary.
+        In those cases the pristine doesn't match what svn cat gives us.
+
+        pristine(str) -> (str, int) or None
+        """
+        row = self._query_one(
+            '''SELECT n.checksum, n.revision, n.properties, p.compression
+            FROM nodes n JOIN pristine p ON n.checksum = p.checksum
+            WHERE n.local_relpath = ? AND n.op_depth = 0
+            AND n.presence = 'normal' AND n.kind = 'file' ''',
+            (to_wc_relpath(rel_path),))
+        if row is None:
+            return None
+        checksum, revision, props, compression = row
+        if compression:
+            return None
+        if props and any(prop in props for prop in _UNTRANSLATABLE_PROPS):
+            return None
+        # checksum looks like $sha1$da39a3ee...
+        digest = checksum.rpartition('$')[2]
+        filepath = p.join(self._root_dir, '.svn', 'pristine', digest[:2], digest + '.svn-base')
+        return filepath, revision
+
+    def has_working_layer(self, rel_path):
+        """Whether a node was locally added, deleted, copied, or replaced.
+
+        has_working_layer(str) -> bool
+        """
+        row = self._query_one(
+            'SELECT 1 FROM nodes WHERE local_relpath = ? AND op_depth > 0',
+            (to_wc_relpath(rel_path),))
+        return row is not None
+
+    def is_versioned(self, rel_path):
+        """Whether svn knows about a path (even if it's deleted or missing).
+
+        is_versioned(str) -> bool
+        """
+        row = self._query_one(
+            '''SELECT 1 FROM nodes WHERE local_relpath = ?
+            AND presence IN ('normal', 'incomplete', 'base-deleted') LIMIT 1''',
+            (to_wc_relpath(rel_path),))
+        return row is not None
+
+    def has_pending_work(self):
+        """Whether svn left unfinished work behind (needs svn cleanup).
+
+        has_pending_work() -> bool
+        """
+        return self._query_one('SELECT 1 FROM work_queue LIMIT 1') is not None
+
+    def all_nodes(self):
+        """Get every node in the working copy, ordered so the topmost layer
+        of each node comes last.
+
+        all_nodes() -> list((str, str, int, str, str, str, int, int, bytes, int))
+        """
+        return self._query(
+            '''SELECT local_relpath, parent_relpath, op_depth, presence, kind,
+            checksum, translated_size, last_mod_time, properties, revision
+            FROM nodes ORDER BY local_relpath, op_depth''')
+
+    def actual_nodes(self):
+        """Get local property changes and conflicts.
+
+        Returns (relpath, properties, is_conflicted) for each ACTUAL_NODE row.
+
+        actual_nodes() -> list((str, bytes, bool))
+        """
+        if self.format >= 30:
+            conflict = 'conflict_data IS NOT NULL'
+        else:
+            conflict = '''(conflict_old IS NOT NULL OR conflict_new IS NOT NULL
+            OR conflict_working IS NOT NULL OR prop_reject IS NOT NULL
+            OR tree_conflict_data IS NOT NULL)'''
+        rows = self._query('SELECT local_relpath, properties, {} FROM actual_node'.format(conflict))
+        return [(relpath, props, bool(c)) for relpath, props, c in rows]
+
+    def externals(self):
+        """Get the local_relpath of every external.
+
+        externals() -> list(str)
+        """
+        return [row[0] for row in self._query('SELECT local_relpath FROM externals')]
+
+
+def parse_props(skel):
+    """Parse the serialized properties from a NODES or ACTUAL_NODE row.
+
+    Properties are stored as a skel list of alternating names and values:
+        (12 svn:keywords 2 Id 10 svn:ignore 5 *.o\n)
+
+    parse_props(bytes) -> dict(str, bytes)
+    """
+    if not skel:
+        return {}
+    atoms = []
+    i = 0
+    end = len(skel)
+    while i < end:
+        c = skel[i:i+1]
+        if c in b'() \t\n\r\f':
+            i += 1
+        elif c.isdigit():
+            # Explicit atom: length, one whitespace character, then data.
+            j = i
+            while skel[j:j+1].isdigit():
+                j += 1
+            length = int(skel[i:j])
+            atoms.append(skel[j+1:j+1+length])
+            i = j + 1 + length
+        else:
+            # Implicit atom: runs until whitespace or a paren.
+            j = i
+            while j < end and skel[j:j+1] not in b'() \t\n\r\f':
+                j += 1
+            atoms.append(skel[i:j])
+            i = j
+    return {atoms[k].decode('utf8'): atoms[k+1] for k in range(0, len(atoms) - 1, 2)}
@@ -31,7 +31,7 @@ syn match sovereignHash /\S\@<!\x\{4,\}\S\@!/ contained
 
 syn region sovereignHunk start=/^\%(@@\+ -\)\@=/ end=/^\%([A-Za-z?@]\|$\)\@=/ contains=@sovereignDiff containedin=@sovereignSection fold
 
-for s:section in ['Untracked', 'Unstaged', 'Staged']
+for s:section in ['Untracked', 'Unstaged', 'Staged', 'Incoming']
   exe 'syn region sovereign' . s:section . 'Section start=/^\%(' . s:section . ' .*(\d\+)$\)\@=/ contains=sovereign' . s:section . 'Heading end=/^$/'
   exe 'syn match sovereign' . s:section . 'Modifier /^[MADRCU?] / contained containedin=sovereign' . s:section . 'Section'
   exe 'syn cluster sovereignSection add=sovereign' . s:section . 'Section'
@@ -47,10 +47,12 @@ hi def link sovereignHeading PreProc
 hi def link sovereignUntrackedHeading PreCondit
 hi def link sovereignUnstagedHeading Macro
 hi def link sovereignStagedHeading Include
+hi def link sovereignIncomingHeading Special
 hi def link sovereignModifier Type
 hi def link sovereignUntrackedModifier StorageClass
 hi def link sovereignUnstagedModifier Structure
 hi def link sovereignStagedModifier Typedef
+hi def link sovereignIncomingModifier WarningMsg
 hi def link sovereignInstruction Type
 hi def link sovereignStop Function
 hi def link sovereignHash Identifier
@@ -0,0 +1,88 @@
+#! /usr/bin/env python3
+
+import os
+import os.path as p
+import shutil
+import sys
+import tempfile
+import time
+import unittest
+
+sys.path.insert(0, p.join(p.dirname(p.abspath(__file__)), '..', 'pythonx'))
+
+import sovereign.catcache as catcache
+
+
+class CatCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.cache_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.cache_dir)
+
+    def content_files(self):
+        return [name for _, _, names in os.walk(p.join(self.cache_dir, 'cat')) for name in names]
+
+    def test_get_put(self):
+        cache = catcache.CatCache(self.cache_dir, 'uuid')
+        self.assertIsNone(cache.get('^/trunk/hello', 3))
+        cache.put('^/trunk/hello', 3, 'hello\n')
+        self.assertEqual(cache.get('^/trunk/hello', 3), 'hello\n')
+        self.assertIsNone(cache.get('^/trunk/hello', 4))
+        self.assertIsNone(cache.get('^/trunk/other', 3))
+
+    def test_survives_restart(self):
+        catcache.CatCache(self.cache_dir, 'uuid').put('^/trunk/hello', 3, 'héllo\n')
+        cache = catcache.CatCache(self.cache_dir, 'uuid')
+        self.assertEqual(cache.get('^/trunk/hello', 3), 'héllo\n')
+
+    def test_same_text_stored_once(self):
+        a = catcache.CatCache(self.cache_dir, 'uuid-a')
+        b = catcache.CatCache(self.cache_dir, 'uuid-b')
+        a.put('^/trunk/hello', 3, 'hello\n')
+        a.put('^/trunk/hello', 4, 'hello\n')
+        b.put('^/trunk/hello', 9, 'hello\n')
+        self.assertEqual(len(self.content_files()), 1)
+        self.assertIsNone(b.get('^/trunk/hello', 3))
+        self.assertEqual(b.get('^/trunk/hello', 9), 'hello\n')
+
+    def test_memory_limit(self):
+        cache = catcache.CatCache(self.cache_dir, 'uuid', max_memory=10)
+        cache.put('^/a', 1, 'aaaaaa')
+        cache.put('^/b', 1, 'bbbbbb')
+        self.assertLessEqual(cache._memory_size, 10)
+        # Still on disk.
+        self.assertEqual(cache.get('^/a', 1), 'aaaaaa')
+
+    def test_hits_written_in_batches(self):
+        cache = catcache.CatCache(self.cache_dir, 'uuid')
+        cache.put('^/a', 1, 'a')
+
+        def last_used():
+            return cache._connection().execute('SELECT last_used FROM contents').fetchone()[0]
+
+        before = last_used()
+        time.sleep(0.01)
+        cache.get('^/a', 1)
+        self.assertEqual(last_used(), before)
+        cache.flush()
+        self.assertGreater(last_used(), before)
+
+    def test_prune_least_recently_used(self):
+        cache = catcache.CatCache(self.cache_dir, 'uuid', max_disk=25)
+        cache.put('^/a', 1, 'a' * 10)
+        time.sleep(0.01)
+        cache.put('^/b', 1, 'b' * 10)
+        time.sleep(0.01)
+        cache.get('^/a', 1)
+        time.sleep(0.01)
+        cache.put('^/c', 1, 'c' * 10)
+        self.assertIsNone(cache.get('^/b', 1))
+        self.assertEqual(cache.get('^/a', 1), 'a' * 10)
+        self.assertEqual(cache.get('^/c', 1), 'c' * 10)
+        self.assertEqual(len(self.content_files()), 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,320 @@
+#! /usr/bin/env python3
+
+import hashlib
+import os
+import os.path as p
+import shutil
+import sqlite3
+import sys
+import tempfile
+import unittest
+import unittest.mock
+
+sys.path.insert(0, p.join(p.dirname(p.abspath(__file__)), '..', 'pythonx'))
+
+import svn.constants
+
+import sovereign.localstatus as localstatus
+import sovereign.wcdb as wcdb
+
+
+# The first two columns of svn status for what Scanner reports.
+_CODES = {
+    svn.constants.ST_MODIFIED: 'M ',
+    svn.constants.ST_ADDED: 'A ',
+    svn.constants.ST_DELETED: 'D ',
+    svn.constants.ST_REPLACED: 'R ',
+    svn.constants.ST_CONFLICTED: 'C ',
+    svn.constants.ST_UNVERSIONED: '? ',
+    svn.constants.ST_MISSING: '! ',
+    svn.constants.ST_OBSTRUCTED: '~ ',
+    svn.constants.ST_INCOMPLETE: '! ',
+    svn.constants.ST_EXTERNAL: 'X ',
+    # Scanner only reports normal for property changes.
+    svn.constants.ST_NORMAL: ' M',
+}
+
+_SCHEMA = '''
+CREATE TABLE repository (id INTEGER PRIMARY KEY, root TEXT, uuid TEXT);
+CREATE TABLE nodes (
+    local_relpath TEXT, parent_relpath TEXT, op_depth INTEGER,
+    repos_id INTEGER, repos_path TEXT, revision INTEGER,
+    presence TEXT, kind TEXT, checksum TEXT, properties BLOB,
+    translated_size INTEGER, last_mod_time INTEGER,
+    PRIMARY KEY (local_relpath, op_depth));
+CREATE TABLE actual_node (local_relpath TEXT PRIMARY KEY, properties BLOB, conflict_data BLOB);
+CREATE TABLE pristine (checksum TEXT PRIMARY KEY, compression INTEGER);
+CREATE TABLE externals (local_relpath TEXT PRIMARY KEY);
+CREATE TABLE work_queue (id INTEGER PRIMARY KEY, work BLOB);
+PRAGMA user_version = 31;
+'''
+
+# Seconds. Every file we write gets this mtime.
+_MTIME = 1500000000
+
+
+def _skel(props):
+    """Serialize properties like wc.db does.
+
+    _skel(dict(str, str)) -> bytes
+    """
+    atoms = []
+    for name, value in props.items():
+        for atom in (name.encode('utf8'), value.encode('utf8')):
+            atoms.append(b'%d %s' % (len(atom), atom))
+    return b'(' + b' '.join(atoms) + b')'
+
+def _checksum(text):
+    return '$sha1$' + hashlib.sha1(text.encode('utf8')).hexdigest()
+
+
+class WorkingCopy(object):
+    """A fake working copy: files on disk and a wc.db that describes them."""
+
+    def __init__(self, root_dir):
+        self.root_dir = root_dir
+        os.makedirs(p.join(root_dir, '.svn'))
+        self._db = sqlite3.connect(p.join(root_dir, '.svn', 'wc.db'))
+        self._db.executescript(_SCHEMA)
+        self._db.execute("INSERT INTO repository VALUES (1, 'https://svn.example.com/repo', 'uuid')")
+        self.node('', 'dir')
+
+    def close(self):
+        self._db.commit()
+        self._db.close()
+
+    def write(self, relpath, text):
+        filepath = p.join(self.root_dir, *relpath.split('/'))
+        os.makedirs(p.dirname(filepath), exist_ok=True)
+        with open(filepath, 'w') as f:
+            f.write(text)
+        os.utime(filepath, ns=(_MTIME * 10**9, _MTIME * 10**9))
+
+    def mkdir(self, relpath):
+        os.makedirs(p.join(self.root_dir, *relpath.split('/')), exist_ok=True)
+
+    def node(self, relpath, kind, text=None, op_depth=0, presence='normal', props=None, mtime=_MTIME):
+        """Add a NODES row. For files, text is what's in BASE."""
+        parent = relpath.rpartition('/')[0] if relpath else None
+        checksum = size = last_mod_time = None
+        if text is not None:
+            checksum = _checksum(text)
+            size = len(text.encode('utf8'))
+            last_mod_time = mtime * 10**6
+        repos_path = 'trunk/' + relpath if relpath else 'trunk'
+        self._db.execute(
+            'INSERT INTO nodes VALUES (?, ?, ?, 1, ?, 7, ?, ?, ?, ?, ?, ?)',
+            (relpath, parent, op_depth, repos_path if op_depth == 0 else None,
+             presence, kind, checksum, _skel(props) if props else None,
+             size, last_mod_time))
+
+    def actual(self, relpath, props=None, conflicted=False):
+        self._db.execute(
+            'INSERT INTO actual_node VALUES (?, ?, ?)',
+            (relpath, _skel(props) if props is not None else None, b'(conflict)' if conflicted else None))
+
+    def external(self, relpath):
+        self._db.execute('INSERT INTO externals VALUES (?)', (relpath,))
+
+    def pending_work(self):
+        self._db.execute("INSERT INTO work_queue VALUES (1, '')")
+
+
+class ScannerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.root_dir = tempfile.mkdtemp()
+        self.wc = WorkingCopy(self.root_dir)
+        patcher = unittest.mock.patch.object(localstatus, '_user_global_ignores', return_value='*.o')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        shutil.rmtree(self.root_dir)
+
+    def scan(self):
+        """Get svn status codes for each changed path and uncertain paths.
+
+        scan() -> dict(str, str), list(str)
+        """
+        self.wc.close()
+        entries, uncertain = localstatus.Scanner(self.root_dir, wcdb.WorkingCopyDb(self.root_dir)).scan()
+        def rel(path):
+            return p.relpath(path, self.root_dir).replace(os.sep, '/')
+        return {rel(e.name): _CODES[e.type] for e in entries}, [rel(path) for path in uncertain]
+
+    def versioned_file(self, relpath, text, **kwargs):
+        self.wc.write(relpath, text)
+        self.wc.node(relpath, 'file', text, **kwargs)
+
+    def test_clean(self):
+        self.versioned_file('a.txt', 'hello\n')
+        self.wc.mkdir('sub')
+        self.wc.node('sub', 'dir')
+        self.versioned_file('sub/b.txt', 'world\n')
+        self.assertEqual(self.scan(), ({}, []))
+
+    def test_mtime_and_size(self):
+        self.versioned_file('same.txt', 'hello\n')
+        # Same mtime and size: svn doesn't read the file, so neither do we.
+        self.versioned_file('sneaky.txt', 'hello\n')
+        self.wc.write('sneaky.txt', 'jello\n')
+        self.versioned_file('bigger.txt', 'hello\n')
+        self.wc.write('bigger.txt', 'hello world\n')
+        codes, uncertain = self.scan()
+        self.assertEqual(codes, {'bigger.txt': 'M '})
+        self.assertEqual(uncertain, [])
+
+    def test_checksum_suspects(self):
+        # Same size but touched since svn recorded it: compare checksums.
+        self.versioned_file('touched.txt', 'hello\n', mtime=_MTIME - 60)
+        self.versioned_file('edited.txt', 'hello\n', mtime=_MTIME - 60)
+        self.wc.write('edited.txt', 'jello\n')
+        # svn would compare the detranslated text, so we can't tell.
+        self.versioned_file('keywords.txt', '$Id$\n', mtime=_MTIME - 60, props={'svn:keywords': 'Id'})
+        self.assertEqual(self.scan(), ({'edited.txt': 'M '}, ['keywords.txt']))
+
+    def test_property_changes(self):
+        self.versioned_file('a.txt', 'hello\n', props={'svn:eol-style': 'native'})
+        self.wc.actual('a.txt', props={'svn:eol-style': 'LF'})
+        self.versioned_file('b.txt', 'hello\n')
+        self.wc.actual('b.txt', props={})
+        self.assertEqual(self.scan(), ({'a.txt': ' M'}, []))
+
+    def test_ignores(self):
+        self.wc.actual('', props={'svn:ignore': '*.tmp\n', 'svn:global-ignores': '*.bak'})
+        self.wc.mkdir('sub/deeper')
+        self.wc.node('sub', 'dir')
+        self.wc.node('sub/deeper', 'dir')
+        for relpath in ['a.o', 'a.tmp', 'a.bak', 'new.txt',
+                        'sub/b.o', 'sub/b.tmp', 'sub/b.bak',
+                        'sub/deeper/c.bak']:
+            self.wc.write(relpath, 'x')
+        codes, _ = self.scan()
+        # svn:ignore only applies to immediate children, but global-ignores
+        # and svn:global-ignores are inherited.
+        self.assertEqual(codes, {'new.txt': '? ', 'sub/b.tmp': '? '})
+
+    def test_unversioned_directory(self):
+        self.wc.write('new/a.txt', 'x')
+        codes, _ = self.scan()
+        # Like svn, we don't look inside.
+        self.assertEqual(codes, {'new': '? '})
+
+    def test_added_and_replaced(self):
+        self.wc.write('added.txt', 'x')
+        self.wc.node('added.txt', 'file', op_depth=1)
+        self.versioned_file('replaced.txt', 'hello\n')
+        self.wc.node('replaced.txt', 'file', op_depth=1)
+        self.assertEqual(self.scan(), ({'added.txt': 'A ', 'replaced.txt': 'R '}, []))
+
+    def test_deleted_subtree(self):
+        # svn rm --keep-local leaves the files behind.
+        self.wc.mkdir('gone')
+        self.wc.node('gone', 'dir')
+        self.versioned_file('gone/a.txt', 'hello\n')
+        self.wc.node('gone', 'dir', op_depth=1, presence='base-deleted')
+        self.wc.node('gone/a.txt', 'file', op_depth=1, presence='base-deleted')
+        # svn rm removes them.
+        self.wc.node('removed', 'dir')
+        self.wc.node('removed/b.txt', 'file', 'hello\n')
+        self.wc.node('removed', 'dir', op_depth=1, presence='base-deleted')
+        self.wc.node('removed/b.txt', 'file', op_depth=1, presence='base-deleted')
+        codes, _ = self.scan()
+        self.assertEqual(codes, {
+            'gone': 'D ',
+            'gone/a.txt': 'D ',
+            'removed': 'D ',
+            'removed/b.txt': 'D ',
+        })
+
+    def test_conflicts(self):
+        self.versioned_file('a.txt', 'hello\n')
+        self.wc.actual('a.txt', conflicted=True)
+        self.wc.mkdir('sub')
+        self.wc.node('sub', 'dir')
+        self.wc.actual('sub', conflicted=True)
+        self.versioned_file('sub/b.txt', 'hello\n')
+        self.wc.write('sub/b.txt', 'hello world\n')
+        codes, _ = self.scan()
+        # We still look inside conflicted directories.
+        self.assertEqual(codes, {'a.txt': 'C ', 'sub': 'C ', 'sub/b.txt': 'M '})
+
+    def test_missing_and_obstructed(self):
+        self.wc.node('missing.txt', 'file', 'hello\n')
+        self.wc.node('missing-dir', 'dir')
+        self.wc.node('missing-dir/a.txt', 'file', 'hello\n')
+        self.wc.mkdir('was-file')
+        self.wc.node('was-file', 'file', 'hello\n')
+        self.wc.write('was-dir', 'x')
+        self.wc.node('was-dir', 'dir')
+        # Not part of the working copy, so not missing either.
+        self.wc.node('excluded', 'dir', presence='excluded')
+        self.wc.node('not-present.txt', 'file', presence='not-present')
+        codes, _ = self.scan()
+        self.assertEqual(codes, {
+            'missing.txt': '! ',
+            'missing-dir': '! ',
+            'was-file': '~ ',
+            'was-dir': '~ ',
+        })
+
+    def test_incomplete(self):
+        self.wc.mkdir('sub')
+        self.wc.node('sub', 'dir', presence='incomplete')
+        self.assertEqual(self.scan(), ({'sub': '! '}, []))
+
+    def test_externals(self):
+        # A directory external is its own working copy.
+        self.wc.write('ext/a.txt', 'x')
+        self.wc.external('ext')
+        # A file external has a node in our wc.db.
+        self.versioned_file('file-ext.txt', 'hello\n')
+        self.wc.external('file-ext.txt')
+        self.assertEqual(self.scan(), ({'ext': 'X '}, ['ext', 'file-ext.txt']))
+
+    def test_needs_cleanup(self):
+        self.wc.pending_work()
+        with self.assertRaises(wcdb.WcDbError):
+            self.scan()
+
+
+class WorkingCopyDbTest(unittest.TestCase):
+
+    def setUp(self):
+        self.root_dir = tempfile.mkdtemp()
+        self.wc = WorkingCopy(self.root_dir)
+
+    def tearDown(self):
+        shutil.rmtree(self.root_dir)
+
+    def db(self):
+        self.wc.close()
+        return wcdb.WorkingCopyDb(self.root_dir)
+
+    def test_info(self):
+        self.wc.node('a.txt', 'file', 'hello\n')
+        info = self.db().info('a.txt')
+        self.assertEqual(info['url'], 'https://svn.example.com/repo/trunk/a.txt')
+        self.assertEqual(info['relative_url'], '^/trunk/a.txt')
+        self.assertEqual(info['entry_revision'], 7)
+
+    def test_info_added(self):
+        self.wc.node('new', 'dir', op_depth=1)
+        self.wc.node('new/a.txt', 'file', op_depth=1)
+        info = self.db().info('new/a.txt')
+        self.assertEqual(info['url'], 'https://svn.example.com/repo/trunk/new/a.txt')
+        self.assertEqual(info['entry_revision'], -1)
+
+    def test_info_unversioned(self):
+        with self.assertRaises(wcdb.WcDbError):
+            self.db().info('nothing.txt')
+
+    def test_unsupported_format(self):
+        self.wc._db.execute('PRAGMA user_version = 30')
+        with self.assertRaises(wcdb.WcDbError):
+            self.db()
+
+
+if __name__ == '__main__':
+    unittest.main()
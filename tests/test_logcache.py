@@ -0,0 +1,125 @@
+#! /usr/bin/env python3
+
+import datetime
+import os.path as p
+import shutil
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, p.join(p.dirname(p.abspath(__file__)), '..', 'pythonx'))
+
+import sovereign.logcache as logcache
+
+
+def _entry(revision):
+    return logcache.LogEntry(
+        revision=revision,
+        author='someone',
+        date=datetime.datetime(2020, 1, 1, tzinfo=datetime.timezone.utc),
+        changelist=[('M', '/trunk/hello')],
+        msg='change {}'.format(revision))
+
+
+class LogCacheStoreTest(unittest.TestCase):
+
+    def setUp(self):
+        self.cache_dir = tempfile.mkdtemp()
+        self.cache = logcache.LogCache(self.cache_dir, 'uuid')
+
+    def tearDown(self):
+        shutil.rmtree(self.cache_dir)
+
+    def store(self, oldest, newest, revisions):
+        self.cache.store('/trunk/hello', [_entry(r) for r in revisions], oldest, newest)
+
+    def coverage(self):
+        return self.cache.coverage('/trunk/hello')
+
+    def test_first_store(self):
+        self.assertIsNone(self.coverage())
+        self.store(1, 30, [30, 12, 1])
+        self.assertEqual(self.coverage(), logcache.Coverage(1, 30))
+
+    def test_adjacent_joins(self):
+        self.store(1, 30, [30, 1])
+        self.store(31, 70, [70, 40])
+        self.assertEqual(self.coverage(), logcache.Coverage(1, 70))
+        self.assertEqual([e.revision for e in self.cache.read('/trunk/hello', 70, 1)], [70, 40, 30, 1])
+
+    def test_overlap_joins(self):
+        self.store(10, 30, [30, 10])
+        self.store(1, 20, [12, 10, 1])
+        self.assertEqual(self.coverage(), logcache.Coverage(1, 30))
+        self.assertEqual([e.revision for e in self.cache.read('/trunk/hello', 30, 1, limit=2)], [30, 12])
+
+    def test_newer_gap_replaces(self):
+        self.store(1, 30, [30, 1])
+        self.store(60, 70, [70, 60])
+        self.assertEqual(self.coverage(), logcache.Coverage(60, 70))
+
+    def test_older_gap_kept_out(self):
+        self.store(60, 70, [70, 60])
+        self.store(1, 30, [30, 1])
+        self.assertEqual(self.coverage(), logcache.Coverage(60, 70))
+
+    def test_entries_round_trip(self):
+        self.store(1, 5, [5])
+        self.assertEqual(self.cache.read('/trunk/hello', 5, 1), [_entry(5)])
+
+
+class LogCacheSearchTest(unittest.TestCase):
+
+    def setUp(self):
+        self.cache_dir = tempfile.mkdtemp()
+        self.cache = logcache.LogCache(self.cache_dir, 'uuid')
+        entries = [
+            logcache.LogEntry(1, 'alice', None, [('A', '/trunk/src/parser.c')], 'Add the parser'),
+            logcache.LogEntry(2, 'bob', None, [('M', '/trunk/src/lexer.c')], 'Fix 100% CPU in the LEXER'),
+            logcache.LogEntry(3, 'Carol', None, [('M', '/trunk/README')], 'Document "quotes" and under_scores'),
+        ]
+        self.cache.store('/trunk', entries, 1, 3)
+
+    def tearDown(self):
+        shutil.rmtree(self.cache_dir)
+
+    def search(self, **kwargs):
+        return [e.revision for e in self.cache.search('/trunk', **kwargs)]
+
+    def test_index_and_like_agree(self):
+        if not self.cache.has_fts:
+            self.skipTest('sqlite has no fts5 trigram tokenizer')
+        queries = [
+            dict(grep='pars'),      # prefix
+            dict(grep='arse'),      # middle of a word
+            dict(grep='lexer'),     # case
+            dict(grep='he'),        # too short for trigrams
+            dict(grep='x'),
+            dict(grep='100%'),
+            dict(grep='under_'),
+            dict(grep='"quotes"'),
+            dict(grep='src/lex'),   # changed paths
+            dict(grep='the p'),     # across words
+            dict(author='aro'),
+            dict(author='b'),
+            dict(grep='fix', author='bob'),
+            dict(grep='fix', author='alice'),
+        ]
+        with_index = [self.search(**q) for q in queries]
+        self.cache.has_fts = False
+        self.assertEqual([self.search(**q) for q in queries], with_index)
+        self.assertEqual(with_index[:3], [[1], [1], [2]])
+
+    def test_old_index_replaced(self):
+        if not self.cache.has_fts:
+            self.skipTest('sqlite has no fts5 trigram tokenizer')
+        with self.cache._connection() as c:
+            c.execute('DROP TABLE log_fts')
+            c.execute('CREATE VIRTUAL TABLE log_fts USING fts5(msg, author, paths)')
+        cache = logcache.LogCache(self.cache_dir, 'uuid')
+        self.assertTrue(cache.has_fts)
+        self.assertEqual([e.revision for e in cache.search('/trunk', grep='arse')], [1])
+
+
+if __name__ == '__main__':
+    unittest.main()
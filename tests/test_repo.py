@@ -0,0 +1,161 @@
+#! /usr/bin/env python3
+
+import os.path as p
+import sys
+import unittest
+
+sys.path.insert(0, p.join(p.dirname(p.abspath(__file__)), '..', 'pythonx'))
+
+import sovereign.repo as repo
+
+
+class ApplyDiffToBlameTest(unittest.TestCase):
+
+    def test_no_hunks(self):
+        self.assertEqual(repo._apply_diff_to_blame(['a', 'b'], '', 'new'), ['a', 'b'])
+
+    def test_change_with_context(self):
+        diff = '\n'.join([
+            '--- a/f\t(revision 1)',
+            '+++ b/f\t(revision 2)',
+            '@@ -2,3 +2,3 @@',
+            ' 2',
+            '-3',
+            '+three',
+            ' 4',
+        ])
+        self.assertEqual(
+            repo._apply_diff_to_blame(['1', '2', '3', '4', '5'], diff, 'new'),
+            ['1', '2', 'new', '4', '5'])
+
+    def test_hunk_offsets(self):
+        # The second hunk's old line numbers still count from the original.
+        diff = '\n'.join([
+            '@@ -1,1 +1,2 @@',
+            ' 1',
+            '+added',
+            '@@ -4,2 +5,1 @@',
+            '-4',
+            ' 5',
+        ])
+        self.assertEqual(
+            repo._apply_diff_to_blame(['1', '2', '3', '4', '5', '6'], diff, 'new'),
+            ['1', 'new', '2', '3', '5', '6'])
+
+    def test_insert_into_empty_range(self):
+        # -2,0 means after line 2.
+        diff = '@@ -2,0 +3,2 @@\n+x\n+y\n'
+        self.assertEqual(
+            repo._apply_diff_to_blame(['1', '2', '3'], diff, 'new'),
+            ['1', '2', 'new', 'new', '3'])
+
+    def test_delete_everything(self):
+        diff = '@@ -1,2 +0,0 @@\n-1\n-2\n'
+        self.assertEqual(repo._apply_diff_to_blame(['1', '2'], diff, 'new'), [])
+
+    def test_no_newline_marker(self):
+        diff = '@@ -1 +1 @@\n-1\n\\ No newline at end of file\n+one\n\\ No newline at end of file\n'
+        self.assertEqual(repo._apply_diff_to_blame(['1'], diff, 'new'), ['new'])
+
+    def test_mismatch(self):
+        # Past the end of what we have.
+        self.assertIsNone(repo._apply_diff_to_blame(['1'], '@@ -3,1 +3,1 @@\n-3\n+x\n', 'new'))
+        # Truncated hunk.
+        self.assertIsNone(repo._apply_diff_to_blame(['1', '2'], '@@ -1,2 +1,2 @@\n 1', 'new'))
+
+
+def _log_entry(revision, msg_lines, diff_lines):
+    return [
+        repo._LOG_SEPARATOR,
+        'r{} | someone | 2020-01-01 12:00:00 +0000 (Wed, 01 Jan 2020) | {} line{}'.format(
+            revision, len(msg_lines), '' if len(msg_lines) == 1 else 's'),
+        '',
+    ] + msg_lines + [''] + diff_lines + ['']
+
+
+class SplitLogDiffTest(unittest.TestCase):
+
+    def test_revisions(self):
+        txt = '\n'.join(
+            _log_entry(5, ['second'], [
+                'Index: trunk/f',
+                '===================================================================',
+                '--- trunk/f\t(revision 4)',
+                '+++ trunk/f\t(revision 5)',
+                '@@ -1 +1 @@',
+                '-a',
+                '+b',
+            ])
+            + _log_entry(4, ['first'], [
+                'Index: trunk/f',
+                '===================================================================',
+                '--- trunk/f\t(nonexistent)',
+                '+++ trunk/f\t(revision 4)',
+                '@@ -0,0 +1 @@',
+                '+a',
+            ])
+            + [repo._LOG_SEPARATOR, ''])
+        diffs = repo._split_log_diff(txt)
+        self.assertEqual(sorted(diffs), [4, 5])
+        self.assertEqual(diffs[5], '--- trunk/f\t(revision 4)\n+++ trunk/f\t(revision 5)\n@@ -1 +1 @@\n-a\n+b\n')
+        self.assertTrue(diffs[4].endswith('+a\n'))
+
+    def test_multiple_files(self):
+        txt = '\n'.join(
+            _log_entry(7, ['two files'], [
+                'Index: trunk/f',
+                '===================================================================',
+                '--- trunk/f\t(revision 6)',
+                '+++ trunk/f\t(revision 7)',
+                '@@ -1 +1 @@',
+                '-a',
+                '+b',
+                'Index: trunk/g',
+                '===================================================================',
+                '--- trunk/g\t(revision 6)',
+                '+++ trunk/g\t(revision 7)',
+                '@@ -1 +1 @@',
+                '-c',
+                '+d',
+            ])
+            + [repo._LOG_SEPARATOR, ''])
+        diff = repo._split_log_diff(txt)[7]
+        self.assertTrue(diff.startswith('--- trunk/f'))
+        self.assertIn('Index: trunk/g\n', diff)
+        self.assertTrue(diff.endswith('-c\n+d\n'))
+
+    def test_tricky_messages_and_diffs(self):
+        # A message with an Index: line and a diff removing a separator line
+        # must not end the entry early.
+        txt = '\n'.join(
+            _log_entry(3, ['Index: not a diff', repo._LOG_SEPARATOR], [
+                'Index: trunk/f',
+                '===================================================================',
+                '--- trunk/f\t(revision 2)',
+                '+++ trunk/f\t(revision 3)',
+                '@@ -1,2 +1 @@',
+                '-' + '-' * 71,
+                ' a',
+            ])
+            + [repo._LOG_SEPARATOR, ''])
+        diffs = repo._split_log_diff(txt)
+        self.assertEqual(list(diffs), [3])
+        self.assertTrue(diffs[3].startswith('--- trunk/f'))
+        self.assertTrue(diffs[3].endswith('-' * 72 + '\n a\n'))
+
+    def test_no_diff(self):
+        txt = '\n'.join(_log_entry(2, ['props only'], []) + [repo._LOG_SEPARATOR, ''])
+        self.assertEqual(repo._split_log_diff(txt), {2: ''})
+
+
+class FormatBlameTest(unittest.TestCase):
+
+    def test_not_committed_fits(self):
+        lines = repo.Repo.format_blame(None, [(3, 'ab'), (None, ''), (12, 'bob')])
+        self.assertEqual(lines[1], 'Not committed')
+        self.assertEqual(len(set(len(line) for line in lines)), 1)
+        self.assertTrue(lines[0].startswith('r3  ab'))
+
+
+if __name__ == '__main__':
+    unittest.main()
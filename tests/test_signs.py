@@ -0,0 +1,76 @@
+#! /usr/bin/env python3
+
+import os.path as p
+import random
+import sys
+import unittest
+
+sys.path.insert(0, p.join(p.dirname(p.abspath(__file__)), '..', 'pythonx'))
+
+import sovereign.signs as signs
+
+
+def _edit(rng, lines, alphabet):
+    """Replace a few lines somewhere with a few random ones."""
+    lines = list(lines)
+    i = rng.randint(0, len(lines))
+    j = rng.randint(i, min(len(lines), i + 3))
+    lines[i:j] = [rng.choice(alphabet) for _ in range(rng.randint(0, 3))]
+    return lines
+
+
+class SignTrackerTest(unittest.TestCase):
+
+    def assertValidBlocks(self, tracker, base, lines):
+        a_end = b_end = 0
+        for a, b, size in tracker._blocks:
+            self.assertGreaterEqual(a, a_end)
+            self.assertGreaterEqual(b, b_end)
+            self.assertEqual(base[a:a+size], lines[b:b+size])
+            a_end, b_end = a + size, b + size
+
+    def test_unchanged(self):
+        t = signs.SignTracker(['a', 'b'])
+        self.assertEqual(t.update(['a', 'b']), {})
+
+    def test_kinds(self):
+        t = signs.SignTracker(['a', 'b', 'c', 'd'])
+        self.assertEqual(t.update(['a', 'x', 'c', 'd', 'e']), {2: signs.CHANGED, 5: signs.ADDED})
+        self.assertEqual(t.update(['b', 'c', 'd']), {1: signs.REMOVED_FIRST})
+        self.assertEqual(t.update(['a', 'b', 'd']), {2: signs.REMOVED})
+
+    def test_undo_realigns(self):
+        # The insert first matches the wrong 'd', so undoing it has to move
+        # the runs next to the edit.
+        t = signs.SignTracker(['d', 'd'])
+        t.update(['d', 'd'])
+        t.update(['a', 'd'])
+        t.update(['a', 'd', 'd'])
+        self.assertEqual(t.update(['d', 'd']), {})
+
+    def test_single_edit_matches_full(self):
+        rng = random.Random(3)
+        for _ in range(2000):
+            base = [rng.choice('abcd') for _ in range(rng.randint(0, 20))]
+            lines = _edit(rng, base, 'abcd')
+            t = signs.SignTracker(base)
+            t.update(base)
+            self.assertEqual(t.update(lines), signs.SignTracker(base).update(lines))
+
+    def test_edit_sequences(self):
+        rng = random.Random(1)
+        for _ in range(1000):
+            base = [rng.choice('abcd') for _ in range(rng.randint(0, 10))]
+            t = signs.SignTracker(base)
+            lines = base
+            t.update(lines)
+            for _ in range(6):
+                lines = _edit(rng, lines, 'abcd')
+                t.update(lines)
+                self.assertValidBlocks(t, base, lines)
+            # Going back to BASE always clears everything.
+            self.assertEqual(t.update(list(base)), {})
+
+
+if __name__ == '__main__':
+    unittest.main()
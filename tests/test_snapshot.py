@@ -0,0 +1,47 @@
+#! /usr/bin/env python3
+
+import os.path as p
+import sys
+import unittest
+
+sys.path.insert(0, p.join(p.dirname(p.abspath(__file__)), '..', 'pythonx'))
+
+import svn.constants
+
+import sovereign.snapshot as snapshot
+
+
+M = svn.constants.ST_MODIFIED
+A = svn.constants.ST_ADDED
+U = svn.constants.ST_UNVERSIONED
+
+
+class StatusSnapshotTest(unittest.TestCase):
+
+    def test_entries(self):
+        snap = snapshot.StatusSnapshot([('a', M), ('b', A)])
+        self.assertEqual(list(snap), [('a', M), ('b', A)])
+        self.assertEqual(len(snap), 2)
+        self.assertIn('a', snap)
+        self.assertEqual(snap.get('b'), A)
+        self.assertIsNone(snap.get('c'))
+
+    def test_extend_replaces_code(self):
+        snap = snapshot.StatusSnapshot([('a', M)])
+        snap.extend([('a', A), ('b', U)])
+        self.assertEqual(list(snap), [('a', A), ('b', U)])
+
+    def test_replace(self):
+        snap = snapshot.StatusSnapshot([('a', M), ('b', M), ('c', M)])
+        # b was reverted, c changed, d is new.
+        new = snap.replace({'b', 'c', 'd'}, [('c', A), ('d', U)])
+        self.assertEqual(list(new), [('a', M), ('c', A), ('d', U)])
+        # The original doesn't change.
+        self.assertEqual(len(snap), 3)
+
+    def test_raw_name(self):
+        self.assertEqual(snapshot.raw_name(M), 'modified')
+
+
+if __name__ == '__main__':
+    unittest.main()